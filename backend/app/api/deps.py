@@ -1,19 +1,36 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 from app.core.database import get_db
 from app.core.config import settings
+from app.core.security import verify_token
 from app.models.user import User
+from app.core.auth_cache import AuthUser, auth_cache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login", auto_error=False)
 
 
+async def load_auth_user(db: AsyncSession, username: str) -> Optional[AuthUser]:
+    """Resolve a token subject to the fields needed for authorization, via auth_cache."""
+    user = auth_cache.get(username)
+    if user is not None:
+        return user
+    row = (await db.execute(
+        select(User.id, User.username, User.role, User.is_active).where(User.username == username)
+    )).first()
+    if row is None:
+        return None
+    user = AuthUser(id=row.id, username=row.username, role=row.role, is_active=row.is_active)
+    auth_cache.put(username, user)
+    return user
+
+
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-) -> User:
+    db: AsyncSession = Depends(get_db)
+) -> AuthUser:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -23,15 +40,14 @@ async def get_current_user(
     if token is None:
         raise credentials_exception
     
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-    except JWTError:
+    payload = verify_token(token)
+    if payload is None:
+        raise credentials_exception
+    username: str = payload.get("sub")
+    if username is None:
         raise credentials_exception
     
-    user = db.query(User).filter(User.username == username).first()
+    user = await load_auth_user(db, username)
     if user is None:
         raise credentials_exception
     
@@ -39,16 +55,16 @@ async def get_current_user(
 
 
 async def get_current_active_user(
-    current_user: User = Depends(get_current_user)
-) -> User:
+    current_user: AuthUser = Depends(get_current_user)
+) -> AuthUser:
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
 
 async def get_current_admin_user(
-    current_user: User = Depends(get_current_active_user)
-) -> User:
+    current_user: AuthUser = Depends(get_current_active_user)
+) -> AuthUser:
     if current_user.role.value != "admin":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -59,8 +75,8 @@ async def get_current_admin_user(
 
 async def get_current_user_optional(
     token: Optional[str] = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-) -> Optional[User]:
+    db: AsyncSession = Depends(get_db)
+) -> Optional[AuthUser]:
     """
     Get current user if token is provided, otherwise return None.
     Useful for endpoints that work both for authenticated and anonymous users.
@@ -68,13 +84,11 @@ async def get_current_user_optional(
     if token is None:
         return None
     
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            return None
-    except JWTError:
+    payload = verify_token(token)
+    if payload is None:
+        return None
+    username: str = payload.get("sub")
+    if username is None:
         return None
     
-    user = db.query(User).filter(User.username == username).first()
-    return user
\ No newline at end of file
+    return await load_auth_user(db, username)
\ No newline at end of file
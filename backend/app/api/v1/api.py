@@ -1,5 +1,5 @@
 from fastapi import APIRouter
-from app.api.v1.endpoints import auth, users, images, categories, tags, models, admin
+from app.api.v1.endpoints import auth, users, images, categories, tags, models, parameters, admin, files
 
 api_router = APIRouter()
 
@@ -9,4 +9,6 @@ api_router.include_router(images.router, prefix="/images", tags=["images"])
 api_router.include_router(categories.router, prefix="/categories", tags=["categories"])
 api_router.include_router(tags.router, prefix="/tags", tags=["tags"])
 api_router.include_router(models.router, prefix="/models", tags=["models"])
-api_router.include_router(admin.router, prefix="/admin", tags=["admin"])
\ No newline at end of file
+api_router.include_router(parameters.router, prefix="/parameters", tags=["parameters"])
+api_router.include_router(admin.router, prefix="/admin", tags=["admin"])
+api_router.include_router(files.router, prefix="/files", tags=["files"])
\ No newline at end of file
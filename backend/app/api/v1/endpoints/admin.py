@@ -1,41 +1,58 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, case, or_, and_
+from sqlalchemy import func, case, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Dict, Any, List, Optional
 from app.core.database import get_db
 from app.api.deps import get_current_admin_user
-from app.models import User, Image, Category, Tag, Model, VersionHistory, KeyValueParameter
-from app.services.alist_service import alist_service
+from app.models import User, Image, Category, Tag, Model, CustomModel, CustomCategory
+from app.models.tag import image_tags
+from app.services.storage import get_storage
+from app.services.bulk_delete import delete_leaf_images
+from app.services.tag_links import attach_tags, detach_tags
+from app.services.parameters import filter_by_parameters
+from app.services.tag_index import tag_index
+from app.services.custom_labels import label_filter
+from app.services.reconcile import reconcile, is_running as reconcile_is_running
 from app.core.config_store import config_store
+from app.core.auth_cache import auth_cache
+from app.core.security import token_cache
+from app.core.metrics import metrics
 from pydantic import BaseModel
-from app.schemas.image import ImageListResponse
-import json
+from app.schemas.image import ImageListResponse, ImageResponse
+from app.api.v1.endpoints.images import IMAGE_RELATIONS
+from app.core.tracing import TimedRoute
+from dataclasses import asdict
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
 
 
 @router.get("/dashboard")
 async def admin_dashboard(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_admin_user)
 ):
     # Get statistics
     stats = {
-        "users": db.query(User).count(),
-        "images": db.query(Image).count(),
-        "categories": db.query(Category).count(),
-        "tags": db.query(Tag).count(),
-        "models": db.query(Model).count(),
+        "users": await db.scalar(select(func.count(User.id))),
+        "images": await db.scalar(select(func.count(Image.id))),
+        "categories": await db.scalar(select(func.count(Category.id))),
+        "tags": await db.scalar(select(func.count(Tag.id))),
+        "models": await db.scalar(select(func.count(Model.id))),
     }
     
     # Get recent images
-    recent_images = db.query(Image).order_by(Image.created_at.desc()).limit(5).all()
+    recent_images = [
+        ImageResponse.model_validate(image)
+        for image in (await db.scalars(
+            select(Image).options(*IMAGE_RELATIONS).order_by(Image.created_at.desc()).limit(5)
+        )).all()
+    ]
     
     # Get user statistics
-    user_stats = db.query(
+    user_stats = (await db.execute(select(
         func.count(User.id).label('total'),
         func.sum(case((User.role == 'admin', 1), else_=0)).label('admins')
-    ).first()
+    ))).first()
     
     return {
         "stats": stats,
@@ -60,6 +77,9 @@ async def get_settings(
     has_token = bool((stored.get("token") or "").strip())
     has_password = isinstance(stored.get("password"), str) and stored.get("password") != ""
     return {
+        "storage": {
+            "backend": get_storage().name
+        },
         "alist": {
             "url": url,
             "username": username,
@@ -103,6 +123,8 @@ async def update_alist_settings(
         config_store.update_section("alist", update_values)
 
     # Refresh running alist_service values from the store
+    from app.services.alist_service import alist_service
+
     stored = config_store.get_section("alist")
     alist_service.refresh_from_store()
 
@@ -113,28 +135,71 @@ async def update_alist_settings(
 async def test_alist_connection(
     current_user = Depends(get_current_admin_user)
 ):
+    from app.services.alist_service import alist_service
+
     try:
         is_connected = await alist_service.test_connection()
         return {
             "success": is_connected,
-            "message": "Connection successful" if is_connected else "Connection failed"
+            "message": "Connection successful" if is_connected else "Connection failed",
+            "resilience": alist_service.health()
         }
     except Exception as e:
         return {
             "success": False,
-            "message": str(e)
+            "message": str(e),
+            "resilience": alist_service.health()
         }
 
 
+@router.post("/storage/reconcile")
+async def reconcile_storage(
+    limit: Optional[int] = None,
+    delete_orphans: bool = False,
+    delete_missing: bool = False,
+    grace_seconds: int = 3600,
+    reset: bool = False,
+    force: bool = False,
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(get_current_admin_user)
+):
+    """Compare storage with the images table; resumes from the saved checkpoint.
+
+    With ``limit`` only that many files plus rows are examined, and the next call
+    continues where this one stopped. Deleting missing rows is refused when most of
+    the rows seen have no file, unless ``force`` is set.
+    """
+    if reconcile_is_running():
+        raise HTTPException(status_code=409, detail="A storage reconciliation is already running")
+    report = await reconcile(
+        db,
+        get_storage(),
+        limit=limit,
+        delete_orphans=delete_orphans,
+        delete_missing=delete_missing,
+        grace_seconds=grace_seconds,
+        reset=reset,
+        force=force,
+    )
+    return asdict(report)
+
+
+@router.get("/metrics")
+async def get_metrics(
+    current_user = Depends(get_current_admin_user)
+):
+    return metrics.snapshot()
+
+
 @router.get("/users")
 async def get_users(
     skip: int = 0,
     limit: int = 50,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_admin_user)
 ):
-    users = db.query(User).offset(skip).limit(limit).all()
-    total = db.query(User).count()
+    users = (await db.scalars(select(User).offset(skip).limit(limit))).all()
+    total = await db.scalar(select(func.count(User.id)))
     
     return {
         "users": users,
@@ -148,10 +213,10 @@ async def get_users(
 async def update_user_role(
     user_id: int,
     role: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_admin_user)
 ):
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -159,7 +224,8 @@ async def update_user_role(
         raise HTTPException(status_code=400, detail="Invalid role")
     
     user.role = role
-    db.commit()
+    await db.commit()
+    auth_cache.invalidate()
     
     return {"message": f"User role updated to {role}"}
 
@@ -168,10 +234,10 @@ async def update_user_role(
 async def update_user_status(
     user_id: int,
     is_active: bool,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_admin_user)
 ):
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -179,7 +245,10 @@ async def update_user_status(
         raise HTTPException(status_code=400, detail="Cannot deactivate yourself")
     
     user.is_active = is_active
-    db.commit()
+    await db.commit()
+    auth_cache.invalidate()
+    if not is_active:
+        token_cache.revoke_subject(user.username)
     
     return {"message": f"User {'activated' if is_active else 'deactivated'}"}
 
@@ -204,6 +273,12 @@ class BulkTagImagesPayload(BaseModel):
     image_ids: List[int]
 
 
+class BulkImageTagsPayload(BaseModel):
+    image_ids: List[int]
+    add_tag_ids: List[int] = []
+    remove_tag_ids: List[int] = []
+
+
 @router.get("/images", response_model=ImageListResponse)
 async def admin_list_images(
     skip: int = 0,
@@ -223,15 +298,10 @@ async def admin_list_images(
     # Parameter filters
     param_keys: Optional[str] = None,
     param_filters: Optional[str] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_admin_user)
 ):
-    query = db.query(Image).options(
-        joinedload(Image.model),
-        joinedload(Image.category),
-        joinedload(Image.tags),
-        joinedload(Image.parameters)
-    )
+    query = select(Image)
 
     if search:
         query = query.filter(
@@ -253,11 +323,11 @@ async def admin_list_images(
             pass
     # Custom category (single and multi)
     if custom_category:
-        query = query.filter(Image.custom_category == custom_category)
+        query = query.filter(label_filter(Image.custom_category_id, CustomCategory, [custom_category]))
     if custom_categories:
         custom_list = [x.strip() for x in custom_categories.split(',') if x.strip()]
         if custom_list:
-            query = query.filter(Image.custom_category.in_(custom_list))
+            query = query.filter(label_filter(Image.custom_category_id, CustomCategory, custom_list))
 
     # Model filter (single and multi)
     if model_id:
@@ -271,11 +341,11 @@ async def admin_list_images(
             pass
     # Custom model (single and multi)
     if custom_model:
-        query = query.filter(Image.custom_model == custom_model)
+        query = query.filter(label_filter(Image.custom_model_id, CustomModel, [custom_model]))
     if custom_models:
         custom_list = [x.strip() for x in custom_models.split(',') if x.strip()]
         if custom_list:
-            query = query.filter(Image.custom_model.in_(custom_list))
+            query = query.filter(label_filter(Image.custom_model_id, CustomModel, custom_list))
 
     if tag_ids:
         from app.models.tag import Tag as TagModel
@@ -284,28 +354,12 @@ async def admin_list_images(
             query = query.join(Image.tags).filter(TagModel.id.in_(tag_id_list)).distinct()
 
     # Parameter filters
-    if param_keys:
-        keys = [k.strip() for k in param_keys.split(',') if k.strip()]
-        for k in keys:
-            query = query.filter(Image.parameters.any(KeyValueParameter.key == k))
-    if param_filters:
-        try:
-            kv = json.loads(param_filters)
-            if isinstance(kv, dict):
-                for k, v in kv.items():
-                    if v is None or str(v).strip() == "":
-                        query = query.filter(Image.parameters.any(KeyValueParameter.key == k))
-                    else:
-                        query = query.filter(
-                            Image.parameters.any(
-                                and_(KeyValueParameter.key == k, KeyValueParameter.value == str(v))
-                            )
-                        )
-        except Exception:
-            pass
+    query = filter_by_parameters(query, param_keys, param_filters)
 
-    total = query.count()
-    images = query.order_by(Image.created_at.desc()).offset(skip).limit(limit).all()
+    total = await db.scalar(select(func.count()).select_from(query.subquery()))
+    images = (await db.scalars(
+        query.options(*IMAGE_RELATIONS).order_by(Image.created_at.desc()).offset(skip).limit(limit)
+    )).all()
 
     return ImageListResponse(items=images, total=total, page=(skip // limit) + 1, size=limit)
 
@@ -316,7 +370,7 @@ async def admin_list_images_by_category(
     skip: int = 0,
     limit: int = 20,
     search: Optional[str] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_admin_user)
 ):
     return await admin_list_images(
@@ -337,7 +391,7 @@ async def admin_list_images_by_model(
     skip: int = 0,
     limit: int = 20,
     search: Optional[str] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_admin_user)
 ):
     return await admin_list_images(
@@ -358,7 +412,7 @@ async def admin_list_images_by_tag(
     skip: int = 0,
     limit: int = 20,
     search: Optional[str] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_admin_user)
 ):
     return await admin_list_images(
@@ -376,44 +430,50 @@ async def admin_list_images_by_tag(
 @router.post("/images/bulk/reassign-category")
 async def admin_bulk_reassign_category(
     payload: BulkReassignCategoryPayload,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_admin_user)
 ):
-    source = db.query(Category).filter(Category.id == payload.source_category_id).first()
-    target = db.query(Category).filter(Category.id == payload.target_category_id).first()
+    source = await db.get(Category, payload.source_category_id)
+    target = await db.get(Category, payload.target_category_id)
     if not source:
         raise HTTPException(status_code=404, detail="Source category not found")
     if not target:
         raise HTTPException(status_code=404, detail="Target category not found")
 
-    query = db.query(Image).filter(Image.category_id == payload.source_category_id)
+    stmt = update(Image).where(Image.category_id == payload.source_category_id)
     if payload.image_ids:
-        query = query.filter(Image.id.in_(payload.image_ids))
+        stmt = stmt.where(Image.id.in_(payload.image_ids))
 
-    updated_count = query.update({"category_id": payload.target_category_id}, synchronize_session=False)
-    db.commit()
+    result = await db.execute(
+        stmt.values(category_id=payload.target_category_id).execution_options(synchronize_session=False)
+    )
+    updated_count = result.rowcount
+    await db.commit()
     return {"updated": int(updated_count)}
 
 
 @router.post("/images/bulk/reassign-model")
 async def admin_bulk_reassign_model(
     payload: BulkReassignModelPayload,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_admin_user)
 ):
-    source = db.query(Model).filter(Model.id == payload.source_model_id).first()
-    target = db.query(Model).filter(Model.id == payload.target_model_id).first()
+    source = await db.get(Model, payload.source_model_id)
+    target = await db.get(Model, payload.target_model_id)
     if not source:
         raise HTTPException(status_code=404, detail="Source model not found")
     if not target:
         raise HTTPException(status_code=404, detail="Target model not found")
 
-    query = db.query(Image).filter(Image.model_id == payload.source_model_id)
+    stmt = update(Image).where(Image.model_id == payload.source_model_id)
     if payload.image_ids:
-        query = query.filter(Image.id.in_(payload.image_ids))
+        stmt = stmt.where(Image.id.in_(payload.image_ids))
 
-    updated_count = query.update({"model_id": payload.target_model_id}, synchronize_session=False)
-    db.commit()
+    result = await db.execute(
+        stmt.values(model_id=payload.target_model_id).execution_options(synchronize_session=False)
+    )
+    updated_count = result.rowcount
+    await db.commit()
     return {"updated": int(updated_count)}
 
 
@@ -421,153 +481,116 @@ async def admin_bulk_reassign_model(
 async def admin_attach_images_to_tag(
     tag_id: int,
     payload: BulkTagImagesPayload,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_admin_user)
 ):
-    tag = db.query(Tag).filter(Tag.id == tag_id).first()
-    if not tag:
+    if await db.get(Tag, tag_id) is None:
         raise HTTPException(status_code=404, detail="Tag not found")
 
-    images = db.query(Image).filter(Image.id.in_(payload.image_ids)).all()
-    if not images:
-        return {"attached": 0}
-
-    attached = 0
-    existing_ids = {img.id for img in tag.images}
-    for img in images:
-        if img.id not in existing_ids:
-            tag.images.append(img)
-            attached += 1
-    db.commit()
-    return {"attached": attached}
+    attached = await attach_tags(db, [tag_id], payload.image_ids)
+    await db.commit()
+    tag_index.adjust_count(tag_id, attached[tag_id])
+    return {"attached": attached[tag_id]}
 
 
 @router.post("/tags/{tag_id}/detach-images")
 async def admin_detach_images_from_tag(
     tag_id: int,
     payload: BulkTagImagesPayload,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_admin_user)
 ):
-    tag = db.query(Tag).filter(Tag.id == tag_id).first()
-    if not tag:
+    if await db.get(Tag, tag_id) is None:
         raise HTTPException(status_code=404, detail="Tag not found")
 
-    images = db.query(Image).filter(Image.id.in_(payload.image_ids)).all()
-    if not images:
-        return {"detached": 0}
+    detached = await detach_tags(db, [tag_id], payload.image_ids)
+    await db.commit()
+    tag_index.adjust_count(tag_id, -detached[tag_id])
+    return {"detached": detached[tag_id]}
 
-    detached = 0
-    for img in images:
-        if img in tag.images:
-            tag.images.remove(img)
-            detached += 1
-    db.commit()
-    return {"detached": detached}
+
+@router.post("/images/bulk/tags")
+async def admin_bulk_update_image_tags(
+    payload: BulkImageTagsPayload,
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(get_current_admin_user)
+):
+    """Attach ``add_tag_ids`` to and detach ``remove_tag_ids`` from all of ``image_ids``
+    in one transaction; returns the links added and removed per tag."""
+    tag_ids = set(payload.add_tag_ids) | set(payload.remove_tag_ids)
+    found = set((await db.scalars(select(Tag.id).where(Tag.id.in_(tag_ids)))).all())
+    if found != tag_ids:
+        raise HTTPException(status_code=404, detail=f"Tags not found: {sorted(tag_ids - found)}")
+
+    detached = await detach_tags(db, payload.remove_tag_ids, payload.image_ids)
+    attached = await attach_tags(db, payload.add_tag_ids, payload.image_ids)
+    await db.commit()
+    for tag_id in tag_ids:
+        tag_index.adjust_count(tag_id, attached.get(tag_id, 0) - detached.get(tag_id, 0))
+
+    return {
+        "attached": sum(attached.values()),
+        "detached": sum(detached.values()),
+        "tags": [
+            {"tag_id": tag_id, "attached": attached.get(tag_id, 0), "detached": detached.get(tag_id, 0)}
+            for tag_id in sorted(tag_ids)
+        ],
+    }
+
+
+async def _delete_images(db: AsyncSession, selection, label: str, delete_from_alist: bool) -> Dict[str, int]:
+    deleted, skipped_with_children, file_paths = await delete_leaf_images(db, selection, label=label)
+    if delete_from_alist and file_paths:
+        try:
+            await get_storage().delete_many(file_paths)
+        except Exception:
+            pass
+    return {"deleted": deleted, "skipped_with_children": skipped_with_children}
 
 
 @router.delete("/categories/{category_id}/images")
 async def admin_delete_images_by_category(
     category_id: int,
     delete_from_alist: bool = False,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_admin_user)
 ):
-    images = db.query(Image).filter(Image.category_id == category_id).all()
-
-    deleted = 0
-    skipped_with_children = 0
-    for image in images:
-        has_children = db.query(Image).filter(Image.parent_image_id == image.id).count() > 0
-        if has_children:
-            skipped_with_children += 1
-            continue
-        if delete_from_alist:
-            try:
-                await alist_service.delete_file(image.file_path)
-            except Exception:
-                pass
-        db.query(VersionHistory).filter(
-            or_(
-                VersionHistory.parent_image_id == image.id,
-                VersionHistory.child_image_id == image.id
-            )
-        ).delete()
-        db.delete(image)
-        deleted += 1
-
-    db.commit()
-    return {"deleted": deleted, "skipped_with_children": skipped_with_children}
+    return await _delete_images(
+        db,
+        select(Image.id).where(Image.category_id == category_id),
+        f"category:{category_id}",
+        delete_from_alist,
+    )
 
 
 @router.delete("/models/{model_id}/images")
 async def admin_delete_images_by_model(
     model_id: int,
     delete_from_alist: bool = False,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_admin_user)
 ):
-    images = db.query(Image).filter(Image.model_id == model_id).all()
-
-    deleted = 0
-    skipped_with_children = 0
-    for image in images:
-        has_children = db.query(Image).filter(Image.parent_image_id == image.id).count() > 0
-        if has_children:
-            skipped_with_children += 1
-            continue
-        if delete_from_alist:
-            try:
-                await alist_service.delete_file(image.file_path)
-            except Exception:
-                pass
-        db.query(VersionHistory).filter(
-            or_(
-                VersionHistory.parent_image_id == image.id,
-                VersionHistory.child_image_id == image.id
-            )
-        ).delete()
-        db.delete(image)
-        deleted += 1
-
-    db.commit()
-    return {"deleted": deleted, "skipped_with_children": skipped_with_children}
+    return await _delete_images(
+        db,
+        select(Image.id).where(Image.model_id == model_id),
+        f"model:{model_id}",
+        delete_from_alist,
+    )
 
 
 @router.delete("/tags/{tag_id}/images")
 async def admin_delete_images_by_tag(
     tag_id: int,
     delete_from_alist: bool = False,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_admin_user)
 ):
-    from app.models.tag import Tag as TagModel
-    tag = db.query(TagModel).filter(TagModel.id == tag_id).first()
-    if not tag:
+    if await db.get(Tag, tag_id) is None:
         raise HTTPException(status_code=404, detail="Tag not found")
 
-    images = list(tag.images)
-
-    deleted = 0
-    skipped_with_children = 0
-    for image in images:
-        has_children = db.query(Image).filter(Image.parent_image_id == image.id).count() > 0
-        if has_children:
-            skipped_with_children += 1
-            continue
-        if delete_from_alist:
-            try:
-                await alist_service.delete_file(image.file_path)
-            except Exception:
-                pass
-        db.query(VersionHistory).filter(
-            or_(
-                VersionHistory.parent_image_id == image.id,
-                VersionHistory.child_image_id == image.id
-            )
-        ).delete()
-        db.delete(image)
-        deleted += 1
-
-    db.commit()
-    return {"deleted": deleted, "skipped_with_children": skipped_with_children}
\ No newline at end of file
+    return await _delete_images(
+        db,
+        select(image_tags.c.image_id).where(image_tags.c.tag_id == tag_id),
+        f"tag:{tag_id}",
+        delete_from_alist,
+    )
\ No newline at end of file
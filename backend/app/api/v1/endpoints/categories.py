@@ -1,13 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
-from app.core.database import get_db
+from app.core.database import get_db, get_read_db
 from app.api.deps import get_current_active_user, get_current_admin_user
 from app.models.category import Category
 from app.schemas.category import CategoryCreate, CategoryUpdate, CategoryResponse
+from app.core.tracing import TimedRoute
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
 
 
 @router.get("/", response_model=List[CategoryResponse])
@@ -15,13 +16,13 @@ async def get_categories(
     skip: int = 0,
     limit: int = 100,
     include_count: bool = False,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     if include_count:
         from app.models.image import Image
         # Count images where this category is used via category_id
-        results = (
-            db.query(
+        results = (await db.execute(
+            select(
                 Category,
                 func.count(Image.id).label("image_count")
             )
@@ -29,8 +30,7 @@ async def get_categories(
             .group_by(Category.id)
             .offset(skip)
             .limit(limit)
-            .all()
-        )
+        )).all()
         enriched: List[CategoryResponse] = []
         for cat, count in results:
             cat_schema = CategoryResponse.model_validate(cat)
@@ -38,7 +38,7 @@ async def get_categories(
             enriched.append(cat_schema)
         return enriched
     else:
-        categories = db.query(Category).offset(skip).limit(limit).all()
+        categories = (await db.scalars(select(Category).offset(skip).limit(limit))).all()
         return categories
 
 
@@ -46,26 +46,25 @@ async def get_categories(
 async def get_custom_categories(
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Return distinct custom categories from images (free-text categories users entered), with counts.
-    These are not in the `categories` table but exist as `Image.custom_category` values.
+    These are not in the `categories` table; names are interned in `custom_categories` and referenced by `Image.custom_category_id`.
     """
-    from app.models.image import Image
+    from app.models import Image, CustomCategory
 
     # Query distinct custom_category with counts
-    rows = (
-        db.query(
-            Image.custom_category.label("name"),
+    rows = (await db.execute(
+        select(
+            CustomCategory.name,
             func.count(Image.id).label("image_count")
         )
-        .filter(Image.custom_category.isnot(None))
-        .group_by(Image.custom_category)
+        .join(Image, Image.custom_category_id == CustomCategory.id)
+        .group_by(CustomCategory.id, CustomCategory.name)
         .order_by(func.count(Image.id).desc())
         .offset(skip)
         .limit(limit)
-        .all()
-    )
+    )).all()
 
     # Return a simple list of dicts: { name, image_count }
     return [
@@ -77,11 +76,11 @@ async def get_custom_categories(
 @router.post("/", response_model=CategoryResponse)
 async def create_category(
     category: CategoryCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_admin_user)
 ):
     # Check if category already exists
-    existing = db.query(Category).filter(Category.name == category.name).first()
+    existing = (await db.scalars(select(Category).where(Category.name == category.name))).first()
     if existing:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -90,8 +89,8 @@ async def create_category(
     
     db_category = Category(**category.model_dump())
     db.add(db_category)
-    db.commit()
-    db.refresh(db_category)
+    await db.commit()
+    await db.refresh(db_category)
     
     return db_category
 
@@ -100,10 +99,10 @@ async def create_category(
 async def update_category(
     category_id: int,
     category_update: CategoryUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_admin_user)
 ):
-    category = db.query(Category).filter(Category.id == category_id).first()
+    category = await db.get(Category, category_id)
     if not category:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -112,7 +111,7 @@ async def update_category(
     
     # Check if new name conflicts with existing category
     if category_update.name and category_update.name != category.name:
-        existing = db.query(Category).filter(Category.name == category_update.name).first()
+        existing = (await db.scalars(select(Category).where(Category.name == category_update.name))).first()
         if existing:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -123,8 +122,8 @@ async def update_category(
     for field, value in update_data.items():
         setattr(category, field, value)
     
-    db.commit()
-    db.refresh(category)
+    await db.commit()
+    await db.refresh(category)
     
     return category
 
@@ -133,10 +132,10 @@ async def update_category(
 async def delete_category(
     category_id: int,
     merge_into_id: int = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_admin_user)
 ):
-    category = db.query(Category).filter(Category.id == category_id).first()
+    category = await db.get(Category, category_id)
     if not category:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -145,7 +144,7 @@ async def delete_category(
     
     # If merge_into_id is provided, merge images into that category
     if merge_into_id:
-        target_category = db.query(Category).filter(Category.id == merge_into_id).first()
+        target_category = await db.get(Category, merge_into_id)
         if not target_category:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -154,13 +153,13 @@ async def delete_category(
         
         # Update all images in this category to the target category
         from app.models.image import Image
-        db.query(Image).filter(Image.category_id == category_id).update(
-            {"category_id": merge_into_id}
+        await db.execute(
+            update(Image).where(Image.category_id == category_id).values(category_id=merge_into_id)
         )
-        db.commit()
+        await db.commit()
     
     # Delete the category
-    db.delete(category)
-    db.commit()
+    await db.delete(category)
+    await db.commit()
     
     return {"message": "Category deleted successfully"}
\ No newline at end of file
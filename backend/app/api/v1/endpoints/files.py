@@ -0,0 +1,18 @@
+from fastapi import APIRouter, HTTPException, status
+from app.services.local_storage import LocalStorageBackend
+from app.services.storage import get_storage
+from app.core.tracing import TimedRoute
+
+router = APIRouter(route_class=TimedRoute)
+
+
+@router.get("/{file_path:path}")
+async def get_file(file_path: str):
+    """Serve a file stored by the local storage backend (AList serves its own files at /d/)."""
+    storage = get_storage()
+    if not isinstance(storage, LocalStorageBackend):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found"
+        )
+    return storage.serve("/" + file_path)
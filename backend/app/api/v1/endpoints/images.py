@@ -1,17 +1,67 @@
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import or_, and_
+from sqlalchemy import and_, delete, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased, joinedload, selectinload
+from collections import defaultdict
 from typing import List, Optional
-from app.core.database import get_db
+from app.core.database import get_db, get_read_db
 from app.api.deps import get_current_active_user, get_current_admin_user, get_current_user_optional
-from app.models import Image, User, Tag, KeyValueParameter, VersionHistory
+from app.models import Image, Tag, KeyValueParameter, VersionHistory, CustomModel, CustomCategory
+from app.models.image import lineage_fields, lineage_subtree
+from app.core.auth_cache import AuthUser
 import json
-from app.schemas.image import ImageCreate, ImageUpdate, ImageResponse, ImageListResponse
-from app.services.alist_service import alist_service
+from app.schemas.image import ImageCreate, ImageUpdate, ImageResponse, ImageListResponse, ImageLineageResponse, VersionTreeResponse
+from app.services.bulk_delete import delete_image_rows
+from app.services.custom_labels import intern_label, label_filter
+from app.services.parameters import filter_by_parameters
+from app.services.related_tags import forget_image_tags, retag_image
+from app.services.resilience import StorageUnavailableError
+from app.services.storage import get_storage
+from app.core.tracing import TimedRoute, span
+import logging
 import uuid
 import os
 
-router = APIRouter()
+logger = logging.getLogger(__name__)
+
+router = APIRouter(route_class=TimedRoute)
+
+# Relationships serialized by ImageResponse. Collections are selectin-loaded so that
+# pagination stays a plain LIMIT on the images query
+IMAGE_RELATIONS = (
+    joinedload(Image.model),
+    joinedload(Image.category),
+    selectinload(Image.tags),
+    selectinload(Image.parameters),
+)
+
+
+# Largest page of the compact version tree
+MAX_TREE_PAGE = 500
+
+
+def collapse_lineages(query):
+    """Restrict an image query to the newest matching image of each version tree, so
+    the gallery shows one card per lineage."""
+    matches = query.subquery()
+    newest = select(func.max(matches.c.id)).group_by(func.coalesce(matches.c.root_image_id, matches.c.id))
+    return select(Image).where(Image.id.in_(newest))
+
+
+def preorder(images: List[Image]) -> List[Image]:
+    """Images of one version tree ordered root first, each followed by its subtree;
+    siblings in id order."""
+    children = defaultdict(list)
+    for image in sorted(images, key=lambda i: i.id):
+        children[image.parent_image_id].append(image)
+    ids = {image.id for image in images}
+    stack = [image for image in reversed(images) if image.parent_image_id not in ids]
+    ordered = []
+    while stack:
+        image = stack.pop()
+        ordered.append(image)
+        stack.extend(reversed(children[image.id]))
+    return ordered
 
 
 @router.get("/public", response_model=ImageListResponse)
@@ -36,16 +86,13 @@ async def get_public_images(
     param_filters: Optional[str] = None,
     # Visibility policy hints
     enforce_visibility: bool = False,
-    db: Session = Depends(get_db),
-    current_user: Optional[User] = Depends(get_current_user_optional)
+    # Show only the newest matching version of each lineage
+    collapse_versions: bool = False,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Optional[AuthUser] = Depends(get_current_user_optional)
 ):
     """Get all public images for the gallery/square page"""
-    query = db.query(Image).options(
-        joinedload(Image.model),
-        joinedload(Image.category),
-        joinedload(Image.tags),
-        joinedload(Image.parameters)
-    ).filter(Image.is_public == True)
+    query = select(Image).filter(Image.is_public == True)
     
     # Search filter
     if search:
@@ -68,11 +115,11 @@ async def get_public_images(
             pass
     # Custom category (single and multi)
     if custom_category:
-        query = query.filter(Image.custom_category == custom_category)
+        query = query.filter(label_filter(Image.custom_category_id, CustomCategory, [custom_category]))
     if custom_categories:
         custom_list = [x.strip() for x in custom_categories.split(',') if x.strip()]
         if custom_list:
-            query = query.filter(Image.custom_category.in_(custom_list))
+            query = query.filter(label_filter(Image.custom_category_id, CustomCategory, custom_list))
     
     # Model filter (single and multi)
     if model_id:
@@ -86,11 +133,11 @@ async def get_public_images(
             pass
     # Custom model (single and multi)
     if custom_model:
-        query = query.filter(Image.custom_model == custom_model)
+        query = query.filter(label_filter(Image.custom_model_id, CustomModel, [custom_model]))
     if custom_models:
         custom_list = [x.strip() for x in custom_models.split(',') if x.strip()]
         if custom_list:
-            query = query.filter(Image.custom_model.in_(custom_list))
+            query = query.filter(label_filter(Image.custom_model_id, CustomModel, custom_list))
     
     # Tags filter (already supports multi via CSV)
     if tag_ids:
@@ -100,27 +147,9 @@ async def get_public_images(
 
     # Parameter filters
     # - param_keys: comma-separated keys that must be present on the image (any value)
-    # - param_filters: JSON string mapping key -> exact value (all key-value pairs must match)
-    if param_keys:
-        keys = [k.strip() for k in param_keys.split(',') if k.strip()]
-        for k in keys:
-            query = query.filter(Image.parameters.any(KeyValueParameter.key == k))
-    if param_filters:
-        try:
-            kv = json.loads(param_filters)
-            if isinstance(kv, dict):
-                for k, v in kv.items():
-                    if v is None or str(v).strip() == "":
-                        # Only require key presence
-                        query = query.filter(Image.parameters.any(KeyValueParameter.key == k))
-                    else:
-                        query = query.filter(
-                            Image.parameters.any(
-                                and_(KeyValueParameter.key == k, KeyValueParameter.value == str(v))
-                            )
-                        )
-        except Exception:
-            pass
+    # - param_filters: conditions that must all hold, as JSON ({"steps": {">=": 30}, "cfg": [5, 7]})
+    #   or expressions ("steps>=30; cfg in [5,7]"); see app/services/parameters.py
+    query = filter_by_parameters(query, param_keys, param_filters)
 
     # Enforce visibility: if requested, restrict images that contain private tags
     if enforce_visibility:
@@ -135,12 +164,17 @@ async def get_public_images(
                 query = query.filter(
                     ~Image.tags.any(and_(Tag.is_public == False, Tag.owner_id != current_user.id))
                 )
+
+    if collapse_versions:
+        query = collapse_lineages(query)
     
     # Get total count
-    total = query.count()
+    total = await db.scalar(select(func.count()).select_from(query.subquery()))
     
     # Apply pagination
-    images = query.order_by(Image.created_at.desc()).offset(skip).limit(limit).all()
+    images = (await db.scalars(
+        query.options(*IMAGE_RELATIONS).order_by(Image.created_at.desc()).offset(skip).limit(limit)
+    )).all()
     
     return ImageListResponse(
         items=images,
@@ -170,15 +204,11 @@ async def get_images(
     # Parameter filters
     param_keys: Optional[str] = None,
     param_filters: Optional[str] = None,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    collapse_versions: bool = False,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: AuthUser = Depends(get_current_active_user)
 ):
-    query = db.query(Image).options(
-        joinedload(Image.model),
-        joinedload(Image.category),
-        joinedload(Image.tags),
-        joinedload(Image.parameters)
-    )
+    query = select(Image)
     
     # Non-admin users can only see their own images
     if current_user.role.value != "admin":
@@ -205,11 +235,11 @@ async def get_images(
             pass
     # Custom category (single and multi)
     if custom_category:
-        query = query.filter(Image.custom_category == custom_category)
+        query = query.filter(label_filter(Image.custom_category_id, CustomCategory, [custom_category]))
     if custom_categories:
         custom_list = [x.strip() for x in custom_categories.split(',') if x.strip()]
         if custom_list:
-            query = query.filter(Image.custom_category.in_(custom_list))
+            query = query.filter(label_filter(Image.custom_category_id, CustomCategory, custom_list))
     
     # Model filter (single and multi)
     if model_id:
@@ -223,11 +253,11 @@ async def get_images(
             pass
     # Custom model (single and multi)
     if custom_model:
-        query = query.filter(Image.custom_model == custom_model)
+        query = query.filter(label_filter(Image.custom_model_id, CustomModel, [custom_model]))
     if custom_models:
         custom_list = [x.strip() for x in custom_models.split(',') if x.strip()]
         if custom_list:
-            query = query.filter(Image.custom_model.in_(custom_list))
+            query = query.filter(label_filter(Image.custom_model_id, CustomModel, custom_list))
     
     # Tags filter (already supports multi via CSV)
     if tag_ids:
@@ -236,31 +266,18 @@ async def get_images(
             query = query.join(Image.tags).filter(Tag.id.in_(tag_id_list)).distinct()
 
     # Parameter filters
-    if param_keys:
-        keys = [k.strip() for k in param_keys.split(',') if k.strip()]
-        for k in keys:
-            query = query.filter(Image.parameters.any(KeyValueParameter.key == k))
-    if param_filters:
-        try:
-            kv = json.loads(param_filters)
-            if isinstance(kv, dict):
-                for k, v in kv.items():
-                    if v is None or str(v).strip() == "":
-                        query = query.filter(Image.parameters.any(KeyValueParameter.key == k))
-                    else:
-                        query = query.filter(
-                            Image.parameters.any(
-                                and_(KeyValueParameter.key == k, KeyValueParameter.value == str(v))
-                            )
-                        )
-        except Exception:
-            pass
+    query = filter_by_parameters(query, param_keys, param_filters)
+
+    if collapse_versions:
+        query = collapse_lineages(query)
     
     # Get total count
-    total = query.count()
+    total = await db.scalar(select(func.count()).select_from(query.subquery()))
     
     # Apply pagination
-    images = query.order_by(Image.created_at.desc()).offset(skip).limit(limit).all()
+    images = (await db.scalars(
+        query.options(*IMAGE_RELATIONS).order_by(Image.created_at.desc()).offset(skip).limit(limit)
+    )).all()
     
     return ImageListResponse(
         items=images,
@@ -283,8 +300,8 @@ async def upload_image(
     tag_ids: Optional[str] = Form(None),
     parameters: Optional[str] = Form(None),
     parent_image_id: Optional[int] = Form(None),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: AuthUser = Depends(get_current_active_user)
 ):
     # Validate file type
     if not file.content_type.startswith("image/"):
@@ -307,35 +324,46 @@ async def upload_image(
             detail="Either category_id or custom_category must be provided"
         )
     
+    parent_image = None
+    if parent_image_id:
+        parent_image = await db.get(Image, parent_image_id)
+        if not parent_image:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Parent image not found"
+            )
+    
     # Generate unique filename
     file_ext = os.path.splitext(file.filename)[1]
     unique_filename = f"{uuid.uuid4()}{file_ext}"
 
-    # Get image dimensions BEFORE uploading (to avoid exhausted stream)
+    # Get image dimensions BEFORE uploading; PIL only reads the header, not the whole file
     width = None
     height = None
     try:
         from PIL import Image as PILImage
-        import io
-        image_data = await file.read()
-        img = PILImage.open(io.BytesIO(image_data))
-        width, height = img.size
-        await file.seek(0)  # Reset file pointer for upload
+        with span("inspect"):
+            img = PILImage.open(file.file)
+            width, height = img.size
     except Exception:
         pass
 
-    # Upload to Alist
+    # Upload to the storage backend (streams from the upload spool, rewinding first)
+    storage = get_storage()
     try:
-        print(
-            f"[Upload] user={current_user.id} filename={unique_filename} size_hint={getattr(file, 'size', 'n/a')} upload_path_hint={getattr(alist_service, 'upload_path', 'n/a')}"
-        )
-        upload_result = await alist_service.upload_file(
+        upload_result = await storage.put_stream(
             file=file,
             filename=unique_filename,
             subfolder=str(current_user.id)
         )
+    except StorageUnavailableError:
+        # Surfaced as 503 + Retry-After by the app-level handler
+        raise
     except Exception as e:
-        print(f"[Upload] alist error: {e}")
+        logger.warning(
+            "upload failed",
+            extra={"user_id": current_user.id, "file_name": unique_filename, "backend": storage.name, "error": str(e)},
+        )
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to upload file: {str(e)}"
@@ -356,6 +384,9 @@ async def upload_image(
     tag_ids_list = []
     if tag_ids:
         tag_ids_list = [int(x) for x in tag_ids.split(',') if x.strip()]
+    tags = []
+    if tag_ids_list:
+        tags = list((await db.scalars(select(Tag).where(Tag.id.in_(tag_ids_list)))).all())
     
     # Create image record
     db_image = Image(
@@ -368,24 +399,25 @@ async def upload_image(
         width=width,
         height=height,
         is_public=is_public,
-        custom_model=custom_model,
-        custom_category=custom_category,
+        custom_model_id=await intern_label(db, CustomModel, custom_model),
+        custom_category_id=await intern_label(db, CustomCategory, custom_category),
         owner_id=current_user.id,
         model_id=model_id,
         category_id=category_id,
         parent_image_id=parent_image_id,
-        parameters=params_list
+        parameters=params_list,
+        tags=tags
     )
     
     db.add(db_image)
-    db.commit()
-    db.refresh(db_image)
+    await db.flush()
     
-    # Add tags
-    if tag_ids_list:
-        tags = db.query(Tag).filter(Tag.id.in_(tag_ids_list)).all()
-        db_image.tags.extend(tags)
-        db.commit()
+    # Lineage needs the new id; written with the same commit
+    for field, value in lineage_fields(db_image.id, parent_image).items():
+        setattr(db_image, field, value)
+    
+    # Tag pairs for related tags
+    await retag_image(db, [], [tag.id for tag in tags])
     
     # Create version history if parent image exists
     if parent_image_id:
@@ -394,15 +426,15 @@ async def upload_image(
             child_image_id=db_image.id
         )
         db.add(version)
-        db.commit()
+    await db.commit()
     
     # Reload with relationships
-    db_image = db.query(Image).options(
-        joinedload(Image.model),
-        joinedload(Image.category),
-        joinedload(Image.tags),
-        joinedload(Image.parameters)
-    ).filter(Image.id == db_image.id).first()
+    db_image = (await db.scalars(
+        select(Image)
+        .options(*IMAGE_RELATIONS)
+        .where(Image.id == db_image.id)
+        .execution_options(populate_existing=True)
+    )).first()
     
     return db_image
 
@@ -410,15 +442,12 @@ async def upload_image(
 @router.get("/{image_id}", response_model=ImageResponse)
 async def get_image(
     image_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: AuthUser = Depends(get_current_active_user)
 ):
-    image = db.query(Image).options(
-        joinedload(Image.model),
-        joinedload(Image.category),
-        joinedload(Image.tags),
-        joinedload(Image.parameters)
-    ).filter(Image.id == image_id).first()
+    image = (await db.scalars(
+        select(Image).options(*IMAGE_RELATIONS).where(Image.id == image_id)
+    )).first()
     
     if not image:
         raise HTTPException(
@@ -440,10 +469,14 @@ async def get_image(
 async def update_image(
     image_id: int,
     image_update: ImageUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: AuthUser = Depends(get_current_active_user)
 ):
-    image = db.query(Image).filter(Image.id == image_id).first()
+    image = (await db.scalars(
+        select(Image)
+        .options(selectinload(Image.tags), selectinload(Image.parameters))
+        .where(Image.id == image_id)
+    )).first()
     
     if not image:
         raise HTTPException(
@@ -463,27 +496,31 @@ async def update_image(
     for field, value in update_data.items():
         if field == "tags" and value is not None:
             # Update tags
+            tags = (await db.scalars(select(Tag).where(Tag.id.in_(value)))).all()
+            await retag_image(db, [tag.id for tag in image.tags], [tag.id for tag in tags])
             image.tags.clear()
-            tags = db.query(Tag).filter(Tag.id.in_(value)).all()
             image.tags.extend(tags)
         elif field == "parameters" and value is not None:
             # Update parameters
             image.parameters.clear()
             for param in value:
-                image.parameters.append(KeyValueParameter(**param.model_dump()))
+                image.parameters.append(KeyValueParameter(**param))
+        elif field == "custom_model":
+            image.custom_model_id = await intern_label(db, CustomModel, value)
+        elif field == "custom_category":
+            image.custom_category_id = await intern_label(db, CustomCategory, value)
         else:
             setattr(image, field, value)
     
-    db.commit()
-    db.refresh(image)
+    await db.commit()
     
     # Reload with relationships
-    image = db.query(Image).options(
-        joinedload(Image.model),
-        joinedload(Image.category),
-        joinedload(Image.tags),
-        joinedload(Image.parameters)
-    ).filter(Image.id == image_id).first()
+    image = (await db.scalars(
+        select(Image)
+        .options(*IMAGE_RELATIONS)
+        .where(Image.id == image_id)
+        .execution_options(populate_existing=True)
+    )).first()
     
     return image
 
@@ -491,11 +528,11 @@ async def update_image(
 @router.get("/{image_id}/versions", response_model=List[ImageResponse])
 async def get_image_versions(
     image_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: AuthUser = Depends(get_current_active_user)
 ):
     # Check if image exists and user has access
-    image = db.query(Image).filter(Image.id == image_id).first()
+    image = await db.get(Image, image_id)
 
     if not image:
         raise HTTPException(
@@ -509,63 +546,156 @@ async def get_image_versions(
             detail="Not authorized to access this image"
         )
 
-    # Get all versions - find all related images
-    # First, find the root image (if this has a parent, follow up)
-    root_id = image_id
-    while image.parent_image_id:
-        root_id = image.parent_image_id
-        image = db.query(Image).filter(Image.id == root_id).first()
-
-    # Now find all children of the root
-    all_versions = db.query(Image).options(
-        joinedload(Image.model),
-        joinedload(Image.category),
-        joinedload(Image.tags),
-        joinedload(Image.parameters)
-    ).filter(
-        or_(
-            Image.id == root_id,
-            Image.parent_image_id == root_id
+    # The whole tree shares root_image_id: one indexed lookup, plus one batched query
+    # per collection
+    versions = (await db.scalars(
+        select(Image).options(*IMAGE_RELATIONS).where(Image.root_image_id == image.root_image_id)
+    )).unique().all()
+
+    return preorder(versions)
+
+
+@router.get("/{image_id}/lineage", response_model=ImageLineageResponse)
+async def get_image_lineage(
+    image_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: AuthUser = Depends(get_current_active_user)
+):
+    """Where an image sits in its version tree: tree size, size of the image's own
+    subtree and the newest version, each an index lookup on the lineage columns."""
+    image = await db.get(Image, image_id)
+
+    if not image:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Image not found"
         )
-    ).order_by(Image.created_at.asc()).all()
 
-    # Recursively find all descendants
-    def find_all_versions(parent_id: int, versions: List[Image]):
-        children = db.query(Image).options(
-            joinedload(Image.model),
-            joinedload(Image.category),
-            joinedload(Image.tags),
-            joinedload(Image.parameters)
-        ).filter(Image.parent_image_id == parent_id).all()
+    if current_user.role.value != "admin" and image.owner_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to access this image"
+        )
 
-        for child in children:
-            versions.append(child)
-            find_all_versions(child.id, versions)
+    in_tree = Image.root_image_id == image.root_image_id
+    row = (await db.execute(select(
+        select(func.count()).select_from(Image).where(in_tree).scalar_subquery(),
+        select(func.count()).select_from(Image).where(lineage_subtree(image.path)).scalar_subquery(),
+        select(func.max(Image.id)).where(in_tree).scalar_subquery(),
+    ))).one()
+
+    return ImageLineageResponse(
+        image_id=image.id,
+        root_image_id=image.root_image_id,
+        depth=image.depth,
+        version_count=row[0],
+        subtree_size=row[1],
+        latest_image_id=row[2],
+    )
 
-    versions = []
-    # Add root image first
-    root_image = db.query(Image).options(
-        joinedload(Image.model),
-        joinedload(Image.category),
-        joinedload(Image.tags),
-        joinedload(Image.parameters)
-    ).filter(Image.id == root_id).first()
 
-    if root_image:
-        versions.append(root_image)
-        find_all_versions(root_id, versions)
+@router.get("/{image_id}/tree", response_model=VersionTreeResponse)
+async def get_version_tree(
+    image_id: int,
+    start_id: Optional[int] = None,
+    levels: Optional[int] = None,
+    after: Optional[int] = None,
+    limit: int = 100,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: AuthUser = Depends(get_current_active_user)
+):
+    """Compact version tree for the version panel: only what is needed to draw each
+    node, breadth first (by depth, then id). Full details come from GET /images/{id}.
 
-    return versions
+    ``start_id`` limits the page to that node's subtree and ``levels`` to that many
+    levels below it, so a large tree can be expanded on demand; ``limit`` and
+    ``after`` (the previous page's ``next_after``) page through wide levels.
+    """
+    image = await db.get(Image, image_id)
+
+    if not image:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Image not found"
+        )
+
+    if current_user.role.value != "admin" and image.owner_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to access this image"
+        )
+
+    in_tree = Image.root_image_id == image.root_image_id
+    child = aliased(Image)
+    query = select(
+        Image.id,
+        Image.parent_image_id,
+        Image.depth,
+        Image.alist_url,
+        Image.created_at,
+        select(child.id).where(child.parent_image_id == Image.id).exists().label("has_children"),
+    ).where(in_tree)
+
+    if start_id is not None:
+        start = await db.get(Image, start_id)
+        if not start or start.root_image_id != image.root_image_id:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Start image not found in this version tree"
+            )
+        query = query.where(lineage_subtree(start.path))
+        top_depth = start.depth
+    else:
+        top_depth = 0
+    if levels is not None:
+        query = query.where(Image.depth <= top_depth + max(levels, 0))
+
+    if after is not None:
+        last = await db.get(Image, after)
+        if not last or last.root_image_id != image.root_image_id:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid page cursor"
+            )
+        query = query.where(or_(
+            Image.depth > last.depth,
+            and_(Image.depth == last.depth, Image.id > last.id),
+        ))
+
+    limit = max(1, min(limit, MAX_TREE_PAGE))
+    rows = (await db.execute(query.order_by(Image.depth, Image.id).limit(limit + 1))).all()
+    total = await db.scalar(select(func.count()).select_from(Image).where(in_tree))
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return VersionTreeResponse(
+        root_image_id=image.root_image_id,
+        total=total,
+        items=[
+            {
+                "id": row.id,
+                "parent_image_id": row.parent_image_id,
+                "depth": row.depth,
+                "thumbnail_url": row.alist_url,
+                "created_at": row.created_at,
+                "has_children": row.has_children,
+            }
+            for row in rows
+        ],
+        next_after=rows[-1].id if has_more else None,
+    )
 
 
 @router.post("/{image_id}/iterate", response_model=ImageResponse)
 async def create_new_version(
     image_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: AuthUser = Depends(get_current_active_user)
 ):
     # Get the parent image
-    parent_image = db.query(Image).filter(Image.id == image_id).first()
+    parent_image = (await db.scalars(
+        select(Image).options(*IMAGE_RELATIONS).where(Image.id == image_id)
+    )).first()
 
     if not parent_image:
         raise HTTPException(
@@ -584,14 +714,44 @@ async def create_new_version(
     return parent_image
 
 
+async def delete_subtree(db: AsyncSession, image: Image, current_user: AuthUser, delete_from_alist: bool) -> dict:
+    """Delete ``image`` and all its descendant versions in one transaction, then their
+    files with one batched storage call."""
+    subtree = (await db.execute(
+        select(Image.id, Image.file_path, Image.owner_id).where(
+            # The root condition keeps the deletion inside this version tree
+            Image.root_image_id == image.root_image_id,
+            lineage_subtree(image.path),
+        )
+    )).all()
+
+    if current_user.role.value != "admin" and any(row.owner_id != current_user.id for row in subtree):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to delete versions owned by other users"
+        )
+
+    await delete_image_rows(db, [row.id for row in subtree])
+    await db.commit()
+
+    if delete_from_alist:
+        try:
+            await get_storage().delete_many(row.file_path for row in subtree)
+        except Exception as e:
+            logger.warning("storage delete failed", extra={"image_id": image.id, "files": len(subtree), "error": str(e)})
+
+    return {"message": "Image deleted successfully", "deleted": len(subtree)}
+
+
 @router.delete("/{image_id}")
 async def delete_image(
     image_id: int,
     delete_from_alist: bool = False,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    cascade: bool = False,
+    db: AsyncSession = Depends(get_db),
+    current_user: AuthUser = Depends(get_current_active_user)
 ):
-    image = db.query(Image).filter(Image.id == image_id).first()
+    image = await db.get(Image, image_id)
 
     if not image:
         raise HTTPException(
@@ -606,32 +766,38 @@ async def delete_image(
             detail="Not authorized to delete this image"
         )
 
+    if cascade:
+        return await delete_subtree(db, image, current_user, delete_from_alist)
+
     # Check if this image has children
-    has_children = db.query(Image).filter(Image.parent_image_id == image_id).count() > 0
+    has_children = await db.scalar(
+        select(Image.id).where(Image.parent_image_id == image_id).limit(1)
+    ) is not None
 
     if has_children:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Cannot delete image that has child versions. Delete child versions first."
+            detail="Cannot delete image that has child versions. Delete child versions first, or use cascade=true."
         )
 
-    # Delete from Alist if requested
+    # Delete from storage if requested
     if delete_from_alist:
         try:
-            await alist_service.delete_file(image.file_path)
+            await get_storage().delete_file(image.file_path)
         except Exception as e:
-            print(f"Failed to delete file from Alist: {e}")
+            logger.warning("storage delete failed", extra={"file_path": image.file_path, "error": str(e)})
 
     # Delete version history entries
-    db.query(VersionHistory).filter(
+    await db.execute(delete(VersionHistory).where(
         or_(
             VersionHistory.parent_image_id == image_id,
             VersionHistory.child_image_id == image_id
         )
-    ).delete()
+    ))
 
     # Delete from database
-    db.delete(image)
-    db.commit()
+    await forget_image_tags(db, [image_id])
+    await db.delete(image)
+    await db.commit()
 
     return {"message": "Image deleted successfully"}
\ No newline at end of file
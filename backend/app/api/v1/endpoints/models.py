@@ -1,13 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
-from app.core.database import get_db
+from app.core.database import get_db, get_read_db
 from app.api.deps import get_current_active_user, get_current_admin_user
 from app.models.model import Model
 from app.schemas.model import ModelCreate, ModelUpdate, ModelResponse
+from app.core.tracing import TimedRoute
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
 
 
 @router.get("/", response_model=List[ModelResponse])
@@ -15,12 +16,12 @@ async def get_models(
     skip: int = 0,
     limit: int = 100,
     include_count: bool = False,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     if include_count:
         from app.models.image import Image
-        results = (
-            db.query(
+        results = (await db.execute(
+            select(
                 Model,
                 func.count(Image.id).label("image_count")
             )
@@ -28,8 +29,7 @@ async def get_models(
             .group_by(Model.id)
             .offset(skip)
             .limit(limit)
-            .all()
-        )
+        )).all()
         enriched: List[ModelResponse] = []
         for mdl, count in results:
             mdl_schema = ModelResponse.model_validate(mdl)
@@ -37,7 +37,7 @@ async def get_models(
             enriched.append(mdl_schema)
         return enriched
     else:
-        models = db.query(Model).offset(skip).limit(limit).all()
+        models = (await db.scalars(select(Model).offset(skip).limit(limit))).all()
         return models
 
 
@@ -45,25 +45,24 @@ async def get_models(
 async def get_custom_models(
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Return distinct custom models from images (free-text models users entered), with counts.
-    These are not in the `models` table but exist as `Image.custom_model` values.
+    These are not in the `models` table; names are interned in `custom_models` and referenced by `Image.custom_model_id`.
     """
-    from app.models.image import Image
+    from app.models import Image, CustomModel
 
-    rows = (
-        db.query(
-            Image.custom_model.label("name"),
+    rows = (await db.execute(
+        select(
+            CustomModel.name,
             func.count(Image.id).label("image_count")
         )
-        .filter(Image.custom_model.isnot(None))
-        .group_by(Image.custom_model)
+        .join(Image, Image.custom_model_id == CustomModel.id)
+        .group_by(CustomModel.id, CustomModel.name)
         .order_by(func.count(Image.id).desc())
         .offset(skip)
         .limit(limit)
-        .all()
-    )
+    )).all()
 
     return [
         {"name": name, "image_count": int(image_count)}
@@ -74,11 +73,11 @@ async def get_custom_models(
 @router.post("/", response_model=ModelResponse)
 async def create_model(
     model: ModelCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_admin_user)
 ):
     # Check if model already exists
-    existing = db.query(Model).filter(Model.name == model.name).first()
+    existing = (await db.scalars(select(Model).where(Model.name == model.name))).first()
     if existing:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -87,8 +86,8 @@ async def create_model(
     
     db_model = Model(**model.model_dump())
     db.add(db_model)
-    db.commit()
-    db.refresh(db_model)
+    await db.commit()
+    await db.refresh(db_model)
     
     return db_model
 
@@ -97,10 +96,10 @@ async def create_model(
 async def update_model(
     model_id: int,
     model_update: ModelUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_admin_user)
 ):
-    model = db.query(Model).filter(Model.id == model_id).first()
+    model = await db.get(Model, model_id)
     if not model:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -109,7 +108,7 @@ async def update_model(
     
     # Check if new name conflicts with existing model
     if model_update.name and model_update.name != model.name:
-        existing = db.query(Model).filter(Model.name == model_update.name).first()
+        existing = (await db.scalars(select(Model).where(Model.name == model_update.name))).first()
         if existing:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -120,8 +119,8 @@ async def update_model(
     for field, value in update_data.items():
         setattr(model, field, value)
     
-    db.commit()
-    db.refresh(model)
+    await db.commit()
+    await db.refresh(model)
     
     return model
 
@@ -130,10 +129,10 @@ async def update_model(
 async def delete_model(
     model_id: int,
     merge_into_id: int = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_admin_user)
 ):
-    model = db.query(Model).filter(Model.id == model_id).first()
+    model = await db.get(Model, model_id)
     if not model:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -142,7 +141,7 @@ async def delete_model(
     
     # If merge_into_id is provided, merge images into that model
     if merge_into_id:
-        target_model = db.query(Model).filter(Model.id == merge_into_id).first()
+        target_model = await db.get(Model, merge_into_id)
         if not target_model:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -151,13 +150,13 @@ async def delete_model(
         
         # Update all images using this model to the target model
         from app.models.image import Image
-        db.query(Image).filter(Image.model_id == model_id).update(
-            {"model_id": merge_into_id}
+        await db.execute(
+            update(Image).where(Image.model_id == model_id).values(model_id=merge_into_id)
         )
-        db.commit()
+        await db.commit()
     
     # Delete the model
-    db.delete(model)
-    db.commit()
+    await db.delete(model)
+    await db.commit()
     
     return {"message": "Model deleted successfully"}
\ No newline at end of file
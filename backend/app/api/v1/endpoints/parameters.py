@@ -0,0 +1,27 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List
+from app.core.database import get_read_db
+from app.schemas.parameter import ParameterCatalogEntry
+from app.services.parameters import parameter_catalog
+from app.core.tracing import TimedRoute
+
+router = APIRouter(route_class=TimedRoute)
+
+# Largest number of keys and of values per key in one catalog response
+MAX_CATALOG_KEYS = 200
+MAX_CATALOG_VALUES = 50
+
+
+@router.get("/catalog", response_model=List[ParameterCatalogEntry])
+async def get_parameter_catalog(
+    limit: int = 100,
+    top: int = 10,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Generation parameter keys, most used first, each with its ``top`` most common
+    values and, for numeric keys, the value range. Read from the parameter_value_stats
+    aggregate, so the cost does not grow with the number of images."""
+    limit = max(1, min(limit, MAX_CATALOG_KEYS))
+    top = max(1, min(top, MAX_CATALOG_VALUES))
+    return await parameter_catalog(db, limit, top)
@@ -1,14 +1,23 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import func, or_
+from sqlalchemy import delete, exists, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
-from app.core.database import get_db
+from app.core.database import get_db, get_read_db
 from app.api.deps import get_current_active_user, get_current_admin_user, get_current_user_optional
 from app.models.tag import Tag, image_tags
-from app.models.user import User
-from app.schemas.tag import TagCreate, TagUpdate, TagResponse
+from app.core.auth_cache import AuthUser
+from app.schemas.tag import TagCreate, TagUpdate, TagResponse, TagSuggestion, RelatedTag, TagMerge
+from app.services.tag_index import tag_index
+from app.services.tag_links import merge_tags, remove_tag_links
+from app.services.related_tags import RELATED_TAGS_TOP, related_tags
+from app.core.tracing import TimedRoute
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
+
+
+def _visible(owner_id: Optional[int], is_public: bool, user_id: Optional[int]) -> bool:
+    # Public, admin-created, or the viewer's own (as in GET /tags/)
+    return is_public or owner_id is None or (user_id is not None and owner_id == user_id)
 
 
 @router.get("/", response_model=List[TagResponse])
@@ -16,15 +25,15 @@ async def get_tags(
     skip: int = 0,
     limit: int = 100,
     include_count: bool = False,
-    current_user: Optional[User] = Depends(get_current_user_optional),
-    db: Session = Depends(get_db)
+    current_user: Optional[AuthUser] = Depends(get_current_user_optional),
+    db: AsyncSession = Depends(get_read_db)
 ):
     # Return tags that are either:
     # 1. Public (is_public=True)
     # 2. Owned by the current user (if logged in)
     # 3. Admin-created (owner_id is None)
     if current_user:
-        query = db.query(Tag).filter(
+        query = select(Tag).where(
             or_(
                 Tag.is_public == True,
                 Tag.owner_id == current_user.id,
@@ -33,7 +42,7 @@ async def get_tags(
         )
     else:
         # For anonymous users, only show public tags and admin-created tags
-        query = db.query(Tag).filter(
+        query = select(Tag).where(
             or_(
                 Tag.is_public == True,
                 Tag.owner_id == None
@@ -44,7 +53,7 @@ async def get_tags(
         # Add image count to each tag
         query = query.outerjoin(image_tags).group_by(Tag.id)
         query = query.add_columns(func.count(image_tags.c.image_id).label('image_count'))
-        results = query.offset(skip).limit(limit).all()
+        results = (await db.execute(query.offset(skip).limit(limit))).all()
         
         tags = []
         for tag, count in results:
@@ -53,24 +62,63 @@ async def get_tags(
             tags.append(tag_dict)
         return tags
     else:
-        tags = query.offset(skip).limit(limit).all()
+        tags = (await db.scalars(query.offset(skip).limit(limit))).all()
         return tags
 
 
+@router.get("/suggest", response_model=List[TagSuggestion])
+async def suggest_tags(
+    q: str = "",
+    limit: int = 10,
+    current_user: Optional[AuthUser] = Depends(get_current_user_optional)
+):
+    """Typeahead: tags visible to the caller whose name starts with ``q`` (case-insensitive),
+    most used first. Served from the in-process tag index, not the database."""
+    limit = max(1, min(limit, 50))
+    return await tag_index.suggest(q, current_user.id if current_user else None, limit)
+
+
+@router.get("/{tag_id}/related", response_model=List[RelatedTag])
+async def get_related_tags(
+    tag_id: int,
+    limit: int = 10,
+    current_user: Optional[AuthUser] = Depends(get_current_user_optional),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Tags most often found on the same images as ``tag_id``, with the number of
+    images they share; served from the precomputed co-occurrence table."""
+    tag = await db.get(Tag, tag_id)
+    user_id = current_user.id if current_user else None
+    if not tag or not _visible(tag.owner_id, tag.is_public, user_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Tag not found"
+        )
+    
+    limit = max(1, min(limit, RELATED_TAGS_TOP))
+    related = []
+    for other_id, name, owner_id, is_public, image_count in await related_tags(db, tag_id):
+        if _visible(owner_id, is_public, user_id):
+            related.append(RelatedTag(id=other_id, name=name, owner_id=owner_id, is_public=is_public, image_count=image_count))
+            if len(related) == limit:
+                break
+    return related
+
+
 @router.post("/", response_model=TagResponse)
 async def create_tag(
     tag: TagCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: AuthUser = Depends(get_current_active_user)
 ):
     # Check if tag already exists for this user or as admin tag
-    existing = db.query(Tag).filter(
+    existing = (await db.scalars(select(Tag).where(
         Tag.name == tag.name,
         or_(
             Tag.owner_id == current_user.id,
             Tag.owner_id == None
         )
-    ).first()
+    ))).first()
     if existing:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -81,8 +129,9 @@ async def create_tag(
     tag_data['owner_id'] = current_user.id
     db_tag = Tag(**tag_data)
     db.add(db_tag)
-    db.commit()
-    db.refresh(db_tag)
+    await db.commit()
+    await db.refresh(db_tag)
+    tag_index.add(db_tag)
     
     return db_tag
 
@@ -91,10 +140,10 @@ async def create_tag(
 async def update_tag(
     tag_id: int,
     tag_update: TagUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: AuthUser = Depends(get_current_active_user)
 ):
-    tag = db.query(Tag).filter(Tag.id == tag_id).first()
+    tag = await db.get(Tag, tag_id)
     if not tag:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -111,13 +160,13 @@ async def update_tag(
     
     # Check if new name conflicts with existing tag
     if tag_update.name and tag_update.name != tag.name:
-        existing = db.query(Tag).filter(
+        existing = (await db.scalars(select(Tag).where(
             Tag.name == tag_update.name,
             or_(
                 Tag.owner_id == current_user.id,
                 Tag.owner_id == None
             )
-        ).first()
+        ))).first()
         if existing:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -128,20 +177,89 @@ async def update_tag(
     for field, value in update_data.items():
         setattr(tag, field, value)
     
-    db.commit()
-    db.refresh(tag)
+    await db.commit()
+    await db.refresh(tag)
+    tag_index.update(tag)
     
     return tag
 
 
+@router.delete("/cleanup")
+async def cleanup_unused_tags(
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(get_current_admin_user)
+):
+    # Delete tags with no associated images in one statement (declared before
+    # /{tag_id} so the path is not taken for a tag id)
+    unused = ~exists().where(image_tags.c.tag_id == Tag.id)
+    unused_ids = (await db.scalars(select(Tag.id).where(unused))).all()
+    result = await db.execute(delete(Tag).where(unused).execution_options(synchronize_session=False))
+    count = result.rowcount
+    
+    await db.commit()
+    tag_index.remove_many(unused_ids)
+    
+    return {"message": f"Deleted {count} unused tags"}
+
+
+@router.post("/merge")
+async def merge_tags_into(
+    payload: TagMerge,
+    db: AsyncSession = Depends(get_db),
+    current_user: AuthUser = Depends(get_current_active_user)
+):
+    """Merge every tag in ``source_ids`` into ``target_id`` and delete them: their
+    images gain the target tag (once), in one transaction."""
+    source_ids = sorted(set(payload.source_ids) - {payload.target_id})
+    if not source_ids:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No tags to merge"
+        )
+    
+    from app.models.user import UserRole
+    is_admin = current_user.role == UserRole.admin
+    target_tag = await db.get(Tag, payload.target_id)
+    # Only into tags the caller can see (as in GET /tags/), unless admin
+    if not target_tag or not (is_admin or _visible(target_tag.owner_id, target_tag.is_public, current_user.id)):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Target tag not found"
+        )
+    
+    owners = dict((await db.execute(select(Tag.id, Tag.owner_id).where(Tag.id.in_(source_ids)))).all())
+    missing = [tag_id for tag_id in source_ids if tag_id not in owners]
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Tags not found: {missing}"
+        )
+    
+    # Check if user has permission to delete every source tag
+    if not is_admin and any(owner_id != current_user.id for owner_id in owners.values()):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to delete these tags"
+        )
+    
+    links_added = await merge_tags(db, source_ids, payload.target_id)
+    await db.execute(delete(Tag).where(Tag.id.in_(source_ids)).execution_options(synchronize_session=False))
+    await db.commit()
+    if links_added:
+        tag_index.adjust_count(payload.target_id, links_added)
+    tag_index.remove_many(source_ids)
+    
+    return {"merged": len(source_ids), "links_added": links_added}
+
+
 @router.delete("/{tag_id}")
 async def delete_tag(
     tag_id: int,
     merge_into_id: int = None,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: AuthUser = Depends(get_current_active_user)
 ):
-    tag = db.query(Tag).filter(Tag.id == tag_id).first()
+    tag = await db.get(Tag, tag_id)
     if not tag:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -156,45 +274,27 @@ async def delete_tag(
             detail="Not authorized to delete this tag"
         )
     
-    # If merge_into_id is provided, merge images into that tag
-    if merge_into_id:
-        target_tag = db.query(Tag).filter(Tag.id == merge_into_id).first()
-        if not target_tag:
+    # If merge_into_id is provided, move this tag's images to that tag (images
+    # already carrying both keep a single link); otherwise just drop the links
+    merged = 0
+    if merge_into_id and merge_into_id != tag_id:
+        target_tag = await db.get(Tag, merge_into_id)
+        if not target_tag or not (
+            current_user.role == UserRole.admin
+            or _visible(target_tag.owner_id, target_tag.is_public, current_user.id)
+        ):
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Target tag not found"
             )
-        
-        # Update all image-tag relationships
-        db.execute(
-            image_tags.update()
-            .where(image_tags.c.tag_id == tag_id)
-            .values(tag_id=merge_into_id)
-        )
-        db.commit()
+        merged = await merge_tags(db, [tag_id], merge_into_id)
+    else:
+        await remove_tag_links(db, [tag_id])
     
-    # Delete the tag
-    db.delete(tag)
-    db.commit()
+    await db.execute(delete(Tag).where(Tag.id == tag_id))
+    await db.commit()
+    if merged:
+        tag_index.adjust_count(merge_into_id, merged)
+    tag_index.remove(tag_id)
     
     return {"message": "Tag deleted successfully"}
-
-
-@router.delete("/cleanup")
-async def cleanup_unused_tags(
-    db: Session = Depends(get_db),
-    current_user = Depends(get_current_admin_user)
-):
-    # Find tags with no associated images
-    unused_tags = db.query(Tag).outerjoin(image_tags).filter(
-        image_tags.c.tag_id.is_(None)
-    ).all()
-    
-    count = len(unused_tags)
-    
-    for tag in unused_tags:
-        db.delete(tag)
-    
-    db.commit()
-    
-    return {"message": f"Deleted {count} unused tags"}
\ No newline at end of file
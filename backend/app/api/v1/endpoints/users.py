@@ -1,64 +1,80 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.database import get_db
 from app.api.deps import get_current_active_user
 from app.models.user import User
+from app.core.auth_cache import AuthUser, auth_cache
 from app.schemas.user import UserResponse, UserUpdate
-from app.core.security import get_password_hash
+from app.core.security import password_hasher
+from app.core.tracing import TimedRoute
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
+
+
+async def _load_user(db: AsyncSession, current_user: AuthUser) -> User:
+    # The auth dependencies only carry id/role/status; fetch the full row
+    user = await db.get(User, current_user.id)
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    return user
 
 
 @router.get("/me", response_model=UserResponse)
 async def get_current_user_info(
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: AuthUser = Depends(get_current_active_user)
 ):
-    return current_user
+    return await _load_user(db, current_user)
 
 
 @router.put("/me", response_model=UserResponse)
 async def update_current_user(
     user_update: UserUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: AuthUser = Depends(get_current_active_user)
 ):
+    user = await _load_user(db, current_user)
+    
     # Check if username is taken by another user
     if user_update.username:
-        existing_user = db.query(User).filter(
+        existing_user = (await db.scalars(select(User).where(
             User.username == user_update.username,
             User.id != current_user.id
-        ).first()
+        ))).first()
         if existing_user:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Username already taken"
             )
-        current_user.username = user_update.username
+        user.username = user_update.username
     
     # Check if email is taken by another user
     if user_update.email:
-        existing_user = db.query(User).filter(
+        existing_user = (await db.scalars(select(User).where(
             User.email == user_update.email,
             User.id != current_user.id
-        ).first()
+        ))).first()
         if existing_user:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Email already taken"
             )
-        current_user.email = user_update.email
+        user.email = user_update.email
     
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    await db.refresh(user)
+    # Tokens carry the username, so a rename must not keep resolving from the cache
+    auth_cache.invalidate()
     
-    return current_user
+    return user
 
 
 @router.put("/me/password")
 async def update_current_user_password(
     password_update: dict,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: AuthUser = Depends(get_current_active_user)
 ):
     password = password_update.get("password")
     if not password:
@@ -73,7 +89,8 @@ async def update_current_user_password(
             detail="Password must be at least 6 characters long"
         )
     
-    current_user.hashed_password = get_password_hash(password)
-    db.commit()
+    user = await _load_user(db, current_user)
+    user.hashed_password = await password_hasher.hash(password)
+    await db.commit()
     
     return {"message": "Password updated successfully"}
\ No newline at end of file
@@ -0,0 +1,270 @@
+import json
+import math
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.security import verify_token
+
+# Paths never subject to admission control: health checks, API docs, and file
+# downloads (one gallery page fetches dozens of them)
+EXEMPT_PREFIXES = ("/health", "/docs", "/redoc", f"{settings.API_V1_STR}/openapi.json", f"{settings.API_V1_STR}/files/")
+
+# Query parameters that turn an image listing into a search
+SEARCH_PARAMS = {b"search", b"param_filters", b"tag_ids", b"custom_models", b"custom_categories"}
+
+
+class RateLimitBackend(ABC):
+    """Token-bucket store. ``take`` spends ``cost`` tokens from the bucket at ``key``
+    (refilled at ``rate``/s up to ``burst``) and returns 0 if allowed, otherwise the
+    seconds until enough tokens are available."""
+
+    name: str
+
+    @abstractmethod
+    async def take(self, key: str, rate: float, burst: float, cost: float) -> float:
+        ...
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """Buckets in this process. With several workers each enforces the limits on its
+    own share of the traffic; use RedisRateLimitBackend for exact global limits."""
+
+    name = "memory"
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max(1, max_keys)
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = Lock()
+
+    async def take(self, key: str, rate: float, burst: float, cost: float) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            wait = 0.0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = (cost - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            # Least recently seen clients go first; their buckets would be full again anyway
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"backend": self.name, "keys": len(self._buckets)}
+
+
+# Runs atomically in Redis; uses the server clock so all workers agree on refill time
+_REDIS_TAKE = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local rate, burst, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisRateLimitBackend(RateLimitBackend):
+    """Buckets shared by every worker and host through Redis (``pip install redis``).
+
+    If Redis is unreachable requests are let through rather than failing the API;
+    ``errors`` in /admin/metrics counts those.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str, prefix: str = "aimagine:rl:"):
+        import redis.asyncio as redis
+
+        self._client = redis.from_url(url)
+        self._take = self._client.register_script(_REDIS_TAKE)
+        self.prefix = prefix
+        self.errors = 0
+
+    async def take(self, key: str, rate: float, burst: float, cost: float) -> float:
+        try:
+            wait = await self._take(keys=[self.prefix + key], args=[rate, burst, cost])
+        except Exception:
+            self.errors += 1
+            return 0.0
+        return float(wait)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"backend": self.name, "errors": self.errors}
+
+
+def create_rate_limit_backend() -> RateLimitBackend:
+    """The backend selected by RATE_LIMIT_BACKEND (``memory`` or ``redis``)."""
+    if settings.RATE_LIMIT_BACKEND == "memory":
+        return MemoryRateLimitBackend(max_keys=settings.RATE_LIMIT_MAX_KEYS)
+    if settings.RATE_LIMIT_BACKEND == "redis":
+        if not settings.RATE_LIMIT_REDIS_URL:
+            raise ValueError("RATE_LIMIT_BACKEND=redis requires RATE_LIMIT_REDIS_URL")
+        return RedisRateLimitBackend(settings.RATE_LIMIT_REDIS_URL)
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {settings.RATE_LIMIT_BACKEND}")
+
+
+class AdmissionController:
+    """Per-route-class concurrency budgets plus per-client token buckets.
+
+    Requests are classified as ``read``, ``search`` (image listings with search or
+    filter parameters), ``upload``, ``write`` (other mutations) or ``admin``. Each class
+    admits at most its ADMISSION_*_CONCURRENCY requests at once in this worker, so a
+    flood of expensive searches cannot take the slots uploads need. Clients draw from a
+    token bucket per user (authenticated) or per IP (anonymous); searches cost
+    RATE_LIMIT_SEARCH_COST tokens.
+    """
+
+    def __init__(self, backend: RateLimitBackend):
+        self.backend = backend
+        self.limits = {
+            "read": settings.ADMISSION_READ_CONCURRENCY,
+            "search": settings.ADMISSION_SEARCH_CONCURRENCY,
+            "upload": settings.ADMISSION_UPLOAD_CONCURRENCY,
+            "write": settings.ADMISSION_WRITE_CONCURRENCY,
+            "admin": settings.ADMISSION_ADMIN_CONCURRENCY,
+        }
+        self.in_flight = {name: 0 for name in self.limits}
+        self.overloaded = {name: 0 for name in self.limits}
+        self.rate_limited = 0
+        metrics.register_collector("admission", self.snapshot)
+
+    @staticmethod
+    def classify(method: str, path: str, query: bytes) -> str:
+        images = f"{settings.API_V1_STR}/images/"
+        if path.startswith(f"{settings.API_V1_STR}/admin/"):
+            return "admin"
+        if method in ("GET", "HEAD"):
+            if path in (images, f"{images}public") and query:
+                names = {param.split(b"=", 1)[0] for param in query.split(b"&")}
+                if not names.isdisjoint(SEARCH_PARAMS):
+                    return "search"
+            return "read"
+        if method == "POST" and path == images:
+            return "upload"
+        return "write"
+
+    @staticmethod
+    def client_key(scope) -> str:
+        headers = dict(scope.get("headers") or ())
+        authorization = headers.get(b"authorization", b"").decode("latin-1")
+        if authorization[:7].lower() == "bearer ":
+            claims = verify_token(authorization[7:])
+            if claims and claims.get("sub"):
+                return f"user:{claims['sub']}"
+        ip = None
+        if settings.RATE_LIMIT_CLIENT_IP_HEADER:
+            # e.g. X-Real-IP set by nginx; only trust it behind a proxy that overwrites it
+            value = headers.get(settings.RATE_LIMIT_CLIENT_IP_HEADER.lower().encode("latin-1"))
+            if value:
+                ip = value.decode("latin-1").split(",")[0].strip()
+        if ip is None:
+            client = scope.get("client")
+            ip = client[0] if client else "unknown"
+        return f"ip:{ip}"
+
+    async def check_rate(self, key: str, route_class: str) -> float:
+        """Seconds the client must wait, or 0 if the request may proceed."""
+        if key.startswith("user:"):
+            rate, burst = settings.RATE_LIMIT_USER_RATE, settings.RATE_LIMIT_USER_BURST
+        else:
+            rate, burst = settings.RATE_LIMIT_IP_RATE, settings.RATE_LIMIT_IP_BURST
+        if rate <= 0:
+            return 0.0
+        cost = settings.RATE_LIMIT_SEARCH_COST if route_class == "search" else 1.0
+        wait = await self.backend.take(key, rate, max(burst, cost), cost)
+        if wait > 0:
+            self.rate_limited += 1
+        return wait
+
+    def acquire(self, route_class: str) -> bool:
+        limit = self.limits[route_class]
+        if limit > 0 and self.in_flight[route_class] >= limit:
+            self.overloaded[route_class] += 1
+            return False
+        self.in_flight[route_class] += 1
+        return True
+
+    def release(self, route_class: str) -> None:
+        self.in_flight[route_class] -= 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "classes": {
+                name: {"limit": limit, "in_flight": self.in_flight[name], "rejected": self.overloaded[name]}
+                for name, limit in self.limits.items()
+            },
+            "rate_limited": self.rate_limited,
+            **self.backend.snapshot(),
+        }
+
+
+async def _reject(send, status: int, detail: str, retry_after: float) -> None:
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    """ASGI middleware that applies AdmissionController before the request reaches
+    routing: 429 when the client's token bucket is empty, 503 when the route class
+    has no free slot. Both carry Retry-After."""
+
+    def __init__(self, app, controller: Optional[AdmissionController] = None):
+        self.app = app
+        self.controller = controller or AdmissionController(create_rate_limit_backend())
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        # CORS preflights are answered by CORSMiddleware without touching the app
+        if (
+            scope["type"] != "http"
+            or scope["method"] == "OPTIONS"
+            or path == "/"
+            or path.startswith(EXEMPT_PREFIXES)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        controller = self.controller
+        route_class = controller.classify(scope["method"], path, scope.get("query_string", b""))
+        wait = await controller.check_rate(controller.client_key(scope), route_class)
+        if wait > 0:
+            await _reject(send, 429, "Too many requests, please slow down", wait)
+            return
+        if not controller.acquire(route_class):
+            await _reject(send, 503, "Server is busy, please retry shortly", 1)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controller.release(route_class)
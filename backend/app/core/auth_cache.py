@@ -0,0 +1,92 @@
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.core.epoch import EpochFile
+from app.core.metrics import metrics
+from app.models.user import UserRole
+
+
+@dataclass(frozen=True)
+class AuthUser:
+    """The slice of a user row needed to authorize a request.
+
+    Dependencies in app/api/deps.py return this instead of a ``User`` ORM object;
+    endpoints that need the full row (email, timestamps) or want to modify it load
+    it by ``id``.
+    """
+
+    id: int
+    username: str
+    role: UserRole
+    is_active: bool
+
+
+class AuthUserCache:
+    """TTL cache of ``AuthUser`` keyed by token subject (the username).
+
+    Invalidation is shared between worker processes through an epoch file: any
+    change to a user's username, role or status replaces the file, and every worker
+    stats it on lookup and drops its whole cache when it has changed. A stat is far
+    cheaper than the users query it saves, and such changes are rare admin actions.
+    """
+
+    def __init__(self, ttl: float, max_entries: int, epoch_path: Path):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.epoch = EpochFile(epoch_path)
+        self._entries: Dict[str, Tuple[float, AuthUser]] = {}
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        metrics.register_collector("auth_cache", self.snapshot)
+
+    def _check_epoch(self) -> None:
+        if self.epoch.changed():
+            with self._lock:
+                self._entries.clear()
+
+    def get(self, subject: str) -> Optional[AuthUser]:
+        if self.ttl <= 0:
+            return None
+        self._check_epoch()
+        entry = self._entries.get(subject)
+        if entry is None or entry[0] < time.monotonic():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1]
+
+    def put(self, subject: str, user: AuthUser) -> None:
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            if subject not in self._entries and len(self._entries) >= self.max_entries:
+                # Dicts keep insertion order: evict the oldest entry
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[subject] = (time.monotonic() + self.ttl, user)
+
+    def invalidate(self) -> None:
+        """Drop cached users in this process and signal the other workers to do the same."""
+        with self._lock:
+            self._entries.clear()
+        self.epoch.bump()
+
+    def snapshot(self) -> Dict[str, object]:
+        return {
+            "size": len(self._entries),
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# Global singleton instance
+auth_cache = AuthUserCache(
+    ttl=settings.AUTH_CACHE_TTL_SECONDS,
+    max_entries=settings.AUTH_CACHE_MAX_ENTRIES,
+    epoch_path=Path(settings.AUTH_CACHE_EPOCH_PATH),
+)
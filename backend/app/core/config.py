@@ -9,11 +9,98 @@ class Settings(BaseSettings):
     
     # Database
     DATABASE_URL: str = "sqlite:///./gallery.db"
+    # Request sessions: "auto" uses the async driver (aiosqlite/asyncpg) when installed and
+    # otherwise runs a sync session in the threadpool; "async" / "threadpool" force one
+    DATABASE_ASYNC_MODE: str = "auto"
+    # Optional read replica for read-only endpoints (same kind of database as DATABASE_URL);
+    # clients that wrote within READ_YOUR_WRITES_SECONDS keep reading from the primary
+    DATABASE_READ_URL: Optional[str] = None
+    READ_YOUR_WRITES_SECONDS: float = 5.0
+    # SQLite pragmas applied on every connection (tuned for several workers sharing one file)
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    SQLITE_CACHE_SIZE_KB: int = 64 * 1024
+    # Connection pool for server databases (PostgreSQL); per engine and per worker process.
+    # Pre-ping and recycle drop connections closed by the server or a proxy while idle
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE_SECONDS: int = 1800
+    DB_POOL_PRE_PING: bool = True
     
     # Security
     SECRET_KEY: str = "your-secret-key-here"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    # Decoded claims of verified tokens, kept until they expire (0 disables)
+    TOKEN_CACHE_MAX_ENTRIES: int = 10000
+    
+    # Password hashing: bcrypt cost (existing hashes are upgraded on login) and the
+    # dedicated pool it runs on; requests beyond workers + queue limit get a 429
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_QUEUE_LIMIT: int = 32
+    
+    # Cache of the user fields needed for authorization, keyed by token subject (0 disables)
+    AUTH_CACHE_TTL_SECONDS: float = 30.0
+    AUTH_CACHE_MAX_ENTRIES: int = 10000
+    # Replaced whenever a user's role, status or username changes; workers on this host
+    # watch it to drop their caches. Multi-host deployments should put it on shared storage
+    AUTH_CACHE_EPOCH_PATH: str = "./auth_cache.epoch"
+    
+    # Tag typeahead index (app/services/tag_index.py): full reload interval, which also
+    # refreshes usage counts (0 reloads only on tag changes), and the file other workers
+    # watch to reload after a tag is created, renamed or deleted
+    TAG_SUGGEST_REFRESH_SECONDS: float = 300.0
+    TAG_SUGGEST_EPOCH_PATH: str = "./tag_index.epoch"
+    # Related tags (GET /tags/{id}/related): how long a tag's top co-occurring tags are
+    # cached, and for how many tags (0 disables)
+    RELATED_TAGS_CACHE_SECONDS: float = 60.0
+    RELATED_TAGS_CACHE_MAX_ENTRIES: int = 10000
+    
+    # Admission control (app/core/admission.py): token buckets per user (authenticated) or
+    # per IP (anonymous), in tokens/second and burst size; searches cost more than reads.
+    # A rate of 0 disables that limit
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_USER_RATE: float = 20.0
+    RATE_LIMIT_USER_BURST: float = 60.0
+    RATE_LIMIT_IP_RATE: float = 10.0
+    RATE_LIMIT_IP_BURST: float = 40.0
+    RATE_LIMIT_SEARCH_COST: float = 4.0
+    # "memory" (per worker) or "redis" (shared; needs the redis package)
+    RATE_LIMIT_BACKEND: str = "memory"
+    RATE_LIMIT_REDIS_URL: Optional[str] = None
+    RATE_LIMIT_MAX_KEYS: int = 100000  # buckets kept by the memory backend
+    # Header carrying the client address when behind a proxy (e.g. "X-Real-IP" from nginx)
+    RATE_LIMIT_CLIENT_IP_HEADER: Optional[str] = None
+    # Requests each worker runs at once per route class (0 = unlimited); beyond it, 503
+    ADMISSION_READ_CONCURRENCY: int = 64
+    ADMISSION_SEARCH_CONCURRENCY: int = 8
+    ADMISSION_UPLOAD_CONCURRENCY: int = 16
+    ADMISSION_WRITE_CONCURRENCY: int = 16
+    ADMISSION_ADMIN_CONCURRENCY: int = 4
+    
+    # Logging and per-request tracing
+    LOG_LEVEL: str = "INFO"
+    TRACE_SERVER_TIMING: bool = True  # add a Server-Timing header to every response
+    TRACE_LOG_SAMPLE_RATE: float = 0.05  # fraction of ordinary requests logged
+    TRACE_SLOW_REQUEST_MS: float = 1000.0  # slower requests (and 5xx) are always logged
+    
+    # Storage backend: "alist" (Openlist/Alist server) or "local" (files on this host)
+    STORAGE_BACKEND: str = "alist"
+    LOCAL_STORAGE_ROOT: str = "./storage"
+    LOCAL_STORAGE_UPLOAD_PATH: str = "/gallery"
+    # When set (e.g. "/_storage"), file requests are answered with X-Accel-Redirect to this
+    # internal nginx location so nginx serves the file with sendfile
+    LOCAL_STORAGE_ACCEL_REDIRECT: Optional[str] = None
+    
+    # Storage reconciliation job progress (see app/services/reconcile.py)
+    RECONCILE_CHECKPOINT_PATH: str = "./reconcile_checkpoint.json"
+    # delete_missing refuses to run when more than this fraction of the rows scanned
+    # have no file (a misconfigured or unmounted store), unless forced
+    RECONCILE_MAX_MISSING_FRACTION: float = 0.5
     
     # Openlist/Alist
     ALIST_URL: Optional[str] = None
@@ -22,6 +109,16 @@ class Settings(BaseSettings):
     ALIST_TOKEN: Optional[str] = None
     ALIST_UPLOAD_PATH: str = "/gallery"
     
+    # Openlist/Alist resilience policy
+    ALIST_DEADLINE_SECONDS: float = 10.0  # metadata calls: login, me, mkdir, remove, list
+    ALIST_TRANSFER_DEADLINE_SECONDS: float = 30.0  # uploads, including time queued for a slot
+    ALIST_MAX_ATTEMPTS: int = 3
+    ALIST_RETRY_BASE_DELAY: float = 0.2
+    ALIST_RETRY_MAX_DELAY: float = 2.0
+    ALIST_MAX_CONCURRENT_TRANSFERS: int = 8
+    ALIST_CIRCUIT_FAILURE_THRESHOLD: int = 5
+    ALIST_CIRCUIT_RESET_SECONDS: float = 30.0
+    
     model_config = SettingsConfigDict(env_file=".env")
 
 
@@ -10,6 +10,9 @@ class ConfigStore:
     """Simple TOML-backed configuration store for runtime settings."""
 
     def __init__(self, config_path: Optional[Path] = None):
+        # CONFIG_TOML_PATH overrides the location (used by scripts that need an isolated store)
+        if config_path is None and os.environ.get("CONFIG_TOML_PATH"):
+            config_path = Path(os.environ["CONFIG_TOML_PATH"])
         # Default to backend/config.toml
         if config_path is None:
             # This file is located at backend/app/core/config_store.py
@@ -1,20 +1,339 @@
-from sqlalchemy import create_engine
+import importlib.util
+import math
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.sql.dml import UpdateBase
 from app.core.config import settings
+from app.core.tracing import instrument_engine
+
+IS_SQLITE = make_url(settings.DATABASE_URL).get_backend_name() == "sqlite"
+
+
+def insert_ignore(table):
+    """INSERT that skips rows conflicting with a unique constraint, in the dialect of
+    DATABASE_URL (ON CONFLICT DO NOTHING, or INSERT IGNORE on MySQL)."""
+    backend = make_url(settings.DATABASE_URL).get_backend_name()
+    if backend == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+        return insert(table).prefix_with("IGNORE")
+    if backend == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table).on_conflict_do_nothing()
+
+
+# Collation that orders strings by code point, per backend (SQLite's default already does)
+_BINARY_COLLATIONS = {
+    "postgresql": "C",
+    "mysql": "utf8mb4_bin",
+}
+
+
+def binary_collated(column):
+    """``column`` compared and ordered by code point, as Python compares str, instead of
+    by the database's (possibly locale-aware) default collation."""
+    collation = _BINARY_COLLATIONS.get(make_url(settings.DATABASE_URL).get_backend_name())
+    return column.collate(collation) if collation else column
+
+
+def configure_sqlite(engine: Engine) -> None:
+    """Apply the SQLITE_* pragmas to every new connection of ``engine``.
+
+    WAL lets readers run alongside the single writer, synchronous=NORMAL is durable in
+    WAL mode short of power loss, and busy_timeout makes writers wait for the lock
+    instead of failing with "database is locked".
+    """
+    pragmas = [
+        f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}",
+        f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}",
+        f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}",
+        f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}",
+        # Negative values are KiB rather than pages
+        f"PRAGMA cache_size={-int(settings.SQLITE_CACHE_SIZE_KB)}",
+    ]
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+
+
+def engine_options(url: str) -> Dict[str, Any]:
+    """Keyword arguments for ``create_engine`` / ``create_async_engine``.
+
+    SQLite keeps SQLAlchemy's default pool (connections are cheap and the file has a
+    single writer); server databases get a sized pool with pre-ping and recycling.
+    """
+    if make_url(url).get_backend_name() == "sqlite":
+        return {}
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
+def _create_engine(url: str) -> Engine:
+    sqlite = make_url(url).get_backend_name() == "sqlite"
+    sync_engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False} if sqlite else {},
+        **engine_options(url)
+    )
+    instrument_engine(sync_engine)
+    if sqlite:
+        configure_sqlite(sync_engine)
+    return sync_engine
+
 
-engine = create_engine(
-    settings.DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {}
-)
+# Synchronous engine: startup, scripts, and the threadpool fallback for requests
+engine = _create_engine(settings.DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+# Async driver to use for each backend when DATABASE_URL names a sync one
+_ASYNC_DRIVERS = {
+    "sqlite": "aiosqlite",
+    "postgresql": "asyncpg",
+    "mysql": "aiomysql",
+}
+
+
+def async_database_url(url: str) -> Optional[str]:
+    """``url`` rewritten for its async driver, or None if that driver is not installed."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    driver = _ASYNC_DRIVERS.get(backend)
+    if driver is None:
+        return None
+    if parsed.get_driver_name() == driver:
+        return url
+    if importlib.util.find_spec(driver) is None:
+        return None
+    return parsed.set(drivername=f"{backend}+{driver}").render_as_string(hide_password=False)
+
+
+class ThreadpoolSession:
+    """The subset of the AsyncSession API the endpoints use, implemented by running a
+    regular Session in the threadpool. Used when no async driver is available, so the
+    endpoints are written once against the async API and never block the event loop.
+    """
+
+    def __init__(self, session: Session):
+        self.sync_session = session
+
+    async def __aenter__(self) -> "ThreadpoolSession":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def run_sync(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        return await run_in_threadpool(fn, self.sync_session, *args, **kwargs)
+
+    async def execute(self, statement, *args, **kwargs):
+        return await run_in_threadpool(self.sync_session.execute, statement, *args, **kwargs)
+
+    async def scalar(self, statement, *args, **kwargs):
+        return await run_in_threadpool(self.sync_session.scalar, statement, *args, **kwargs)
+
+    async def scalars(self, statement, *args, **kwargs):
+        return await run_in_threadpool(self.sync_session.scalars, statement, *args, **kwargs)
+
+    async def get(self, entity, ident, **kwargs):
+        return await run_in_threadpool(self.sync_session.get, entity, ident, **kwargs)
+
+    async def refresh(self, instance, attribute_names=None) -> None:
+        await run_in_threadpool(self.sync_session.refresh, instance, attribute_names)
+
+    async def delete(self, instance) -> None:
+        await run_in_threadpool(self.sync_session.delete, instance)
+
+    async def flush(self) -> None:
+        await run_in_threadpool(self.sync_session.flush)
+
+    async def commit(self) -> None:
+        await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self) -> None:
+        await run_in_threadpool(self.sync_session.rollback)
+
+    async def close(self) -> None:
+        await run_in_threadpool(self.sync_session.close)
+
+    def add(self, instance) -> None:
+        self.sync_session.add(instance)
 
-def get_db():
-    db = SessionLocal()
-    try:
+    def add_all(self, instances) -> None:
+        self.sync_session.add_all(instances)
+
+
+class RoutingSession(Session):
+    """Session for read-only endpoints: queries go to the replica, while flushes and
+    INSERT/UPDATE/DELETE statements still go to the primary. ``force_primary`` sends
+    everything to the primary (read-your-writes).
+    """
+
+    def __init__(self, primary: Engine, replica: Engine, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.primary = primary
+        self.replica = replica
+        self.force_primary = False
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.force_primary or self._flushing or isinstance(clause, UpdateBase):
+            return self.primary
+        return self.replica
+
+
+def _async_url(url: str) -> Optional[str]:
+    """Async driver URL for ``url``, or None to use the threadpool fallback."""
+    mode = settings.DATABASE_ASYNC_MODE
+    async_url = async_database_url(url) if mode != "threadpool" else None
+    if async_url is None and mode == "async":
+        raise RuntimeError(f"No async driver installed for {make_url(url).get_backend_name()}")
+    return async_url
+
+
+def _create_async_engine(url: str) -> AsyncEngine:
+    async_engine = create_async_engine(url, **engine_options(url))
+    instrument_engine(async_engine.sync_engine)
+    if make_url(url).get_backend_name() == "sqlite":
+        configure_sqlite(async_engine.sync_engine)
+    return async_engine
+
+
+def _create_async_session_factory():
+    url = _async_url(settings.DATABASE_URL)
+    if url is None:
+        threadpool_sessions = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+        return None, lambda: ThreadpoolSession(threadpool_sessions())
+    async_engine = _create_async_engine(url)
+    # Objects are returned from endpoints after commit; expiring them would force a
+    # lazy load outside the session's greenlet
+    return async_engine, async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+# None when running in threadpool mode
+async_engine, AsyncSessionLocal = _create_async_session_factory()
+
+
+def _create_read_session_factory():
+    if not settings.DATABASE_READ_URL:
+        return None, None, AsyncSessionLocal
+    read_engine = _create_engine(settings.DATABASE_READ_URL)
+    if async_engine is None:
+        read_sessions = sessionmaker(
+            class_=RoutingSession, primary=engine, replica=read_engine,
+            autoflush=False, expire_on_commit=False,
+        )
+        return read_engine, None, lambda: ThreadpoolSession(read_sessions())
+    url = async_database_url(settings.DATABASE_READ_URL)
+    if url is None:
+        raise RuntimeError("DATABASE_READ_URL must use the same kind of database as DATABASE_URL")
+    read_async_engine = _create_async_engine(url)
+    return read_engine, read_async_engine, async_sessionmaker(
+        sync_session_class=RoutingSession,
+        primary=async_engine.sync_engine,
+        replica=read_async_engine.sync_engine,
+        autoflush=False,
+        expire_on_commit=False,
+    )
+
+
+# Replica engines are None (and reads use the primary) unless DATABASE_READ_URL is set
+read_engine, read_async_engine, AsyncReadSessionLocal = _create_read_session_factory()
+
+
+def _track_writes() -> None:
+    """Set ``session.info["wrote"]`` once a session commits a flush or DML statement."""
+
+    @event.listens_for(Session, "after_flush")
+    def _flushed(session, flush_context):
+        session.info["pending_write"] = True
+
+    @event.listens_for(Session, "do_orm_execute")
+    def _executed(orm_execute_state):
+        if not orm_execute_state.is_select:
+            orm_execute_state.session.info["pending_write"] = True
+
+    @event.listens_for(Session, "after_commit")
+    def _committed(session):
+        if session.info.pop("pending_write", False):
+            session.info["wrote"] = True
+
+    @event.listens_for(Session, "after_rollback")
+    def _rolled_back(session):
+        session.info.pop("pending_write", None)
+
+
+if read_engine is not None:
+    _track_writes()
+
+
+async def get_db(request: Request) -> AsyncIterator[AsyncSession]:
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
+        if read_engine is not None and db.sync_session.info.get("wrote"):
+            # Picked up by ReadYourWritesMiddleware (dependency exit runs before the response)
+            request.state.db_wrote = True
+
+
+async def get_read_db(request: Request) -> AsyncIterator[AsyncSession]:
+    """Session for read-only endpoints, served by the replica when one is configured.
+
+    Clients that committed a write within READ_YOUR_WRITES_SECONDS carry the
+    READ_YOUR_WRITES_COOKIE and are served by the primary, so they see their own
+    changes despite replication lag.
+    """
+    async with AsyncReadSessionLocal() as db:
+        if read_engine is not None and request.cookies.get(READ_YOUR_WRITES_COOKIE):
+            db.sync_session.force_primary = True
+        yield db
+
+
+READ_YOUR_WRITES_COOKIE = "db_primary"
+
+
+class ReadYourWritesMiddleware:
+    """ASGI middleware that sets a short-lived READ_YOUR_WRITES_COOKIE on responses to
+    requests that committed a write. The cookie works across workers and hosts, unlike
+    per-process state; installed only when DATABASE_READ_URL is set.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.cookie = (
+            f"{READ_YOUR_WRITES_COOKIE}=1; Max-Age={max(1, math.ceil(settings.READ_YOUR_WRITES_SECONDS))}; "
+            f"Path=/; HttpOnly; SameSite=Lax"
+        ).encode("latin-1")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start" and scope.get("state", {}).get("db_wrote"):
+                headers = list(message.get("headers", []))
+                headers.append((b"set-cookie", self.cookie))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
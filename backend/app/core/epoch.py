@@ -0,0 +1,42 @@
+import os
+import uuid
+from pathlib import Path
+from typing import Optional, Tuple
+
+
+class EpochFile:
+    """Change marker shared by the worker processes on a host (or hosts sharing the
+    path): ``bump`` replaces the file, and ``changed`` tells a worker whether it has
+    been replaced since the worker last looked. Checking costs one stat."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._seen = self._read()
+
+    def _read(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    def changed(self) -> bool:
+        epoch = self._read()
+        if epoch == self._seen:
+            return False
+        self._seen = epoch
+        return True
+
+    def bump(self) -> None:
+        """Signal the other workers; this process does not see its own bump as a change."""
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # Replacing the file changes its inode as well as its mtime, so two bumps
+            # within the filesystem's timestamp resolution are still seen
+            tmp = self.path.with_name(f"{self.path.name}.{uuid.uuid4().hex}")
+            tmp.write_text(uuid.uuid4().hex, encoding="utf-8")
+            tmp.replace(self.path)
+        except OSError:
+            # Other workers fall back to their TTL
+            pass
+        self._seen = self._read()
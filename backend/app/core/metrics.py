@@ -0,0 +1,38 @@
+from collections import defaultdict
+from threading import Lock
+from typing import Any, Callable, Dict
+
+
+class MetricsRegistry:
+    """Minimal in-process metrics: monotonic counters plus named snapshot collectors.
+
+    Collectors are callables returning a JSON-serialisable dict; they let components
+    such as the storage circuit breaker expose live state without pushing updates.
+    """
+
+    def __init__(self):
+        self._counters: Dict[str, int] = defaultdict(int)
+        self._collectors: Dict[str, Callable[[], Dict[str, Any]]] = {}
+        self._lock = Lock()
+
+    def inc(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def register_collector(self, name: str, collector: Callable[[], Dict[str, Any]]) -> None:
+        self._collectors[name] = collector
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+        collected: Dict[str, Any] = {}
+        for name, collector in self._collectors.items():
+            try:
+                collected[name] = collector()
+            except Exception as e:
+                collected[name] = {"error": str(e)}
+        return {"counters": counters, **collected}
+
+
+# Global singleton instance
+metrics = MetricsRegistry()
@@ -1,10 +1,19 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from threading import Lock
+from typing import Any, Callable, Dict, Optional, Set, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from app.core.config import settings
+from app.core.metrics import metrics
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Hashes made with a different cost than BCRYPT_ROUNDS are flagged by needs_update()
+# and replaced on the user's next successful login
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -19,6 +28,83 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify a password; also return a new hash if the stored one uses outdated settings."""
+    plain_password = plain_password[:72] if isinstance(plain_password, str) else plain_password
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+class PasswordHashingBusyError(Exception):
+    """Too many password hashes are queued; clients should retry later."""
+
+    def __init__(self, retry_after: float = 1.0):
+        super().__init__("Too many authentication requests, please retry shortly")
+        self.retry_after = max(1, int(retry_after + 0.999))
+
+
+class PasswordHasher:
+    """Runs bcrypt on a small dedicated thread pool so it never blocks the event loop.
+
+    bcrypt releases the GIL, so the pool's threads hash in parallel with request handling.
+    At most ``workers + queue_limit`` hashes are admitted at once; further callers get
+    PasswordHashingBusyError instead of piling up behind a burst of logins.
+    """
+
+    def __init__(self, workers: int, queue_limit: int):
+        self.workers = max(1, workers)
+        self.queue_limit = max(0, queue_limit)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending = 0
+        self._avg_seconds = 0.25
+        self.completed = 0
+        self.rejected = 0
+        metrics.register_collector("password_hashing", self.snapshot)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        if self._pending >= self.workers + self.queue_limit:
+            self.rejected += 1
+            raise PasswordHashingBusyError(self._pending * self._avg_seconds / self.workers)
+        self._pending += 1
+        started = time.perf_counter()
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self._pending -= 1
+        # Moving average of the hash cost, used for Retry-After
+        self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * (time.perf_counter() - started)
+        self.completed += 1
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self.run(get_password_hash, password)
+
+    async def verify_and_update(self, plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        return await self.run(verify_and_update_password, plain_password, hashed_password)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "queue_limit": self.queue_limit,
+            "pending": self._pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_ms": round(self._avg_seconds * 1000, 1),
+            "rounds": settings.BCRYPT_ROUNDS,
+        }
+
+
+# Global singleton instance
+password_hasher = PasswordHasher(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    queue_limit=settings.PASSWORD_HASH_QUEUE_LIMIT,
+)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -30,9 +116,107 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
+class VerifiedTokenCache:
+    """LRU of decoded JWT claims keyed by a digest of the token, kept until ``exp``.
+
+    Clients send the same token for its whole lifetime, so this skips the signature
+    check on all but the first request. Entries are dropped when SECRET_KEY or
+    ALGORITHM changes, and ``revoke_subject`` evicts a user's tokens. A cached token
+    still goes through the user lookup in app/api/deps.py, so a deactivated user is
+    refused by every worker even before its entries are evicted there.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[bytes, Tuple[float, dict]]" = OrderedDict()
+        self._by_subject: Dict[str, Set[bytes]] = {}
+        self._signing_key = (settings.SECRET_KEY, settings.ALGORITHM)
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        metrics.register_collector("token_cache", self.snapshot)
+
+    @staticmethod
+    def _digest(token: str) -> bytes:
+        return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+    def _check_signing_key(self) -> None:
+        signing_key = (settings.SECRET_KEY, settings.ALGORITHM)
+        if signing_key != self._signing_key:
+            self.clear()
+            self._signing_key = signing_key
+
+    def _pop(self, digest: bytes) -> None:
+        entry = self._entries.pop(digest, None)
+        if entry is not None:
+            subject = entry[1].get("sub")
+            digests = self._by_subject.get(subject)
+            if digests is not None:
+                digests.discard(digest)
+                if not digests:
+                    del self._by_subject[subject]
+
+    def get(self, token: str) -> Optional[dict]:
+        if self.max_entries <= 0:
+            return None
+        self._check_signing_key()
+        digest = self._digest(token)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None or entry[0] <= time.time():
+                if entry is not None:
+                    self._pop(digest)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, token: str, claims: dict) -> None:
+        expires = claims.get("exp")
+        # Tokens without an expiry are not created by this app; always verify them
+        if self.max_entries <= 0 or not isinstance(expires, (int, float)):
+            return
+        digest = self._digest(token)
+        with self._lock:
+            self._pop(digest)
+            while len(self._entries) >= self.max_entries:
+                self._pop(next(iter(self._entries)))
+            self._entries[digest] = (float(expires), claims)
+            self._by_subject.setdefault(claims.get("sub"), set()).add(digest)
+
+    def revoke_subject(self, subject: str) -> None:
+        """Evict every cached token issued to ``subject`` (e.g. on deactivation)."""
+        with self._lock:
+            for digest in list(self._by_subject.get(subject, ())):
+                self._pop(digest)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_subject.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# Global singleton instance
+token_cache = VerifiedTokenCache(max_entries=settings.TOKEN_CACHE_MAX_ENTRIES)
+
+
 def verify_token(token: str) -> Optional[dict]:
+    """Decoded claims of a valid, unexpired token, or None."""
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        return payload
     except JWTError:
-        return None
\ No newline at end of file
+        return None
+    token_cache.put(token, payload)
+    return payload
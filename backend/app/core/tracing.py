@@ -0,0 +1,253 @@
+import asyncio
+import functools
+import json
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.core.config import settings
+
+logger = logging.getLogger("app.request")
+
+# Attributes every LogRecord has; anything else passed via ``extra`` is a structured field
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: timestamp, level, logger, message plus any ``extra`` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload: Dict[str, Any] = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+def setup_logging() -> None:
+    """Route the app's loggers through a single JSON handler at LOG_LEVEL."""
+    app_logger = logging.getLogger("app")
+    if any(isinstance(h.formatter, JsonFormatter) for h in app_logger.handlers):
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter())
+    app_logger.addHandler(handler)
+    app_logger.setLevel(settings.LOG_LEVEL.upper())
+    app_logger.propagate = False
+
+
+class RequestTrace:
+    """Accumulated span durations for one request, keyed by span name."""
+
+    __slots__ = ("started", "spans", "endpoint_started", "endpoint_finished")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: Dict[str, List[float]] = {}
+        self.endpoint_started: Optional[float] = None
+        self.endpoint_finished: Optional[float] = None
+
+    def add(self, name: str, duration: float) -> None:
+        entry = self.spans.get(name)
+        if entry is None:
+            self.spans[name] = [duration, 1]
+        else:
+            entry[0] += duration
+            entry[1] += 1
+
+    def items(self) -> List[Tuple[str, float, int]]:
+        return [(name, total, int(count)) for name, (total, count) in self.spans.items()]
+
+    def server_timing(self, total: float) -> str:
+        parts = []
+        for name, duration, count in self.items():
+            part = f"{name};dur={duration * 1000:.1f}"
+            if count > 1:
+                part += f';desc="x{count}"'
+            parts.append(part)
+        parts.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Time a block (sync or async code) into the current request's trace, if any."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, time.perf_counter() - started)
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Record every cursor execution on ``engine`` as a ``db`` span."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("trace_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["trace_query_start"].pop()
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add("db", time.perf_counter() - started)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        conn = context.connection
+        if conn is not None and conn.info.get("trace_query_start"):
+            conn.info["trace_query_start"].pop()
+
+
+def _timed_endpoint(call: Callable) -> Callable:
+    if getattr(call, "_is_timed", False):
+        return call
+
+    if asyncio.iscoroutinefunction(call):
+        @functools.wraps(call)
+        async def wrapper(*args, **kwargs):
+            trace = _current_trace.get()
+            if trace is not None:
+                trace.endpoint_started = time.perf_counter()
+            try:
+                return await call(*args, **kwargs)
+            finally:
+                if trace is not None:
+                    trace.endpoint_finished = time.perf_counter()
+    else:
+        @functools.wraps(call)
+        def wrapper(*args, **kwargs):
+            trace = _current_trace.get()
+            if trace is not None:
+                trace.endpoint_started = time.perf_counter()
+            try:
+                return call(*args, **kwargs)
+            finally:
+                if trace is not None:
+                    trace.endpoint_finished = time.perf_counter()
+
+    wrapper._is_timed = True
+    return wrapper
+
+
+class TimedRoute(APIRoute):
+    """APIRoute that splits request handling into ``deps`` (parsing, validation and
+    dependencies), ``handler`` (the endpoint body) and ``serialize`` (response_model
+    validation and JSON encoding) spans."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The request handler built in super().__init__ looks up dependant.call per request
+        self.dependant.call = _timed_endpoint(self.dependant.call)
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            trace = _current_trace.get()
+            if trace is None:
+                return await handler(request)
+            started = time.perf_counter()
+            response = await handler(request)
+            finished = time.perf_counter()
+            if trace.endpoint_started is not None and trace.endpoint_finished is not None:
+                trace.add("deps", trace.endpoint_started - started)
+                trace.add("handler", trace.endpoint_finished - trace.endpoint_started)
+                trace.add("serialize", finished - trace.endpoint_finished)
+            return response
+
+        return timed_handler
+
+
+class TimingMiddleware:
+    """ASGI middleware that opens a RequestTrace per HTTP request, adds a Server-Timing
+    header and emits one sampled structured log line per request.
+
+    Requests that fail (5xx) or exceed TRACE_SLOW_REQUEST_MS are always logged, at
+    WARNING; the rest are logged at INFO with probability TRACE_LOG_SAMPLE_RATE.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace()
+        token = _current_trace.set(trace)
+        status_code = 500
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if settings.TRACE_SERVER_TIMING:
+                    total = time.perf_counter() - trace.started
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", trace.server_timing(total).encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_trace.reset(token)
+            self._log(scope, trace, status_code)
+
+    @staticmethod
+    def _log(scope, trace: RequestTrace, status_code: int) -> None:
+        duration_ms = (time.perf_counter() - trace.started) * 1000
+        slow = duration_ms >= settings.TRACE_SLOW_REQUEST_MS
+        if status_code >= 500 or slow:
+            level = logging.WARNING
+        elif random.random() < settings.TRACE_LOG_SAMPLE_RATE:
+            level = logging.INFO
+        else:
+            return
+        if not logger.isEnabledFor(level):
+            return
+        route = scope.get("route")
+        logger.log(
+            level,
+            "request",
+            extra={
+                "method": scope.get("method"),
+                "path": scope.get("path"),
+                "route": getattr(route, "path", None),
+                "status": status_code,
+                "duration_ms": round(duration_ms, 2),
+                "slow": slow,
+                "spans": {
+                    name: {"ms": round(duration * 1000, 2), "count": count}
+                    for name, duration, count in trace.items()
+                },
+            },
+        )
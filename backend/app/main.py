@@ -2,15 +2,23 @@ from pydantic import BaseModel, ConfigDict
 # Silence Pydantic warnings for fields starting with "model_" (e.g., model_id)
 BaseModel.model_config = ConfigDict(protected_namespaces=())
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from app.core.config import settings
+from app.core.tracing import TimingMiddleware, setup_logging
+from app.core.admission import AdmissionMiddleware
 from app.api.v1.api import api_router
-from app.core.database import Base, engine
-from app.utils.init_db import init_db
+from app.core.database import ReadYourWritesMiddleware, async_engine, engine, read_async_engine, read_engine
+from app.utils.init_db import initialize_database
+from app.core.security import PasswordHashingBusyError
+from app.services.resilience import StorageUnavailableError
 # Import all models to register them with SQLAlchemy
 from app.models import User, Image, Category, Tag, Model, VersionHistory, KeyValueParameter
 
+setup_logging()
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
     version=settings.VERSION,
@@ -19,18 +27,52 @@ app = FastAPI(
 
 @app.on_event("startup")
 async def startup_event():
-    # Create all database tables
-    Base.metadata.create_all(bind=engine)
-    # Initialize default data
-    init_db()
+    # Create tables and seed default data (once, under a cross-process lock)
+    await run_in_threadpool(initialize_database)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    for pool in (async_engine, read_async_engine):
+        if pool is not None:
+            await pool.dispose()
+    if read_engine is not None:
+        read_engine.dispose()
+    # Closing every SQLite connection checkpoints the WAL back into the database file
+    engine.dispose()
+
+@app.exception_handler(PasswordHashingBusyError)
+async def password_hashing_busy_handler(request: Request, exc: PasswordHashingBusyError):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(StorageUnavailableError)
+async def storage_unavailable_handler(request: Request, exc: StorageUnavailableError):
+    # Fail fast while the storage backend is unhealthy instead of tying up the worker
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
+# Inside CORS so rejections still carry CORS headers the browser can read
+if settings.RATE_LIMIT_ENABLED:
+    app.add_middleware(AdmissionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:4321", "http://localhost:3000"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "Retry-After"],
 )
+if settings.DATABASE_READ_URL:
+    app.add_middleware(ReadYourWritesMiddleware)
+# Outermost, so the total covers CORS and error handling as well
+app.add_middleware(TimingMiddleware)
 
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
@@ -1,15 +1,20 @@
 from .user import User
-from .image import Image, VersionHistory, KeyValueParameter
+from .image import Image, VersionHistory, KeyValueParameter, ParameterValueStat
 from .category import Category
-from .tag import Tag
+from .tag import Tag, TagCooccurrence
 from .model import Model
+from .custom_label import CustomModel, CustomCategory
 
 __all__ = [
     "User",
     "Image",
     "Category",
     "Tag",
+    "TagCooccurrence",
     "Model",
     "VersionHistory",
     "KeyValueParameter",
+    "ParameterValueStat",
+    "CustomModel",
+    "CustomCategory",
 ]
\ No newline at end of file
@@ -0,0 +1,27 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+
+class CustomModel(Base):
+    """A free-text model name users entered instead of picking from ``models``.
+
+    Names that differ only in case or whitespace share one row: ``key`` is the
+    normalized, case-folded form and ``name`` the first spelling seen.
+    """
+    __tablename__ = "custom_models"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(100), nullable=False)
+    key = Column(String(100), unique=True, index=True, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class CustomCategory(Base):
+    """A free-text category name; see CustomModel."""
+    __tablename__ = "custom_categories"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(100), nullable=False)
+    key = Column(String(100), unique=True, index=True, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
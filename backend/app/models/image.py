@@ -1,7 +1,10 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Boolean
-from sqlalchemy.orm import relationship
+import math
+import re
+from typing import Optional, Tuple
+from sqlalchemy import Column, DDL, Integer, Float, String, DateTime, ForeignKey, Index, Text, Boolean, UniqueConstraint, and_, event
+from sqlalchemy.orm import relationship, validates
 from sqlalchemy.sql import func
-from app.core.database import Base
+from app.core.database import Base, binary_collated
 from .tag import image_tags  # Import the association table
 
 
@@ -12,20 +15,27 @@ class Image(Base):
     prompt = Column(Text, nullable=False)
     negative_prompt = Column(Text, nullable=True)
     alist_url = Column(String(500), nullable=False)
-    file_path = Column(String(500), nullable=False)
+    file_path = Column(String(500), nullable=False, index=True)
     file_name = Column(String(255), nullable=False)
     file_size = Column(Integer, nullable=True)
     width = Column(Integer, nullable=True)
     height = Column(Integer, nullable=True)
     is_public = Column(Boolean, default=False, nullable=False)  # whether image is visible in public gallery
-    custom_model = Column(String(100), nullable=True)  # custom model name if user selects "other"
-    custom_category = Column(String(100), nullable=True)  # custom category name if user selects "other"
     
     # Foreign keys
     owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     model_id = Column(Integer, ForeignKey("models.id"), nullable=True)  # nullable to allow custom model
     category_id = Column(Integer, ForeignKey("categories.id"), nullable=True)  # nullable to allow custom category
-    parent_image_id = Column(Integer, ForeignKey("images.id"), nullable=True)
+    custom_model_id = Column(Integer, ForeignKey("custom_models.id"), nullable=True, index=True)  # if user selects "other"
+    custom_category_id = Column(Integer, ForeignKey("custom_categories.id"), nullable=True, index=True)  # if user selects "other"
+    parent_image_id = Column(Integer, ForeignKey("images.id"), nullable=True, index=True)
+    
+    # Materialized lineage, set once on upload: the first image of the version tree (the
+    # image itself for a root), the distance from it, and the ids from the root down to
+    # this image as "/1/5/12/". A subtree is a prefix range on path (see lineage_subtree)
+    root_image_id = Column(Integer, ForeignKey("images.id"), nullable=True)
+    depth = Column(Integer, default=0, server_default="0", nullable=False)
+    path = Column(Text, nullable=True)
     
     # Timestamps
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -35,11 +45,81 @@ class Image(Base):
     owner = relationship("User", back_populates="images")
     model = relationship("Model", back_populates="images")
     category = relationship("Category", back_populates="images")
-    parent_image = relationship("Image", remote_side=[id], back_populates="child_images")
-    child_images = relationship("Image", back_populates="parent_image")
+    # Always joined: small lookup rows, read through the custom_model/custom_category names
+    custom_model_entry = relationship("CustomModel", lazy="joined")
+    custom_category_entry = relationship("CustomCategory", lazy="joined")
+    parent_image = relationship("Image", remote_side=[id], foreign_keys=[parent_image_id], back_populates="child_images")
+    child_images = relationship("Image", foreign_keys=[parent_image_id], back_populates="parent_image")
     tags = relationship("Tag", secondary=image_tags, back_populates="images")
     parameters = relationship("KeyValueParameter", back_populates="image", cascade="all, delete-orphan")
     version_history = relationship("VersionHistory", foreign_keys="[VersionHistory.parent_image_id]", back_populates="parent_image")
+    
+    @property
+    def custom_model(self) -> Optional[str]:
+        """Custom model name, as entered by the first user who used it."""
+        return self.custom_model_entry.name if self.custom_model_entry else None
+    
+    @property
+    def custom_category(self) -> Optional[str]:
+        return self.custom_category_entry.name if self.custom_category_entry else None
+    
+    __table_args__ = (
+        # All versions of a lineage, and its newest one (always a leaf: children are
+        # created after their parent) as the last entry for the root
+        Index("ix_images_root_image_id_id", "root_image_id", "id"),
+        # Version tree pages, level by level
+        Index("ix_images_root_image_id_depth_id", "root_image_id", "depth", "id"),
+        Index("ix_images_path", "path"),
+        # lineage_subtree's range needs "/" to sort before the digits, which only a
+        # binary collation guarantees
+        Index("ix_images_path_binary", path.collate("C")).ddl_if(dialect="postgresql"),
+        # Storage reconciliation walks file_path in code point order (see
+        # app.services.reconcile); the default collation's index cannot serve that
+        Index("ix_images_file_path_binary", file_path.collate("C")).ddl_if(dialect="postgresql"),
+        # Trigram indexes serve the gallery's ILIKE '%term%' prompt search on PostgreSQL;
+        # other databases do not get them (a B-tree cannot help a leading wildcard)
+        Index(
+            "ix_images_prompt_trgm", "prompt",
+            postgresql_using="gin", postgresql_ops={"prompt": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+        Index(
+            "ix_images_negative_prompt_trgm", "negative_prompt",
+            postgresql_using="gin", postgresql_ops={"negative_prompt": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+    )
+
+
+def lineage_subtree(path: str):
+    """Condition matching the image with materialized ``path`` and all its descendants.
+
+    A range rather than LIKE so that every database can use ix_images_path: paths below
+    "/1/5/" all start with it and sort before "/1/50", the prefix with its trailing
+    "/" replaced by the next character. That needs "/" to sort before "0", so the
+    comparison uses a binary collation (ix_images_path_binary on PostgreSQL).
+    """
+    if not path:
+        raise ValueError("Image has no lineage path yet")
+    column = binary_collated(Image.path)
+    return and_(column >= path, column < path[:-1] + "0")
+
+
+def lineage_fields(image_id: int, parent: Optional["Image"] = None) -> dict:
+    """root_image_id, depth and path for image ``image_id`` created under ``parent``."""
+    if parent is None:
+        return {"root_image_id": image_id, "depth": 0, "path": f"/{image_id}/"}
+    return {
+        "root_image_id": parent.root_image_id,
+        "depth": parent.depth + 1,
+        "path": f"{parent.path}{image_id}/",
+    }
+
+
+# gin_trgm_ops comes from the pg_trgm extension, which must exist before the indexes
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
 
 
 class VersionHistory(Base):
@@ -60,6 +140,56 @@ class KeyValueParameter(Base):
     image_id = Column(Integer, ForeignKey("images.id", ondelete="CASCADE"), nullable=False)
     key = Column(String(100), nullable=False)
     value = Column(String(500), nullable=True)
+    # value typed for range filters: the number if it is one, the trimmed text otherwise
+    num_value = Column(Float, nullable=True)
+    text_value = Column(String(500), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
-    image = relationship("Image", back_populates="parameters")
\ No newline at end of file
+    image = relationship("Image", back_populates="parameters")
+    
+    __table_args__ = (
+        # Parameter filters select image ids by key and value range; image_id makes
+        # them index-only
+        Index("ix_key_value_parameters_key_num_value", "key", "num_value", "image_id"),
+        Index("ix_key_value_parameters_key_text_value", "key", "text_value", "image_id"),
+        Index("ix_key_value_parameters_image_id", "image_id"),
+    )
+    
+    @validates("value")
+    def _type_value(self, _, value):
+        self.num_value, self.text_value = typed_parameter_value(value)
+        return value
+
+
+_NUMBER = re.compile(r"[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?")
+
+
+def typed_parameter_value(value) -> Tuple[Optional[float], Optional[str]]:
+    """(num_value, text_value) for a parameter value: plain decimal numbers ("30",
+    "7.5", "-1e3") go to num_value, anything else, trimmed, to text_value."""
+    if value is None:
+        return None, None
+    text = str(value).strip()
+    if _NUMBER.fullmatch(text):
+        number = float(text)
+        if math.isfinite(number):
+            return number, None
+    return None, text
+
+
+class ParameterValueStat(Base):
+    """Number of parameters with each (key, value), behind GET /parameters/catalog.
+    Kept current by app.services.parameters on every write."""
+    __tablename__ = "parameter_value_stats"
+    
+    id = Column(Integer, primary_key=True)
+    key = Column(String(100), nullable=False)
+    value = Column(String(500), nullable=False)
+    num_value = Column(Float, nullable=True)
+    image_count = Column(Integer, default=0, server_default="0", nullable=False)
+    
+    __table_args__ = (
+        UniqueConstraint("key", "value", name="uq_parameter_value_stats_key_value"),
+        # Top values of a key
+        Index("ix_parameter_value_stats_key_image_count", "key", "image_count"),
+    )
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Table, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Table, ForeignKey, Boolean, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.core.database import Base
@@ -24,4 +24,20 @@ class Tag(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     owner = relationship("User", back_populates="tags")
-    images = relationship("Image", secondary=image_tags, back_populates="tags")
\ No newline at end of file
+    images = relationship("Image", secondary=image_tags, back_populates="tags")
+
+
+class TagCooccurrence(Base):
+    """Number of images carrying both ``tag_id`` and ``other_tag_id``, stored in both
+    directions; pairs that never co-occur have no row. Maintained by
+    app.services.related_tags whenever image_tags changes."""
+    __tablename__ = "tag_cooccurrence"
+    
+    tag_id = Column(Integer, ForeignKey("tags.id", ondelete="CASCADE"), primary_key=True)
+    other_tag_id = Column(Integer, ForeignKey("tags.id", ondelete="CASCADE"), primary_key=True, index=True)
+    image_count = Column(Integer, default=0, server_default="0", nullable=False)
+    
+    __table_args__ = (
+        # Most frequent companions of a tag
+        Index("ix_tag_cooccurrence_tag_id_image_count", "tag_id", "image_count"),
+    )
@@ -82,6 +82,8 @@ class ImageResponse(BaseModel):
     model_id: Optional[int] = None
     category_id: Optional[int] = None
     parent_image_id: Optional[int] = None
+    root_image_id: Optional[int] = None
+    depth: int = 0
     created_at: datetime
     updated_at: Optional[datetime] = None
     
@@ -92,6 +94,31 @@ class ImageResponse(BaseModel):
     parameters: List[KeyValueParameterResponse] = []
 
 
+class ImageLineageResponse(BaseModel):
+    image_id: int
+    root_image_id: int
+    depth: int
+    version_count: int  # images in the whole version tree
+    subtree_size: int  # this image and its descendants
+    latest_image_id: int  # newest version in the tree
+
+
+class VersionTreeNode(BaseModel):
+    id: int
+    parent_image_id: Optional[int] = None
+    depth: int
+    thumbnail_url: str
+    created_at: datetime
+    has_children: bool
+
+
+class VersionTreeResponse(BaseModel):
+    root_image_id: int
+    total: int  # images in the whole version tree
+    items: List[VersionTreeNode]
+    next_after: Optional[int] = None  # pass as ``after`` for the next page; None on the last
+
+
 class ImageListResponse(BaseModel):
     model_config = ConfigDict(protected_namespaces=())
     
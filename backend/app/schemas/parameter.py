@@ -0,0 +1,17 @@
+from pydantic import BaseModel
+from typing import List, Optional
+
+
+class ParameterValueCount(BaseModel):
+    value: str
+    image_count: int
+
+
+class ParameterCatalogEntry(BaseModel):
+    key: str
+    image_count: int  # parameters with this key
+    distinct_values: int
+    numeric: bool  # every value is a number, so range filters apply
+    min: Optional[float] = None
+    max: Optional[float] = None
+    values: List[ParameterValueCount] = []  # most common first
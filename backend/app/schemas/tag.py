@@ -1,5 +1,5 @@
 from pydantic import BaseModel, ConfigDict
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 
@@ -31,4 +31,32 @@ class TagResponse(TagBase):
     owner_id: Optional[int] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
-    image_count: Optional[int] = None
\ No newline at end of file
+    image_count: Optional[int] = None
+
+
+class TagSuggestion(BaseModel):
+    model_config = ConfigDict(from_attributes=True, protected_namespaces=())
+    
+    id: int
+    name: str
+    owner_id: Optional[int] = None
+    is_public: bool
+    image_count: int
+
+
+class RelatedTag(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())
+    
+    id: int
+    name: str
+    owner_id: Optional[int] = None
+    is_public: bool
+    image_count: int  # images carrying both tags
+
+
+
+class TagMerge(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())
+    
+    source_ids: List[int]  # tags to merge and delete
+    target_id: int
@@ -1,3 +1,10 @@
-from .alist_service import alist_service
+def __getattr__(name):
+    # alist_service pulls in httpx; load it only when something asks for it
+    if name == "alist_service":
+        from .alist_service import alist_service
 
-__all__ = ["alist_service"]
\ No newline at end of file
+        return alist_service
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+__all__ = ["alist_service"]
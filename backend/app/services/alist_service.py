@@ -1,12 +1,25 @@
+import asyncio
 import httpx
+import logging
 import os
-from typing import Optional, Dict, Any
+import time
+import posixpath
+from collections import defaultdict
+from datetime import datetime
+from typing import Optional, Dict, Any, AsyncIterator, Callable, Iterable, List
 from fastapi import UploadFile
 from app.core.config import settings
 from app.core.config_store import config_store
+from app.core.tracing import span
+from app.services.resilience import ResiliencePolicy, StorageUnavailableError
+from app.services.storage import StorageBackend, StorageEntry, iter_upload, upload_size
 
+logger = logging.getLogger(__name__)
+
+
+class AlistService(StorageBackend):
+    name = "alist"
 
-class AlistService:
     def __init__(self):
         # Load initial values from config store, falling back to env-based settings
         stored = config_store.get_section("alist")
@@ -22,14 +35,25 @@ class AlistService:
         self.token = stored.get("token") or env_token
         self.upload_path = stored.get("upload_path") or env_upload_path
         self._is_configured = bool(self.base_url)
-        # Debug configuration summary (mask token)
-        try:
-            masked_token = (self.token[:8] + "...") if self.token else None
-            print(
-                f"[AList] init url={self.base_url} username={'yes' if self.username else 'no'} token={'yes' if self.token else 'no'} token_preview={masked_token} upload_path={self.upload_path}"
-            )
-        except Exception:
-            pass
+        self.policy = ResiliencePolicy(
+            "alist",
+            max_attempts=settings.ALIST_MAX_ATTEMPTS,
+            base_delay=settings.ALIST_RETRY_BASE_DELAY,
+            max_delay=settings.ALIST_RETRY_MAX_DELAY,
+            max_concurrent_transfers=settings.ALIST_MAX_CONCURRENT_TRANSFERS,
+            failure_threshold=settings.ALIST_CIRCUIT_FAILURE_THRESHOLD,
+            reset_timeout=settings.ALIST_CIRCUIT_RESET_SECONDS,
+        )
+        # Configuration summary (never log the token itself)
+        logger.info(
+            "alist configured",
+            extra={
+                "url": self.base_url,
+                "has_username": bool(self.username),
+                "has_token": bool(self.token),
+                "upload_path": self.upload_path,
+            },
+        )
 
     def refresh_from_store(self) -> None:
         """Refresh runtime settings from config_store, always merging non-empty values.
@@ -58,8 +82,52 @@ class AlistService:
             # Normalize leading slash
             self.upload_path = "/" + upload_path_val.strip("/")
         self._is_configured = bool(self.base_url)
-        print(f"[AList] reloaded from config store: url={self.base_url} upload_path={self.upload_path}")
-        
+
+    async def _request(
+        self,
+        operation: str,
+        method: str,
+        path: str,
+        *,
+        idempotent: bool = True,
+        transfer: bool = False,
+        content_factory: Optional[Callable[[], Any]] = None,
+        **kwargs: Any,
+    ) -> httpx.Response:
+        """Send one AList API call through the resilience policy.
+
+        ``content_factory`` builds a fresh request body for every attempt (for streamed
+        uploads). Raises StorageUnavailableError when the deadline expires, retries are
+        exhausted on transport errors, or the circuit breaker is open.
+        """
+        deadline = settings.ALIST_TRANSFER_DEADLINE_SECONDS if transfer else settings.ALIST_DEADLINE_SECONDS
+
+        async def send() -> httpx.Response:
+            if content_factory is not None:
+                kwargs["content"] = content_factory()
+            async with httpx.AsyncClient(timeout=deadline) as client:
+                return await client.request(method, f"{self.base_url}{path}", **kwargs)
+
+        started = time.perf_counter()
+        with span(f"alist.{operation}"):
+            response = await self.policy.call(
+                operation, send, deadline=deadline, idempotent=idempotent, transfer=transfer
+            )
+        logger.debug(
+            "alist call",
+            extra={
+                "op": operation,
+                "status": response.status_code,
+                "bytes": response.headers.get("content-length"),
+                "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+            },
+        )
+        return response
+
+    def health(self) -> Dict[str, Any]:
+        """Resilience state (circuit breaker, in-flight transfers) for admin and metrics views."""
+        return self.policy.snapshot()
+
     async def _get_token(self) -> Optional[str]:
         """Get authentication token from Alist"""
         # Refresh in case config.toml changed
@@ -68,29 +136,27 @@ class AlistService:
             raise ValueError("Alist is not configured. Please set ALIST_URL in environment variables.")
             
         if self.token:
-            print("[AList] using configured token")
             return self.token
             
         if not self.username or not self.password:
             raise ValueError("Alist credentials not configured")
             
-        async with httpx.AsyncClient() as client:
-            print(f"[AList] login POST {self.base_url}/api/auth/login")
-            response = await client.post(
-                f"{self.base_url}/api/auth/login",
-                json={
-                    "username": self.username,
-                    "password": self.password,
-                    "opt_code": ""
-                }
-            )
-            
-            if response.status_code == 200:
-                print(f"[AList] login -> {response.text[:200]}")
-                data = response.json()
-                return data.get("data", {}).get("token")
-            else:
-                raise Exception(f"Failed to authenticate with Alist: {response.text}")
+        response = await self._request(
+            "login",
+            "POST",
+            "/api/auth/login",
+            json={
+                "username": self.username,
+                "password": self.password,
+                "opt_code": ""
+            }
+        )
+        
+        if response.status_code == 200:
+            data = response.json()
+            return data.get("data", {}).get("token")
+        else:
+            raise Exception(f"Failed to authenticate with Alist: {response.text}")
     
     async def test_connection(self) -> bool:
         """Test connection to Alist"""
@@ -100,18 +166,38 @@ class AlistService:
             if not token:
                 return False
                 
-            async with httpx.AsyncClient() as client:
-                print("[AList] GET /api/me for health check")
-                response = await client.get(
-                    f"{self.base_url}/api/me",
-                    headers={"Authorization": token}
-                )
-                print(f"[AList] /api/me -> {response.status_code} {response.text[:200]}")
-                return response.status_code == 200
+            response = await self._request("me", "GET", "/api/me", headers={"Authorization": token})
+            return response.status_code == 200
         except Exception:
             return False
     
-    async def upload_file(self, file: UploadFile, filename: str, subfolder: str = "") -> Dict[str, Any]:
+    async def _put(self, token: str, file_path: str, file: UploadFile, size: int) -> tuple:
+        """PUT one file, streaming it from the upload spool. Returns (response, parsed body)."""
+        # Use PUT /api/fs/put with raw token and File-Path headers
+        headers = {
+            "Authorization": token,
+            "File-Path": file_path,
+            "Content-Type": "application/octet-stream",
+            "Content-Length": str(size),
+            "Accept": "application/json",
+        }
+        # The body is a fresh generator per attempt, so retries restart from byte 0
+        response = await self._request(
+            "put",
+            "PUT",
+            "/api/fs/put",
+            transfer=True,
+            headers=headers,
+            content_factory=lambda: iter_upload(file),
+        )
+        # Try to parse JSON response
+        try:
+            result = response.json()
+        except ValueError:
+            result = None
+        return response, result
+
+    async def put_stream(self, file: UploadFile, filename: str, subfolder: str = "") -> Dict[str, Any]:
         """Upload file to Alist using PUT API with raw token and File-Path header."""
         # Refresh in case config.toml changed
         self.refresh_from_store()
@@ -121,106 +207,71 @@ class AlistService:
 
         # Prepare file path
         file_path = os.path.join(self.upload_path, subfolder, filename).replace("\\", "/")
+        size = upload_size(file)
 
-        # Read file content
-        file_content = await file.read()
-
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            # Ensure directory exists (best-effort)
-            dir_path = os.path.dirname(file_path)
-            if dir_path and dir_path != self.upload_path:
-                try:
-                    print(f"[AList] mkdir {dir_path}")
-                    await self._ensure_directory(client, token, dir_path)
-                except Exception as e:
-                    # Non-fatal; continue upload attempt
-                    print(f"[AList] mkdir warning: {e}")
+        # Ensure directory exists (best-effort)
+        dir_path = os.path.dirname(file_path)
+        if dir_path and dir_path != self.upload_path:
+            try:
+                await self._ensure_directory(token, dir_path)
+            except StorageUnavailableError:
+                raise
+            except Exception as e:
+                # Non-fatal; continue upload attempt
+                logger.warning("alist mkdir failed", extra={"dir": dir_path, "error": str(e)})
 
-            # Use PUT /api/fs/put with raw token and File-Path headers
-            headers = {
-                "Authorization": token,
-                "File-Path": file_path,
-                "Content-Type": "application/octet-stream",
-                "Accept": "application/json",
+        response, result = await self._put(token, file_path, file, size)
+        if response.status_code == 200 and (not result or result.get("code") == 200):
+            return {
+                "success": True,
+                "file_path": file_path,
+                "url": self.url(file_path),
+                "size": size
             }
 
-            print(f"[AList] PUT /api/fs/put File-Path={file_path} size={len(file_content)}")
-            response = await client.put(
-                f"{self.base_url}/api/fs/put",
-                headers=headers,
-                content=file_content,
-            )
+        # Handle API error with message
+        error_msg = response.text
+        if result and "message" in result:
+            error_msg = result.get("message")
 
-            # Try to parse JSON response
-            try:
-                result = response.json()
-            except ValueError:
-                result = None
+        # Fallback: some backends can't create directories; try uploading without subfolder
+        if isinstance(error_msg, str) and "not support" in error_msg and "make dir" in error_msg:
+            logger.warning(
+                "alist mkdir not supported, retrying upload without subfolder",
+                extra={"file_path": file_path},
+            )
+            # Optionally prefix filename with subfolder to avoid collisions
+            fallback_filename = filename
+            if subfolder:
+                fallback_filename = f"{subfolder}_{filename}"
+            fallback_file_path = os.path.join(self.upload_path, fallback_filename).replace("\\", "/")
+            fallback_resp, fallback_body = await self._put(token, fallback_file_path, file, size)
 
-            print(f"[AList] PUT result {response.status_code} {response.text[:400]}")
-            if response.status_code == 200 and (not result or result.get("code") == 200):
-                public_url = await self.get_file_url(file_path)
+            if fallback_resp.status_code == 200 and (not fallback_body or fallback_body.get("code") == 200):
                 return {
                     "success": True,
-                    "file_path": file_path,
-                    "url": public_url,
-                    "size": len(file_content)
-                }
-
-            # Handle API error with message
-            error_msg = response.text
-            if result and "message" in result:
-                error_msg = result.get("message")
-
-            # Fallback: some backends can't create directories; try uploading without subfolder
-            if isinstance(error_msg, str) and "not support" in error_msg and "make dir" in error_msg:
-                print(
-                    f"[AList] fallback: retrying upload without subfolder because mkdir is not supported"
-                )
-                # Optionally prefix filename with subfolder to avoid collisions
-                fallback_filename = filename
-                if subfolder:
-                    fallback_filename = f"{subfolder}_{filename}"
-                fallback_file_path = os.path.join(self.upload_path, fallback_filename).replace("\\", "/")
-                fallback_headers = {
-                    "Authorization": token,
-                    "File-Path": fallback_file_path,
-                    "Content-Type": "application/octet-stream",
-                    "Accept": "application/json",
+                    "file_path": fallback_file_path,
+                    "url": self.url(fallback_file_path),
+                    "size": size
                 }
-                print(f"[AList] PUT (fallback) File-Path={fallback_file_path} size={len(file_content)}")
-                fallback_resp = await client.put(
-                    f"{self.base_url}/api/fs/put",
-                    headers=fallback_headers,
-                    content=file_content,
-                )
-                print(f"[AList] PUT (fallback) result {fallback_resp.status_code} {fallback_resp.text[:400]}")
-                try:
-                    fallback_body = fallback_resp.json()
-                except ValueError:
-                    fallback_body = None
 
-                if fallback_resp.status_code == 200 and (not fallback_body or fallback_body.get("code") == 200):
-                    public_url = await self.get_file_url(fallback_file_path)
-                    return {
-                        "success": True,
-                        "file_path": fallback_file_path,
-                        "url": public_url,
-                        "size": len(file_content)
-                    }
+            # If fallback also failed, bubble up the original message
+            fb_msg = fallback_resp.text
+            if fallback_body and "message" in fallback_body:
+                fb_msg = fallback_body.get("message")
+            raise Exception(f"Upload failed (fallback): {fb_msg}")
 
-                # If fallback also failed, bubble up the original message
-                fb_msg = fallback_resp.text
-                if fallback_body and "message" in fallback_body:
-                    fb_msg = fallback_body.get("message")
-                raise Exception(f"Upload failed (fallback): {fb_msg}")
+        raise Exception(f"Upload failed: {error_msg}")
 
-            raise Exception(f"Upload failed: {error_msg}")
+    async def upload_file(self, file: UploadFile, filename: str, subfolder: str = "") -> Dict[str, Any]:
+        return await self.put_stream(file, filename, subfolder)
     
-    async def _ensure_directory(self, client: httpx.AsyncClient, token: str, dir_path: str):
+    async def _ensure_directory(self, token: str, dir_path: str):
         """Ensure directory exists in Alist"""
-        response = await client.post(
-            f"{self.base_url}/api/fs/mkdir",
+        response = await self._request(
+            "mkdir",
+            "POST",
+            "/api/fs/mkdir",
             json={
                 "path": dir_path,
                 "password": ""
@@ -236,29 +287,94 @@ class AlistService:
             except ValueError:
                 raise Exception(f"Failed to create directory: {response.text}")
     
-    async def get_file_url(self, file_path: str) -> str:
+    def url(self, file_path: str) -> str:
         """Get public URL for a file"""
         # Alist typically serves files at /d/ path
         return f"{self.base_url}/d{file_path}"
-    
-    async def delete_file(self, file_path: str) -> bool:
-        """Delete file from Alist"""
+
+    async def get_file_url(self, file_path: str) -> str:
+        return self.url(file_path)
+
+    async def _remove_names(self, token: str, dir_path: str, names: List[str]) -> int:
+        response = await self._request(
+            "remove",
+            "POST",
+            "/api/fs/remove",
+            json={"dir": dir_path, "names": names},
+            headers={"Authorization": token}
+        )
+        if response.status_code == 200 and response.json().get("code") == 200:
+            return len(names)
+        return 0
+
+    async def delete_many(self, file_paths: Iterable[str]) -> int:
+        """Delete files from Alist with one remove call per parent directory, run concurrently."""
+        by_dir: Dict[str, List[str]] = defaultdict(list)
+        for file_path in file_paths:
+            if file_path:
+                dir_path, name = posixpath.split(file_path)
+                by_dir[dir_path or "/"].append(name)
+        if not by_dir:
+            return 0
         token = await self._get_token()
         if not token:
-            return False
-        
-        async with httpx.AsyncClient() as client:
-            print(f"[AList] remove {file_path}")
-            response = await client.post(
-                f"{self.base_url}/api/fs/remove",
-                json={
-                    "path": file_path,
-                    "password": ""
-                },
+            return 0
+        results = await asyncio.gather(
+            *(self._remove_names(token, d, names) for d, names in by_dir.items()),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, StorageUnavailableError):
+                raise result
+        return sum(r for r in results if isinstance(r, int))
+
+    async def exists(self, file_path: str) -> bool:
+        token = await self._get_token()
+        response = await self._request(
+            "get",
+            "POST",
+            "/api/fs/get",
+            json={"path": file_path, "password": ""},
+            headers={"Authorization": token}
+        )
+        return response.status_code == 200 and response.json().get("code") == 200
+
+    async def list(self, dir_path: str, per_page: int = 200) -> AsyncIterator[StorageEntry]:
+        """Yield the entries of one directory, paging through /api/fs/list."""
+        token = await self._get_token()
+        page = 1
+        while True:
+            response = await self._request(
+                "list",
+                "POST",
+                "/api/fs/list",
+                json={"path": dir_path, "password": "", "page": page, "per_page": per_page, "refresh": False},
                 headers={"Authorization": token}
             )
-            print(f"[AList] remove -> {response.status_code} {response.text[:200]}")
-            return response.status_code == 200 and response.json().get("code") == 200
+            body = response.json() if response.status_code == 200 else {}
+            if body.get("code") != 200:
+                raise Exception(f"Failed to list {dir_path}: {body.get('message') or response.status_code}")
+            data = body.get("data") or {}
+            content = data.get("content") or []
+            for item in content:
+                yield StorageEntry(
+                    path=posixpath.join(dir_path, item["name"]),
+                    is_dir=bool(item.get("is_dir")),
+                    size=item.get("size"),
+                    modified=_parse_modified(item.get("modified")),
+                )
+            if not content or page * per_page >= int(data.get("total") or 0):
+                break
+            page += 1
+
+
+def _parse_modified(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
 
 
 # Global instance
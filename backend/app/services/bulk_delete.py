@@ -0,0 +1,141 @@
+"""Set-based deletion of many images: admin delete-by-category/model/tag and the
+reconciliation job's cleanup of rows whose files are gone.
+
+Leaf images are found with one anti-join, then removed in chunks of a few hundred
+with one DELETE per table (version history, parameters, tag links, images) instead
+of loading and deleting each image through the ORM. Every chunk commits, so a large
+delete does not hold the SQLite write lock for its whole duration.
+"""
+
+import logging
+import time
+from threading import Lock
+from typing import Any, Dict, List, Sequence, Tuple
+
+from sqlalchemy import delete, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from app.core.metrics import metrics
+from app.models import Image, KeyValueParameter, VersionHistory
+from app.models.tag import image_tags
+from app.services.parameters import forget_image_parameters
+from app.services.related_tags import forget_image_tags
+
+logger = logging.getLogger(__name__)
+
+# Images deleted per transaction
+DELETE_CHUNK_SIZE = 500
+
+
+class BulkDeleteProgress:
+    """Progress of the bulk deletes running in this process, shown under
+    ``bulk_delete`` in /admin/metrics."""
+
+    def __init__(self):
+        self._jobs: Dict[int, Dict[str, Any]] = {}
+        self._next_id = 0
+        self._lock = Lock()
+        metrics.register_collector("bulk_delete", self.snapshot)
+
+    def start(self, label: str, total: int) -> int:
+        with self._lock:
+            self._next_id += 1
+            self._jobs[self._next_id] = {"label": label, "total": total, "deleted": 0, "started": time.time()}
+            return self._next_id
+
+    def update(self, job_id: int, deleted: int) -> None:
+        self._jobs[job_id]["deleted"] = deleted
+
+    def finish(self, job_id: int) -> None:
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.time()
+        return {
+            "running": [
+                {
+                    "label": job["label"],
+                    "total": job["total"],
+                    "deleted": job["deleted"],
+                    "elapsed_s": round(now - job["started"], 1),
+                }
+                for job in list(self._jobs.values())
+            ]
+        }
+
+
+# Global singleton instance
+bulk_delete_progress = BulkDeleteProgress()
+
+
+async def delete_image_rows(db: AsyncSession, image_ids: Sequence[int]) -> None:
+    """Delete the images ``image_ids`` and the rows that reference them, one statement
+    per table. Does not check for child versions and does not commit."""
+    ids = list(image_ids)
+    if not ids:
+        return
+    await db.execute(delete(VersionHistory).where(
+        or_(
+            VersionHistory.parent_image_id.in_(ids),
+            VersionHistory.child_image_id.in_(ids)
+        )
+    ).execution_options(synchronize_session=False))
+    await forget_image_parameters(db, ids)
+    await db.execute(
+        delete(KeyValueParameter).where(KeyValueParameter.image_id.in_(ids))
+        .execution_options(synchronize_session=False)
+    )
+    await forget_image_tags(db, ids)
+    await db.execute(delete(image_tags).where(image_tags.c.image_id.in_(ids)))
+    await db.execute(delete(Image).where(Image.id.in_(ids)).execution_options(synchronize_session=False))
+
+
+async def delete_leaf_images(
+    db: AsyncSession,
+    selection,
+    *,
+    label: str,
+) -> Tuple[int, int, List[str]]:
+    """Delete the images selected by ``selection`` (a SELECT of image ids) that have no
+    child versions; images with children are skipped, as in the single-image delete.
+
+    The leaf set is fixed up front, so deleting a child does not make its parent
+    eligible within the same call. Progress is reported in /admin/metrics and, for
+    deletes of more than one chunk, logged after each chunk. Returns (deleted,
+    skipped_with_children, file_paths of the deleted images).
+    """
+    child = aliased(Image)
+    leaves = (await db.execute(
+        select(Image.id, Image.file_path)
+        .outerjoin(child, child.parent_image_id == Image.id)
+        .where(Image.id.in_(selection), child.id.is_(None))
+        .order_by(Image.id)
+    )).all()
+    matched = await db.scalar(select(func.count()).select_from(Image).where(Image.id.in_(selection)))
+
+    total = len(leaves)
+    job_id = bulk_delete_progress.start(label, total)
+    started = time.perf_counter()
+    try:
+        for start in range(0, total, DELETE_CHUNK_SIZE):
+            chunk = leaves[start:start + DELETE_CHUNK_SIZE]
+            await delete_image_rows(db, [row.id for row in chunk])
+            await db.commit()
+            done = start + len(chunk)
+            bulk_delete_progress.update(job_id, done)
+            if total > DELETE_CHUNK_SIZE:
+                logger.info(
+                    "bulk delete progress",
+                    extra={
+                        "label": label,
+                        "deleted": done,
+                        "total": total,
+                        "duration_ms": round((time.perf_counter() - started) * 1000),
+                    },
+                )
+    finally:
+        bulk_delete_progress.finish(job_id)
+
+    return total, matched - total, [row.file_path for row in leaves]
@@ -0,0 +1,47 @@
+"""Free-text model and category names ("other" on upload), interned into the
+custom_models / custom_categories lookup tables.
+
+The API keeps speaking names; images store the id of the label. Names are matched
+after collapsing whitespace and case-folding, so "SDXL turbo", "sdxl  Turbo" and
+" SDXL Turbo" are one label, displayed as first entered.
+"""
+
+from typing import Iterable, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import insert_ignore
+
+
+def normalize_label(name: Optional[str]) -> Optional[str]:
+    """``name`` trimmed with runs of whitespace collapsed; None if that leaves nothing."""
+    if name is None:
+        return None
+    return " ".join(name.split()) or None
+
+
+def label_key(name: str) -> str:
+    return " ".join(name.split()).casefold()
+
+
+async def intern_label(db: AsyncSession, model, name: Optional[str]) -> Optional[int]:
+    """Id of the ``model`` (CustomModel or CustomCategory) row for ``name``, creating
+    it if needed; None for a blank name. Concurrent uploads of a new name both end up
+    with the same row."""
+    name = normalize_label(name)
+    if name is None:
+        return None
+    key = name.casefold()
+    label_id = await db.scalar(select(model.id).where(model.key == key))
+    if label_id is None:
+        await db.execute(insert_ignore(model.__table__).values(name=name, key=key))
+        label_id = await db.scalar(select(model.id).where(model.key == key))
+    return label_id
+
+
+def label_filter(column, model, names: Iterable[str]):
+    """Condition matching images whose ``column`` (custom_model_id or
+    custom_category_id) refers to one of ``names``."""
+    keys: List[str] = [label_key(name) for name in names if normalize_label(name)]
+    return column.in_(select(model.id).where(model.key.in_(keys)))
@@ -0,0 +1,146 @@
+import mimetypes
+import os
+import posixpath
+import shutil
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, AsyncIterator, BinaryIO, Dict, Iterable, List, Optional
+
+from fastapi import HTTPException, UploadFile, status
+from fastapi.responses import FileResponse, Response
+from starlette.concurrency import run_in_threadpool
+
+from app.core.tracing import span
+from app.services.storage import StorageBackend, StorageEntry, UPLOAD_CHUNK_SIZE
+
+
+class LocalStorageBackend(StorageBackend):
+    """Stores files under a directory on the API host.
+
+    Files are served by ``GET /api/v1/files/{path}``. With ``accel_redirect_prefix`` set,
+    that route only answers with an ``X-Accel-Redirect`` header and nginx sends the bytes
+    itself via sendfile; otherwise Starlette's FileResponse streams them.
+    """
+
+    name = "local"
+
+    def __init__(
+        self,
+        root: str,
+        upload_path: str = "/gallery",
+        url_prefix: str = "/api/v1/files",
+        accel_redirect_prefix: Optional[str] = None,
+    ):
+        self.root = Path(root).resolve()
+        self.upload_path = "/" + upload_path.strip("/")
+        self.url_prefix = url_prefix.rstrip("/")
+        self.accel_redirect_prefix = accel_redirect_prefix.rstrip("/") if accel_redirect_prefix else None
+        # The upload path is created up front so that listing it only fails when the
+        # storage really is missing
+        self._disk_path(self.upload_path).mkdir(parents=True, exist_ok=True)
+
+    def _disk_path(self, file_path: str) -> Path:
+        """Map a logical path onto the storage root, refusing anything that escapes it."""
+        normalized = posixpath.normpath("/" + file_path.lstrip("/"))
+        disk_path = (self.root / normalized.lstrip("/")).resolve()
+        if disk_path != self.root and self.root not in disk_path.parents:
+            raise ValueError(f"Path escapes storage root: {file_path}")
+        return disk_path
+
+    @staticmethod
+    def _write(source: BinaryIO, target: Path) -> int:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        partial = target.with_name(target.name + ".part")
+        source.seek(0)
+        with partial.open("wb") as out:
+            shutil.copyfileobj(source, out, UPLOAD_CHUNK_SIZE)
+            size = out.tell()
+        # Atomic publish: readers never observe a half-written file
+        os.replace(partial, target)
+        return size
+
+    async def put_stream(self, file: UploadFile, filename: str, subfolder: str = "") -> Dict[str, Any]:
+        file_path = posixpath.join(self.upload_path, subfolder, filename)
+        with span("local.put"):
+            size = await run_in_threadpool(self._write, file.file, self._disk_path(file_path))
+        return {
+            "success": True,
+            "file_path": file_path,
+            "url": self.url(file_path),
+            "size": size,
+        }
+
+    def _unlink_many(self, file_paths: List[str]) -> int:
+        deleted = 0
+        for file_path in file_paths:
+            try:
+                self._disk_path(file_path).unlink()
+                deleted += 1
+            except (FileNotFoundError, ValueError):
+                pass
+        return deleted
+
+    async def delete_many(self, file_paths: Iterable[str]) -> int:
+        paths = [p for p in file_paths if p]
+        if not paths:
+            return 0
+        with span("local.remove"):
+            return await run_in_threadpool(self._unlink_many, paths)
+
+    def url(self, file_path: str) -> str:
+        return f"{self.url_prefix}{file_path}"
+
+    async def exists(self, file_path: str) -> bool:
+        try:
+            return await run_in_threadpool(self._disk_path(file_path).is_file)
+        except ValueError:
+            return False
+
+    def _scan(self, dir_path: str) -> List[StorageEntry]:
+        disk_path = self._disk_path(dir_path)
+        entries: List[StorageEntry] = []
+        try:
+            it = os.scandir(disk_path)
+        except (FileNotFoundError, NotADirectoryError):
+            # Like a failed AList listing: a missing root or upload path (unmounted
+            # volume, wrong LOCAL_STORAGE_ROOT) must not look like an empty store.
+            # A subdirectory removed since its parent was listed is simply empty
+            if not self.root.is_dir() or disk_path == self._disk_path(self.upload_path):
+                raise FileNotFoundError(f"Failed to list {dir_path}: {disk_path} does not exist")
+            return entries
+        with it:
+            for entry in it:
+                if entry.name.endswith(".part"):
+                    continue
+                try:
+                    stat = entry.stat()
+                    is_dir = entry.is_dir()
+                except FileNotFoundError:
+                    # Removed during the scan
+                    continue
+                entries.append(StorageEntry(
+                    path=posixpath.join(dir_path, entry.name),
+                    is_dir=is_dir,
+                    size=None if is_dir else stat.st_size,
+                    modified=datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc),
+                ))
+        return entries
+
+    async def list(self, dir_path: str) -> AsyncIterator[StorageEntry]:
+        for entry in await run_in_threadpool(self._scan, dir_path):
+            yield entry
+
+    def serve(self, file_path: str) -> Response:
+        try:
+            disk_path = self._disk_path(file_path)
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+        if not disk_path.is_file():
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+        media_type = mimetypes.guess_type(disk_path.name)[0] or "application/octet-stream"
+        if self.accel_redirect_prefix:
+            return Response(
+                media_type=media_type,
+                headers={"X-Accel-Redirect": f"{self.accel_redirect_prefix}/{file_path.lstrip('/')}"},
+            )
+        return FileResponse(disk_path, media_type=media_type)
@@ -0,0 +1,300 @@
+"""Generation parameter filters and the parameter catalog.
+
+Filters (``param_keys`` / ``param_filters`` on the image listings) select image ids
+from key_value_parameters by key and typed value, one indexed subquery per key:
+
+- JSON, as before: ``{"sampler": "Euler a", "seed": null}`` for equality or presence,
+  extended with lists for membership (``{"cfg": [5, 7]}``) and operator objects for
+  ranges (``{"steps": {">=": 30, "<": 50}}``)
+- or expressions separated by "," or ";": ``steps>=30; cfg in [5,7]; sampler=Euler a``
+
+Numbers compare as numbers (``steps=30`` matches "30" and "30.0"), anything else as
+trimmed text.
+
+parameter_value_stats holds the number of parameters per (key, value) for
+GET /parameters/catalog, with values in the form filters compare them (see
+catalog_value): "30" and "30.0" are one entry. ORM writes to key_value_parameters
+are counted as they are flushed (see _record); bulk deletes call
+forget_image_parameters.
+"""
+
+import json
+import re
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import bindparam, delete, event, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, attributes, object_session
+
+from app.core.database import insert_ignore
+from app.models import Image, KeyValueParameter, ParameterValueStat
+from app.models.image import typed_parameter_value
+
+OPERATORS = {
+    ">": lambda column, value: column > value,
+    ">=": lambda column, value: column >= value,
+    "<": lambda column, value: column < value,
+    "<=": lambda column, value: column <= value,
+    "=": lambda column, value: column == value,
+}
+
+# Rows per INSERT when rebuilding the catalog
+CATALOG_BATCH_SIZE = 1000
+
+_EXPRESSION = re.compile(r"\s*([^<>=,;\[\]]+?)\s*(>=|<=|>|<|=|\s+in\b)\s*(\[[^\]]*\]|[^,;]*)\s*(?:[,;]|$)")
+
+
+def parse_param_filters(param_filters: str) -> List[Tuple[str, str, Any]]:
+    """``param_filters`` as (key, operator, value) conditions; operator is one of
+    OPERATORS, "in" (value is a list) or "exists". Raises ValueError if malformed."""
+    text = param_filters.strip()
+    conditions = []
+    if text.startswith("{"):
+        for key, spec in json.loads(text).items():
+            if spec is None or str(spec).strip() == "":
+                conditions.append((key, "exists", None))
+            elif isinstance(spec, list):
+                conditions.append((key, "in", spec))
+            elif isinstance(spec, dict):
+                for operator, value in spec.items():
+                    if operator != "in" and operator not in OPERATORS:
+                        raise ValueError(f"Unknown operator {operator!r}")
+                    conditions.append((key, operator, value))
+            else:
+                conditions.append((key, "=", spec))
+        return conditions
+
+    position = 0
+    while position < len(text):
+        match = _EXPRESSION.match(text, position)
+        if match is None or match.end() == position:
+            raise ValueError(f"Cannot parse parameter filter at {text[position:]!r}")
+        key, operator, value = match.group(1).strip(), match.group(2).strip(), match.group(3).strip()
+        if operator == "in":
+            if not (value.startswith("[") and value.endswith("]")):
+                raise ValueError(f"Expected a list after 'in' for {key!r}")
+            value = [item.strip() for item in value[1:-1].split(",") if item.strip()]
+        conditions.append((key, operator, value))
+        position = match.end()
+    return conditions
+
+
+def _value_condition(operator: str, value: Any):
+    if operator == "exists":
+        return None
+    if operator == "in":
+        typed = [typed_parameter_value(item) for item in value]
+        numbers = [number for number, _ in typed if number is not None]
+        texts = [text for number, text in typed if number is None and text is not None]
+        if not texts:
+            return KeyValueParameter.num_value.in_(numbers)
+        if not numbers:
+            return KeyValueParameter.text_value.in_(texts)
+        return or_(KeyValueParameter.num_value.in_(numbers), KeyValueParameter.text_value.in_(texts))
+    number, text = typed_parameter_value(value)
+    if number is not None:
+        return OPERATORS[operator](KeyValueParameter.num_value, number)
+    return OPERATORS[operator](KeyValueParameter.text_value, text)
+
+
+def parameter_condition(key: str, operator: str = "exists", value: Any = None):
+    """Condition matching images with parameter ``key`` satisfying ``operator value``."""
+    criteria = [KeyValueParameter.key == key]
+    condition = _value_condition(operator, value)
+    if condition is not None:
+        criteria.append(condition)
+    return Image.id.in_(select(KeyValueParameter.image_id).where(*criteria))
+
+
+def filter_by_parameters(query, param_keys: Optional[str], param_filters: Optional[str]):
+    """Apply the ``param_keys`` (comma-separated keys that must be present) and
+    ``param_filters`` listing parameters to ``query``. A malformed ``param_filters``
+    is ignored, as it always has been."""
+    if param_keys:
+        for key in (k.strip() for k in param_keys.split(",")):
+            if key:
+                query = query.filter(parameter_condition(key))
+    if param_filters:
+        try:
+            conditions = parse_param_filters(param_filters)
+        except (ValueError, AttributeError):
+            return query
+        for key, operator, value in conditions:
+            query = query.filter(parameter_condition(key, operator, value))
+    return query
+
+
+# Catalog maintenance
+
+def catalog_value(value: Any) -> Optional[str]:
+    """The catalog entry a parameter value counts under: numbers in one canonical
+    spelling ("30", "7.5", "1e+20"), text trimmed; None for a missing or blank value."""
+    number, text = typed_parameter_value(value)
+    if number is not None:
+        return str(int(number)) if number.is_integer() and abs(number) < 1e15 else repr(number)
+    return text or None
+
+
+def _catalog_statements(deltas: Dict[Tuple[str, str], int]) -> Iterable[Tuple[Any, List[dict]]]:
+    """(statement, executemany parameters) applying ``deltas`` to parameter_value_stats."""
+    table = ParameterValueStat.__table__
+    changed = [(key, value, delta) for (key, value), delta in deltas.items() if delta]
+    added = [
+        {"key": key, "value": value, "num_value": typed_parameter_value(value)[0], "image_count": 0}
+        for key, value, delta in changed if delta > 0
+    ]
+    if added:
+        yield insert_ignore(table), added
+    if changed:
+        yield (
+            update(table)
+            .where(table.c.key == bindparam("stat_key"), table.c.value == bindparam("stat_value"))
+            .values(image_count=table.c.image_count + bindparam("delta")),
+            [{"stat_key": key, "stat_value": value, "delta": delta} for key, value, delta in changed],
+        )
+    removed = [{"stat_key": key, "stat_value": value} for key, value, delta in changed if delta < 0]
+    if removed:
+        yield (
+            delete(table).where(
+                table.c.key == bindparam("stat_key"),
+                table.c.value == bindparam("stat_value"),
+                table.c.image_count <= 0,
+            ),
+            removed,
+        )
+
+
+def _record(target: KeyValueParameter, key: Optional[str], value: Optional[str], delta: int) -> None:
+    session = object_session(target)
+    value = catalog_value(value)
+    if session is None or key is None or value is None:
+        return
+    session.info.setdefault("parameter_stat_deltas", Counter())[(key, value)] += delta
+
+
+@event.listens_for(KeyValueParameter, "after_insert")
+def _inserted(mapper, connection, target):
+    _record(target, target.key, target.value, 1)
+
+
+@event.listens_for(KeyValueParameter, "after_delete")
+def _deleted(mapper, connection, target):
+    _record(target, target.key, target.value, -1)
+
+
+@event.listens_for(KeyValueParameter, "after_update")
+def _updated(mapper, connection, target):
+    key_history = attributes.get_history(target, "key")
+    value_history = attributes.get_history(target, "value")
+    if not (key_history.has_changes() or value_history.has_changes()):
+        return
+    old_key = (key_history.deleted or [target.key])[0]
+    old_value = (value_history.deleted or [target.value])[0]
+    _record(target, old_key, old_value, -1)
+    _record(target, target.key, target.value, 1)
+
+
+@event.listens_for(Session, "after_flush")
+def _flush_catalog(session, flush_context):
+    deltas = session.info.pop("parameter_stat_deltas", None)
+    if deltas:
+        connection = session.connection()
+        for statement, params in _catalog_statements(deltas):
+            connection.execute(statement, params)
+
+
+async def forget_image_parameters(db: AsyncSession, image_ids: Sequence[int]) -> None:
+    """Take the parameters of ``image_ids`` out of the catalog, before they are deleted
+    without the ORM."""
+    rows = (await db.execute(
+        select(KeyValueParameter.key, KeyValueParameter.value, func.count())
+        .where(KeyValueParameter.image_id.in_(list(image_ids)), KeyValueParameter.value.isnot(None))
+        .group_by(KeyValueParameter.key, KeyValueParameter.value)
+    )).all()
+    deltas: Counter = Counter()
+    for key, value, count in rows:
+        value = catalog_value(value)
+        if value is not None:
+            deltas[(key, value)] -= count
+    for statement, params in _catalog_statements(deltas):
+        await db.execute(statement, params)
+
+
+def rebuild_parameter_catalog(conn) -> int:
+    """Recount parameter_value_stats from key_value_parameters, grouping numbers by
+    num_value and text by text_value. Returns the number of (key, value) rows."""
+    table = ParameterValueStat.__table__
+    conn.execute(delete(table))
+    rows = conn.execute(
+        select(
+            KeyValueParameter.key,
+            KeyValueParameter.num_value,
+            KeyValueParameter.text_value,
+            func.count(),
+        )
+        .where(KeyValueParameter.value.isnot(None))
+        .group_by(KeyValueParameter.key, KeyValueParameter.num_value, KeyValueParameter.text_value)
+    )
+    counts: Counter = Counter()
+    for key, number, text, count in rows:
+        value = catalog_value(number if number is not None else text)
+        if value is not None:
+            counts[(key, value)] += count
+    entries = [
+        {"key": key, "value": value, "num_value": typed_parameter_value(value)[0], "image_count": count}
+        for (key, value), count in counts.items()
+    ]
+    for start in range(0, len(entries), CATALOG_BATCH_SIZE):
+        conn.execute(table.insert(), entries[start:start + CATALOG_BATCH_SIZE])
+    return len(entries)
+
+
+async def parameter_catalog(db: AsyncSession, limit: int, top: int) -> List[Dict[str, Any]]:
+    """The ``limit`` most used parameter keys with their ``top`` most common values:
+    one grouped pass over the catalog, then one UNION ALL of a (key, image_count)
+    index range per key. Keep ``limit`` at most a few hundred (SQLite allows 500
+    compound SELECT terms)."""
+    table = ParameterValueStat.__table__
+    keys = (await db.execute(
+        select(
+            table.c.key,
+            func.sum(table.c.image_count).label("image_count"),
+            func.count().label("distinct_values"),
+            func.count(table.c.num_value).label("numeric_values"),
+            func.min(table.c.num_value).label("min"),
+            func.max(table.c.num_value).label("max"),
+        )
+        .group_by(table.c.key)
+        .order_by(func.sum(table.c.image_count).desc(), table.c.key)
+        .limit(limit)
+    )).all()
+    if not keys:
+        return []
+
+    ranked = [
+        select(table.c.key, table.c.value, table.c.image_count)
+        .where(table.c.key == row.key)
+        .order_by(table.c.image_count.desc(), table.c.value)
+        .limit(top)
+        .subquery()
+        for row in keys
+    ]
+    selects = [select(subquery) for subquery in ranked]
+    statement = selects[0].union_all(*selects[1:]) if len(selects) > 1 else selects[0]
+    values: Dict[str, List[Dict[str, Any]]] = {row.key: [] for row in keys}
+    for key, value, image_count in (await db.execute(statement)).all():
+        values[key].append({"value": value, "image_count": image_count})
+
+    return [
+        {
+            "key": row.key,
+            "image_count": int(row.image_count or 0),
+            "distinct_values": row.distinct_values,
+            "numeric": row.numeric_values == row.distinct_values,
+            "min": row.min if row.numeric_values else None,
+            "max": row.max if row.numeric_values else None,
+            "values": values[row.key],
+        }
+        for row in keys
+    ]
@@ -0,0 +1,362 @@
+"""Storage reconciliation: compare the files under the storage upload path with
+``Image.file_path`` rows and report (optionally clean) both kinds of drift:
+
+* orphans: files in storage that no image row references
+* missing: image rows whose file is gone from storage
+
+Both sides are streamed in ascending path order (by code point: the database side
+uses a binary collation) and compared with a sorted merge,
+so memory stays bounded by one directory listing plus one DB batch. Progress is
+persisted to a checkpoint after each run, which makes the job resumable and lets it
+run incrementally in bounded slices (``limit``).
+
+Deleting missing rows is refused when the run found no files at all, or (unless
+forced) when more than RECONCILE_MAX_MISSING_FRACTION of the rows it saw are missing:
+both usually mean the store is misconfigured rather than the files being gone.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import binary_collated
+from app.models import Image
+from app.services.bulk_delete import delete_image_rows
+from app.services.storage import StorageBackend, StorageEntry
+
+logger = logging.getLogger(__name__)
+
+# At most this many orphan/missing paths are included in a report
+SAMPLE_SIZE = 100
+DELETE_BATCH_SIZE = 100
+DB_BATCH_SIZE = 1000
+
+# Set while a reconciliation runs in this process, so admin requests cannot overlap
+_running = False
+
+
+def is_running() -> bool:
+    return _running
+
+
+@dataclass
+class Checkpoint:
+    cursor: str = ""
+    last_completed_at: Optional[str] = None
+    runs: int = 0
+
+    @classmethod
+    def load(cls, path: Path) -> "Checkpoint":
+        try:
+            with path.open("r", encoding="utf-8") as f:
+                return cls(**json.load(f))
+        except (FileNotFoundError, ValueError, TypeError):
+            return cls()
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(asdict(self), f)
+        tmp.replace(path)
+
+
+@dataclass
+class ReconcileReport:
+    root: str
+    started_cursor: str
+    cursor: str = ""
+    completed: bool = False
+    files_scanned: int = 0
+    rows_scanned: int = 0
+    matched: int = 0
+    orphan_count: int = 0
+    missing_count: int = 0
+    orphans_deleted: int = 0
+    missing_rows_deleted: int = 0
+    missing_rows_skipped_with_children: int = 0
+    # Why delete_missing deleted nothing, if it was refused
+    missing_rows_delete_refused: Optional[str] = None
+    orphans: List[str] = field(default_factory=list)
+    missing: List[Dict[str, object]] = field(default_factory=list)
+    duration_ms: float = 0.0
+
+
+def _sort_key(entry: StorageEntry) -> str:
+    # Suffixing directories with "/" makes a depth-first walk emit full paths in
+    # plain string order, the same order the database returns with a binary ORDER BY
+    return entry.path + "/" if entry.is_dir else entry.path
+
+
+def _subtree_after(dir_path: str, after: str) -> bool:
+    """Whether anything under ``dir_path`` can sort after ``after``."""
+    prefix = dir_path.rstrip("/") + "/"
+    return not after or prefix > after or after.startswith(prefix)
+
+
+async def walk_sorted(
+    storage: StorageBackend, root: str, after: str = "", prefetch: int = 4
+) -> AsyncIterator[StorageEntry]:
+    """Yield every file under ``root`` with path > ``after``, in ascending path order.
+
+    Up to ``prefetch`` sibling directory listings are fetched concurrently ahead of the
+    one being consumed.
+    """
+    semaphore = asyncio.Semaphore(max(1, prefetch))
+
+    async def listing(dir_path: str) -> List[StorageEntry]:
+        async with semaphore:
+            entries = [entry async for entry in storage.list(dir_path)]
+        entries.sort(key=_sort_key)
+        return entries
+
+    async def walk(listing_task: "asyncio.Future[List[StorageEntry]]") -> AsyncIterator[StorageEntry]:
+        entries = await listing_task
+        dirs = [e.path for e in entries if e.is_dir and _subtree_after(e.path, after)]
+        wanted = set(dirs)
+        pending: Dict[str, asyncio.Future] = {}
+        next_dir = 0
+
+        def refill() -> None:
+            nonlocal next_dir
+            while next_dir < len(dirs) and len(pending) < prefetch:
+                pending[dirs[next_dir]] = asyncio.ensure_future(listing(dirs[next_dir]))
+                next_dir += 1
+
+        try:
+            for entry in entries:
+                if entry.is_dir:
+                    if entry.path not in wanted:
+                        continue
+                    refill()
+                    task = pending.pop(entry.path)
+                    refill()
+                    async for child in walk(task):
+                        yield child
+                elif entry.path > after:
+                    yield entry
+        finally:
+            for task in pending.values():
+                task.cancel()
+
+    async for entry in walk(asyncio.ensure_future(listing(root))):
+        yield entry
+
+
+async def iter_image_paths(db: AsyncSession, root: str, after: str = "") -> AsyncIterator[Tuple[int, str]]:
+    """Yield (id, file_path) for images stored under ``root``, in ascending path order.
+
+    Rows are read in keyset-paginated batches, so no cursor stays open between them.
+    Paths are compared in a binary collation so the order matches Python's, which
+    walk_sorted uses; a locale-aware one would turn its disagreements into false
+    orphan/missing pairs.
+    """
+    prefix = root.rstrip("/") + "/"
+    file_path = binary_collated(Image.file_path)
+    # "0" is the character after "/", so this is an index-friendly prefix range
+    query = (
+        select(Image.id, Image.file_path)
+        .where(file_path >= prefix, file_path < prefix[:-1] + "0")
+        .order_by(file_path, Image.id)
+        .limit(DB_BATCH_SIZE)
+    )
+    last_path, last_id = after, None
+    while True:
+        batch = query.where(file_path > last_path) if last_id is None else query.where(
+            or_(file_path > last_path, and_(file_path == last_path, Image.id > last_id))
+        )
+        rows = (await db.execute(batch)).all()
+        for row in rows:
+            yield row.id, row.file_path
+        if len(rows) < DB_BATCH_SIZE:
+            return
+        last_id, last_path = rows[-1].id, rows[-1].file_path
+
+
+async def _delete_missing_rows(db: AsyncSession, image_ids: List[int]) -> Tuple[int, int]:
+    """Delete leaf image rows whose files are gone. Returns (deleted, skipped_with_children)."""
+    with_children = set((await db.scalars(
+        select(Image.parent_image_id).where(Image.parent_image_id.in_(image_ids)).distinct()
+    )).all())
+    leaf_ids = [i for i in image_ids if i not in with_children]
+    if leaf_ids:
+        await delete_image_rows(db, leaf_ids)
+        await db.commit()
+    return len(leaf_ids), len(image_ids) - len(leaf_ids)
+
+
+def _refuse_missing_deletion(report: ReconcileReport, force: bool) -> Optional[str]:
+    """Reason not to delete this run's missing rows, or None if it is safe."""
+    if report.files_scanned == 0:
+        return "No files were found in storage while image rows were; check the storage root"
+    if not force and report.missing_count > settings.RECONCILE_MAX_MISSING_FRACTION * report.rows_scanned:
+        return (
+            f"{report.missing_count} of {report.rows_scanned} rows scanned have no file, more than "
+            f"RECONCILE_MAX_MISSING_FRACTION allows; run again with force to delete them"
+        )
+    return None
+
+
+async def reconcile(
+    db: AsyncSession,
+    storage: StorageBackend,
+    *,
+    checkpoint_path: Optional[Path] = None,
+    limit: Optional[int] = None,
+    delete_orphans: bool = False,
+    delete_missing: bool = False,
+    grace_seconds: int = 3600,
+    prefetch: int = 4,
+    reset: bool = False,
+    force: bool = False,
+) -> ReconcileReport:
+    """Run (or resume) one reconciliation pass.
+
+    ``limit`` caps the number of storage files plus DB rows examined in this run; the
+    position reached is saved to the checkpoint and the next run continues from it.
+    Orphans modified within ``grace_seconds`` are reported but never deleted, since
+    they may belong to uploads whose row has not been committed yet. ``force`` lifts
+    the RECONCILE_MAX_MISSING_FRACTION cap on deleting missing rows.
+    """
+    global _running
+    if _running:
+        raise RuntimeError("A storage reconciliation is already running")
+    _running = True
+    try:
+        return await _reconcile(
+            db, storage, checkpoint_path=checkpoint_path, limit=limit, delete_orphans=delete_orphans,
+            delete_missing=delete_missing, grace_seconds=grace_seconds, prefetch=prefetch, reset=reset,
+            force=force,
+        )
+    finally:
+        _running = False
+
+
+async def _reconcile(
+    db: AsyncSession,
+    storage: StorageBackend,
+    *,
+    checkpoint_path: Optional[Path],
+    limit: Optional[int],
+    delete_orphans: bool,
+    delete_missing: bool,
+    grace_seconds: int,
+    prefetch: int,
+    reset: bool,
+    force: bool,
+) -> ReconcileReport:
+    started = time.perf_counter()
+    checkpoint_path = checkpoint_path or Path(settings.RECONCILE_CHECKPOINT_PATH)
+    checkpoint = Checkpoint() if reset else Checkpoint.load(checkpoint_path)
+    root = storage.upload_path
+    after = checkpoint.cursor if checkpoint.cursor.startswith(root.rstrip("/") + "/") else ""
+    report = ReconcileReport(root=root, started_cursor=after)
+    grace_cutoff = datetime.now(timezone.utc) - timedelta(seconds=grace_seconds)
+
+    orphan_batch: List[str] = []
+    # Row deletes wait until the merge is done; ids are small enough to hold
+    missing_ids: List[int] = []
+
+    async def flush_orphans(force: bool = False) -> None:
+        if delete_orphans and orphan_batch and (force or len(orphan_batch) >= DELETE_BATCH_SIZE):
+            report.orphans_deleted += await storage.delete_many(orphan_batch)
+            orphan_batch.clear()
+
+    def orphan(entry: StorageEntry) -> None:
+        report.orphan_count += 1
+        if len(report.orphans) < SAMPLE_SIZE:
+            report.orphans.append(entry.path)
+        if entry.modified is None or entry.modified < grace_cutoff:
+            orphan_batch.append(entry.path)
+
+    def missing(image_id: int, file_path: str) -> None:
+        report.missing_count += 1
+        if len(report.missing) < SAMPLE_SIZE:
+            report.missing.append({"id": image_id, "file_path": file_path})
+        missing_ids.append(image_id)
+
+    files = walk_sorted(storage, root, after=after, prefetch=prefetch)
+    rows = iter_image_paths(db, root, after=after)
+
+    async def next_file() -> Optional[StorageEntry]:
+        try:
+            entry = await files.__anext__()
+        except StopAsyncIteration:
+            return None
+        report.files_scanned += 1
+        return entry
+
+    async def next_row() -> Optional[Tuple[int, str]]:
+        try:
+            row = await rows.__anext__()
+        except StopAsyncIteration:
+            return None
+        report.rows_scanned += 1
+        return row
+
+    file_entry = await next_file()
+    row = await next_row()
+    cursor = after
+    try:
+        while file_entry is not None or row is not None:
+            if limit is not None and report.files_scanned + report.rows_scanned > limit:
+                break
+            if row is None or (file_entry is not None and file_entry.path < row[1]):
+                orphan(file_entry)
+                cursor = file_entry.path
+                file_entry = await next_file()
+            elif file_entry is None or row[1] < file_entry.path:
+                missing(row[0], row[1])
+                cursor = row[1]
+                row = await next_row()
+            else:
+                report.matched += 1
+                cursor = row[1]
+                # Several rows may share one file; they all match it
+                matched_path = row[1]
+                while row is not None and row[1] == matched_path:
+                    row = await next_row()
+                file_entry = await next_file()
+            await flush_orphans()
+        else:
+            report.completed = True
+    finally:
+        await files.aclose()
+        await rows.aclose()
+
+    await flush_orphans(force=True)
+    if delete_missing and missing_ids:
+        report.missing_rows_delete_refused = _refuse_missing_deletion(report, force)
+        if report.missing_rows_delete_refused:
+            logger.warning(
+                "storage reconciliation kept %d missing rows: %s",
+                len(missing_ids), report.missing_rows_delete_refused,
+            )
+            missing_ids = []
+        for i in range(0, len(missing_ids), DELETE_BATCH_SIZE):
+            deleted, skipped = await _delete_missing_rows(db, missing_ids[i:i + DELETE_BATCH_SIZE])
+            report.missing_rows_deleted += deleted
+            report.missing_rows_skipped_with_children += skipped
+
+    report.cursor = "" if report.completed else cursor
+    checkpoint.cursor = report.cursor
+    checkpoint.runs += 1
+    if report.completed:
+        checkpoint.last_completed_at = datetime.now(timezone.utc).isoformat()
+    checkpoint.save(checkpoint_path)
+
+    report.duration_ms = round((time.perf_counter() - started) * 1000, 2)
+    logger.info(
+        "storage reconciliation finished",
+        extra={k: v for k, v in asdict(report).items() if k not in ("orphans", "missing")},
+    )
+    return report
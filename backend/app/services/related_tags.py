@@ -0,0 +1,242 @@
+"""Related tags: the tags that most often appear on the same images as a given tag.
+
+tag_cooccurrence keeps, for every pair of tags sharing at least one image, the number
+of such images. Every change to image_tags adjusts it in the same transaction:
+
+- new or retagged images (upload, update_image) pass the tag sets before and after
+  to ``retag_image``
+- bulk attach/detach (app/services/tag_links.py) count the other tags on the images
+  that actually gain or lose the tag, one grouped query per tag and chunk
+- tag merges call ``merging``; deleted images call ``forget_image_tags`` and tags
+  losing all their links ``forget_tags``
+
+GET /tags/{id}/related reads the top pairs of a tag through an index on
+(tag_id, image_count); ``related_tags_cache`` keeps the RELATED_TAGS_TOP best of each
+tag for RELATED_TAGS_CACHE_SECONDS. Changes made by this process drop the affected
+entries at once; other workers see them when their entries expire.
+"""
+
+import time
+from collections import Counter, OrderedDict
+from itertools import permutations
+from threading import Lock
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, bindparam, delete, exists, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from app.core.config import settings
+from app.core.database import insert_ignore
+from app.core.metrics import metrics
+from app.models.tag import Tag, TagCooccurrence, image_tags
+
+# Related tags cached per tag, before the viewer's visibility is applied
+RELATED_TAGS_TOP = 50
+
+Pairs = Dict[Tuple[int, int], int]
+
+
+def tag_pairs(tag_ids: Iterable[int]) -> Counter:
+    """Both directions of every pair of distinct tags in ``tag_ids``, counted once."""
+    return Counter(permutations(set(tag_ids), 2))
+
+
+class RelatedTagsCache:
+    """LRU of each tag's top co-occurring tags, as (id, name, owner_id, is_public,
+    image_count) rows, kept for ``ttl`` seconds."""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, Tuple[float, List[tuple]]]" = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        metrics.register_collector("related_tags", self.snapshot)
+
+    def get(self, tag_id: int) -> Optional[List[tuple]]:
+        with self._lock:
+            entry = self._entries.get(tag_id)
+            if entry is None or entry[0] <= time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(tag_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, tag_id: int, rows: List[tuple]) -> None:
+        if self.max_entries <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries.pop(tag_id, None)
+            while len(self._entries) >= self.max_entries:
+                self._entries.popitem(last=False)
+            self._entries[tag_id] = (time.monotonic() + self.ttl, rows)
+
+    def invalidate(self, tag_ids: Iterable[int]) -> None:
+        with self._lock:
+            for tag_id in tag_ids:
+                self._entries.pop(tag_id, None)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+# Global singleton instance
+related_tags_cache = RelatedTagsCache(
+    ttl=settings.RELATED_TAGS_CACHE_SECONDS,
+    max_entries=settings.RELATED_TAGS_CACHE_MAX_ENTRIES,
+)
+
+
+async def add_pairs(db: AsyncSession, pairs: Pairs) -> None:
+    """Add ``pairs`` ({(tag_id, other_tag_id): delta}, both directions expected) to
+    tag_cooccurrence, dropping pairs that reach zero."""
+    table = TagCooccurrence.__table__
+    changed = [(tag_id, other_id, delta) for (tag_id, other_id), delta in pairs.items() if delta]
+    if not changed:
+        return
+    added = [
+        {"tag_id": tag_id, "other_tag_id": other_id, "image_count": 0}
+        for tag_id, other_id, delta in changed if delta > 0
+    ]
+    if added:
+        await db.execute(insert_ignore(table), added)
+    await db.execute(
+        update(table)
+        .where(table.c.tag_id == bindparam("pair_tag_id"), table.c.other_tag_id == bindparam("pair_other_id"))
+        .values(image_count=table.c.image_count + bindparam("delta")),
+        [{"pair_tag_id": tag_id, "pair_other_id": other_id, "delta": delta} for tag_id, other_id, delta in changed],
+    )
+    removed = [
+        {"pair_tag_id": tag_id, "pair_other_id": other_id}
+        for tag_id, other_id, delta in changed if delta < 0
+    ]
+    if removed:
+        await db.execute(
+            delete(table).where(
+                table.c.tag_id == bindparam("pair_tag_id"),
+                table.c.other_tag_id == bindparam("pair_other_id"),
+                table.c.image_count <= 0,
+            ),
+            removed,
+        )
+    related_tags_cache.invalidate({tag_id for tag_id, _, _ in changed})
+
+
+async def retag_image(db: AsyncSession, old_tag_ids: Iterable[int], new_tag_ids: Iterable[int]) -> None:
+    """Account for one image's tags changing from ``old_tag_ids`` to ``new_tag_ids``
+    (empty for a new image)."""
+    pairs = tag_pairs(new_tag_ids)
+    pairs.subtract(tag_pairs(old_tag_ids))
+    await add_pairs(db, pairs)
+
+
+async def companion_counts(db: AsyncSession, tag_id: int, image_ids: Sequence[int], has_tag: bool) -> Dict[int, int]:
+    """{other tag: images} over the images in ``image_ids`` that do (``has_tag``) or do
+    not yet carry ``tag_id``: the pairs it gains by being attached to them, or loses by
+    being detached."""
+    carrying = aliased(image_tags)
+    condition = exists().where(carrying.c.image_id == image_tags.c.image_id, carrying.c.tag_id == tag_id)
+    rows = (await db.execute(
+        select(image_tags.c.tag_id, func.count())
+        .where(
+            image_tags.c.image_id.in_(list(image_ids)),
+            image_tags.c.tag_id != tag_id,
+            condition if has_tag else ~condition,
+        )
+        .group_by(image_tags.c.tag_id)
+    )).all()
+    return dict(rows)
+
+
+def _both_ways(tag_id: int, counts: Dict[int, int], sign: int) -> Pairs:
+    pairs: Pairs = {}
+    for other_id, count in counts.items():
+        pairs[(tag_id, other_id)] = sign * count
+        pairs[(other_id, tag_id)] = sign * count
+    return pairs
+
+
+async def attaching(db: AsyncSession, tag_id: int, image_ids: Sequence[int]) -> None:
+    """Call before linking ``tag_id`` to ``image_ids``."""
+    await add_pairs(db, _both_ways(tag_id, await companion_counts(db, tag_id, image_ids, False), 1))
+
+
+async def detaching(db: AsyncSession, tag_id: int, image_ids: Sequence[int]) -> None:
+    """Call before unlinking ``tag_id`` from ``image_ids``."""
+    await add_pairs(db, _both_ways(tag_id, await companion_counts(db, tag_id, image_ids, True), -1))
+
+
+async def forget_image_tags(db: AsyncSession, image_ids: Sequence[int]) -> None:
+    """Call before deleting the images ``image_ids`` (or all their tag links)."""
+    other = aliased(image_tags)
+    rows = (await db.execute(
+        select(image_tags.c.tag_id, other.c.tag_id, func.count())
+        .join(other, and_(other.c.image_id == image_tags.c.image_id, other.c.tag_id != image_tags.c.tag_id))
+        .where(image_tags.c.image_id.in_(list(image_ids)))
+        .group_by(image_tags.c.tag_id, other.c.tag_id)
+    )).all()
+    await add_pairs(db, {(tag_id, other_id): -count for tag_id, other_id, count in rows})
+
+
+async def merging(db: AsyncSession, source_ids: Sequence[int], target_id: int) -> None:
+    """Call before giving ``target_id`` to every image of ``source_ids``: the target
+    gains a pair with each other tag of the images it is new on. The sources' own
+    pairs go with ``forget_tags``."""
+    sources = list(source_ids)
+    merged, carrying = aliased(image_tags), aliased(image_tags)
+    rows = (await db.execute(
+        select(image_tags.c.tag_id, func.count())
+        .where(
+            image_tags.c.image_id.in_(select(merged.c.image_id).where(merged.c.tag_id.in_(sources))),
+            ~exists().where(carrying.c.image_id == image_tags.c.image_id, carrying.c.tag_id == target_id),
+            image_tags.c.tag_id.notin_(sources),
+            image_tags.c.tag_id != target_id,
+        )
+        .group_by(image_tags.c.tag_id)
+    )).all()
+    await add_pairs(db, _both_ways(target_id, dict(rows), 1))
+
+
+async def forget_tags(db: AsyncSession, tag_ids: Sequence[int]) -> None:
+    """Call before removing all image links of ``tag_ids`` (or deleting the tags):
+    drops their pairs in both directions."""
+    ids = list(tag_ids)
+    table = TagCooccurrence.__table__
+    others = (await db.scalars(select(table.c.other_tag_id).where(table.c.tag_id.in_(ids)).distinct())).all()
+    await db.execute(delete(table).where(or_(table.c.tag_id.in_(ids), table.c.other_tag_id.in_(ids))))
+    related_tags_cache.invalidate([*ids, *others])
+
+
+async def related_tags(db: AsyncSession, tag_id: int) -> List[tuple]:
+    """Up to RELATED_TAGS_TOP (id, name, owner_id, is_public, image_count) rows for the
+    tags most often found with ``tag_id``, most frequent first."""
+    rows = related_tags_cache.get(tag_id)
+    if rows is None:
+        table = TagCooccurrence.__table__
+        rows = [tuple(row) for row in (await db.execute(
+            select(Tag.id, Tag.name, Tag.owner_id, Tag.is_public, table.c.image_count)
+            .join(Tag, Tag.id == table.c.other_tag_id)
+            .where(table.c.tag_id == tag_id)
+            .order_by(table.c.image_count.desc(), Tag.id)
+            .limit(RELATED_TAGS_TOP)
+        )).all()]
+        related_tags_cache.put(tag_id, rows)
+    return rows
+
+
+def rebuild_tag_cooccurrence(conn) -> int:
+    """Recount tag_cooccurrence from image_tags with one self-join. Returns the number
+    of rows."""
+    table = TagCooccurrence.__table__
+    other = aliased(image_tags)
+    conn.execute(delete(table))
+    conn.execute(table.insert().from_select(
+        ["tag_id", "other_tag_id", "image_count"],
+        select(image_tags.c.tag_id, other.c.tag_id, func.count())
+        .join(other, and_(other.c.image_id == image_tags.c.image_id, other.c.tag_id != image_tags.c.tag_id))
+        .group_by(image_tags.c.tag_id, other.c.tag_id),
+    ))
+    return conn.scalar(select(func.count()).select_from(table))
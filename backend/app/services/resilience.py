@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Optional
+
+from app.core.metrics import metrics
+
+if TYPE_CHECKING:
+    import httpx
+
+
+class StorageUnavailableError(Exception):
+    """The storage backend cannot take the request right now; clients should retry later."""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = max(1, int(retry_after + 0.999))
+
+
+class CircuitOpenError(StorageUnavailableError):
+    """Raised without contacting the backend while its circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open probe."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._probe_in_flight = False
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless a call may be attempted now."""
+        if self.state == self.CLOSED:
+            return
+        elapsed = time.monotonic() - (self.opened_at or 0.0)
+        if self.state == self.OPEN and elapsed >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return
+        metrics.inc(f"{self.name}.circuit.rejected")
+        raise CircuitOpenError(
+            f"{self.name} is unavailable (circuit open)",
+            retry_after=max(self.reset_timeout - elapsed, 1.0),
+        )
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            metrics.inc(f"{self.name}.circuit.closed")
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+
+    def record_failure(self, error: str) -> None:
+        self.consecutive_failures += 1
+        self.last_error = error
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                metrics.inc(f"{self.name}.circuit.opened")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def release_probe(self) -> None:
+        """Free the half-open slot when a call ends without a verdict (e.g. cancellation)."""
+        self._probe_in_flight = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        retry_in = None
+        if self.state == self.OPEN and self.opened_at is not None:
+            retry_in = round(max(self.reset_timeout - (time.monotonic() - self.opened_at), 0.0), 3)
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "failure_threshold": self.failure_threshold,
+            "reset_timeout": self.reset_timeout,
+            "retry_in": retry_in,
+            "last_error": self.last_error,
+        }
+
+
+class ResiliencePolicy:
+    """Deadlines, jittered exponential retries, a transfer semaphore and a circuit breaker.
+
+    Wrapped callables return an ``httpx.Response``. Transport errors, deadline expiry
+    and 5xx responses count as failures; anything below 500 is the caller's to interpret.
+    Only idempotent operations are retried on failure, except connection errors, where
+    the request never reached the backend and is always safe to resend.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_attempts: int = 3,
+        base_delay: float = 0.2,
+        max_delay: float = 2.0,
+        max_concurrent_transfers: int = 8,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+    ):
+        self.name = name
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_concurrent_transfers = max(1, max_concurrent_transfers)
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_timeout)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._in_flight = 0
+        metrics.register_collector(name, self.snapshot)
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the running loop rather than the import-time one
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent_transfers)
+        return self._semaphore
+
+    def _backoff(self, attempt: int) -> float:
+        # "Full jitter": uniform over [0, min(cap, base * 2^n)]
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+    async def call(
+        self,
+        operation: str,
+        fn: Callable[[], Awaitable[httpx.Response]],
+        *,
+        deadline: float,
+        idempotent: bool,
+        transfer: bool = False,
+    ) -> httpx.Response:
+        started = time.monotonic()
+        metrics.inc(f"{self.name}.{operation}.calls")
+        if transfer:
+            try:
+                await asyncio.wait_for(self.semaphore.acquire(), timeout=deadline)
+            except asyncio.TimeoutError:
+                metrics.inc(f"{self.name}.{operation}.queue_timeouts")
+                raise StorageUnavailableError(f"{self.name} is busy, too many transfers in flight")
+            self._in_flight += 1
+        try:
+            return await self._call_with_retries(operation, fn, started + deadline, idempotent)
+        finally:
+            if transfer:
+                self._in_flight -= 1
+                self.semaphore.release()
+
+    async def _call_with_retries(
+        self,
+        operation: str,
+        fn: Callable[[], Awaitable[httpx.Response]],
+        expires_at: float,
+        idempotent: bool,
+    ) -> httpx.Response:
+        # Imported here so processes using the local storage backend never load httpx
+        import httpx
+
+        attempt = 0
+        while True:
+            attempt += 1
+            self.breaker.before_call()
+            remaining = expires_at - time.monotonic()
+            error: Optional[Exception] = None
+            response: Optional[httpx.Response] = None
+            try:
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                response = await asyncio.wait_for(fn(), timeout=remaining)
+            except asyncio.TimeoutError:
+                error = StorageUnavailableError(f"{self.name} {operation} exceeded its deadline")
+            except httpx.TransportError as e:
+                error = e
+            except BaseException:
+                self.breaker.release_probe()
+                raise
+
+            if error is None and response is not None and response.status_code < 500:
+                self.breaker.record_success()
+                return response
+
+            reason = str(error) if error is not None else f"HTTP {response.status_code}"
+            self.breaker.record_failure(f"{operation}: {reason}")
+            metrics.inc(f"{self.name}.{operation}.failures")
+
+            retryable = idempotent or isinstance(error, httpx.ConnectError)
+            delay = self._backoff(attempt)
+            if not retryable or attempt >= self.max_attempts or time.monotonic() + delay >= expires_at:
+                if response is not None:
+                    return response
+                if isinstance(error, StorageUnavailableError):
+                    raise error
+                raise StorageUnavailableError(f"{self.name} {operation} failed: {reason}") from error
+
+            metrics.inc(f"{self.name}.{operation}.retries")
+            await asyncio.sleep(delay)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "circuit": self.breaker.snapshot(),
+            "transfers_in_flight": self._in_flight,
+            "max_concurrent_transfers": self.max_concurrent_transfers,
+            "max_attempts": self.max_attempts,
+        }
@@ -0,0 +1,104 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterable, Optional
+
+from fastapi import UploadFile
+from app.core.config import settings
+
+# Chunk size used when streaming uploads to a backend
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class StorageEntry:
+    """One item returned by StorageBackend.list()."""
+
+    path: str
+    is_dir: bool
+    size: Optional[int] = None
+    modified: Optional[datetime] = None
+
+
+class StorageBackend(ABC):
+    """Where image files live. File paths are absolute, '/'-separated logical paths
+    (e.g. ``/gallery/3/<uuid>.png``) that are stored verbatim in ``Image.file_path``.
+    """
+
+    name: str = "base"
+    upload_path: str = "/gallery"
+
+    @abstractmethod
+    async def put_stream(self, file: UploadFile, filename: str, subfolder: str = "") -> Dict[str, Any]:
+        """Stream ``file`` into ``{upload_path}/{subfolder}/{filename}``.
+
+        Returns ``{"success": True, "file_path": ..., "url": ..., "size": ...}``.
+        """
+
+    @abstractmethod
+    async def delete_many(self, file_paths: Iterable[str]) -> int:
+        """Delete the given files, returning how many were removed."""
+
+    @abstractmethod
+    def url(self, file_path: str) -> str:
+        """Public URL a browser can fetch the file from."""
+
+    @abstractmethod
+    async def exists(self, file_path: str) -> bool:
+        """Whether a file exists at ``file_path``."""
+
+    @abstractmethod
+    def list(self, dir_path: str) -> AsyncIterator[StorageEntry]:
+        """Yield the direct children of ``dir_path`` (not recursive)."""
+
+    async def delete_file(self, file_path: str) -> bool:
+        return await self.delete_many([file_path]) == 1
+
+    def health(self) -> Dict[str, Any]:
+        return {}
+
+
+def upload_size(file: UploadFile) -> int:
+    """Size of an uploaded file without reading it into memory."""
+    if getattr(file, "size", None) is not None:
+        return file.size
+    position = file.file.tell()
+    file.file.seek(0, 2)
+    size = file.file.tell()
+    file.file.seek(position)
+    return size
+
+
+async def iter_upload(file: UploadFile, chunk_size: int = UPLOAD_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Yield an uploaded file from the start in chunks; safe to call again for a retry."""
+    await file.seek(0)
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+_storage: Optional[StorageBackend] = None
+
+
+def get_storage() -> StorageBackend:
+    """Return the configured storage backend (``STORAGE_BACKEND=alist|local``)."""
+    global _storage
+    if _storage is None:
+        if settings.STORAGE_BACKEND == "local":
+            from app.services.local_storage import LocalStorageBackend
+
+            _storage = LocalStorageBackend(
+                root=settings.LOCAL_STORAGE_ROOT,
+                upload_path=settings.LOCAL_STORAGE_UPLOAD_PATH,
+                url_prefix=f"{settings.API_V1_STR}/files",
+                accel_redirect_prefix=settings.LOCAL_STORAGE_ACCEL_REDIRECT,
+            )
+        elif settings.STORAGE_BACKEND == "alist":
+            from app.services.alist_service import alist_service
+
+            _storage = alist_service
+        else:
+            raise ValueError(f"Unknown STORAGE_BACKEND: {settings.STORAGE_BACKEND}")
+    return _storage
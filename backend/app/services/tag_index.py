@@ -0,0 +1,173 @@
+"""In-process prefix index over tag names for typeahead (GET /tags/suggest).
+
+Tags are kept twice: sorted by case-folded name, where the tags starting with a
+prefix are one bisect away, and sorted by image count. A narrow prefix scans its
+run of names and ranks it; a broad one (a letter or two) walks the usage order and
+stops at the first ``limit`` matches. Each entry carries the visibility attributes
+(owner, is_public) checked per viewer.
+
+The index is loaded with one query on first use, always from the primary database:
+reloads are triggered by writes, which a read replica may not have received yet.
+Tag changes made through the API
+update it in place and bump an epoch file, on which other workers reload; a full
+reload every TAG_SUGGEST_REFRESH_SECONDS also picks up image count drift from
+uploads, edits and deletes.
+"""
+
+import asyncio
+import heapq
+import time
+from bisect import bisect_left, insort
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.epoch import EpochFile
+from app.core.metrics import metrics
+from app.models.tag import Tag, image_tags
+
+# Prefixes matching more tags than this are answered from the usage order
+RANGE_SCAN_LIMIT = 500
+
+
+@dataclass
+class TagEntry:
+    id: int
+    name: str
+    owner_id: Optional[int]
+    is_public: bool
+    image_count: int = 0
+
+    @property
+    def key(self) -> str:
+        return self.name.casefold()
+
+    @property
+    def rank(self) -> Tuple[int, str, int]:
+        return -self.image_count, self.key, self.id
+
+    def visible_to(self, user_id: Optional[int]) -> bool:
+        # Same rule as GET /tags/: public, admin-created, or the viewer's own
+        return self.is_public or self.owner_id is None or (user_id is not None and self.owner_id == user_id)
+
+
+def _discard(ordered: list, item) -> None:
+    position = bisect_left(ordered, item)
+    if position < len(ordered) and ordered[position] == item:
+        del ordered[position]
+
+
+class TagSuggestIndex:
+    def __init__(self, refresh_seconds: float, epoch_path: Path):
+        self.refresh_seconds = refresh_seconds
+        self.epoch = EpochFile(epoch_path)
+        self._entries: Dict[int, TagEntry] = {}
+        self._sorted: List[Tuple[str, int]] = []
+        self._by_usage: List[Tuple[int, str, int]] = []
+        self._loaded_at: Optional[float] = None
+        self._load_lock: Optional[asyncio.Lock] = None
+        self.loads = 0
+        self.lookups = 0
+        metrics.register_collector("tag_index", self.snapshot)
+
+    def _stale(self) -> bool:
+        if self._loaded_at is None or self.epoch.changed():
+            return True
+        return self.refresh_seconds > 0 and time.monotonic() - self._loaded_at > self.refresh_seconds
+
+    async def _ensure_loaded(self) -> None:
+        if not self._stale():
+            return
+        if self._load_lock is None:
+            self._load_lock = asyncio.Lock()
+        loads = self.loads
+        async with self._load_lock:
+            # Another request reloaded while this one waited
+            if self.loads != loads:
+                return
+            async with AsyncSessionLocal() as db:
+                rows = (await db.execute(
+                    select(Tag.id, Tag.name, Tag.owner_id, Tag.is_public, func.count(image_tags.c.image_id))
+                    .outerjoin(image_tags, image_tags.c.tag_id == Tag.id)
+                    .group_by(Tag.id, Tag.name, Tag.owner_id, Tag.is_public)
+                )).all()
+            entries = {row[0]: TagEntry(*row) for row in rows}
+            self._entries = entries
+            self._sorted = sorted((entry.key, entry.id) for entry in entries.values())
+            self._by_usage = sorted(entry.rank for entry in entries.values())
+            self._loaded_at = time.monotonic()
+            self.loads += 1
+
+    async def suggest(self, prefix: str, user_id: Optional[int], limit: int) -> List[TagEntry]:
+        """Tags visible to ``user_id`` (None for anonymous) whose name starts with
+        ``prefix``, case-insensitively; most used first, then by name."""
+        await self._ensure_loaded()
+        self.lookups += 1
+        key = prefix.strip().casefold()
+        entries = self._entries
+        start = bisect_left(self._sorted, (key, -1))
+        end = bisect_left(self._sorted, (key + "\U0010ffff",))
+        if end - start <= RANGE_SCAN_LIMIT:
+            matches = (entries[tag_id] for _, tag_id in self._sorted[start:end])
+            return heapq.nsmallest(
+                limit, (e for e in matches if e.visible_to(user_id)), key=lambda e: e.rank
+            )
+        found = []
+        for _, name_key, tag_id in self._by_usage:
+            if name_key.startswith(key):
+                entry = entries[tag_id]
+                if entry.visible_to(user_id):
+                    found.append(entry)
+                    if len(found) == limit:
+                        break
+        return found
+
+    # Incremental maintenance, called after the change is committed
+
+    def add(self, tag: Tag, image_count: int = 0) -> None:
+        if self._loaded_at is not None:
+            self.remove(tag.id, signal=False)
+            entry = TagEntry(tag.id, tag.name, tag.owner_id, tag.is_public, image_count)
+            self._entries[tag.id] = entry
+            insort(self._sorted, (entry.key, entry.id))
+            insort(self._by_usage, entry.rank)
+        self.epoch.bump()
+
+    def update(self, tag: Tag) -> None:
+        """A tag was renamed or its visibility changed."""
+        entry = self._entries.get(tag.id)
+        self.add(tag, entry.image_count if entry else 0)
+
+    def remove(self, tag_id: int, signal: bool = True) -> None:
+        entry = self._entries.pop(tag_id, None)
+        if entry is not None:
+            _discard(self._sorted, (entry.key, entry.id))
+            _discard(self._by_usage, entry.rank)
+        if signal:
+            self.epoch.bump()
+
+    def remove_many(self, tag_ids) -> None:
+        for tag_id in tag_ids:
+            self.remove(tag_id, signal=False)
+        self.epoch.bump()
+
+    def adjust_count(self, tag_id: int, delta: int) -> None:
+        entry = self._entries.get(tag_id)
+        if entry is not None:
+            _discard(self._by_usage, entry.rank)
+            entry.image_count = max(0, entry.image_count + delta)
+            insort(self._by_usage, entry.rank)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"tags": len(self._entries), "loads": self.loads, "lookups": self.lookups}
+
+
+# Global singleton instance
+tag_index = TagSuggestIndex(
+    refresh_seconds=settings.TAG_SUGGEST_REFRESH_SECONDS,
+    epoch_path=Path(settings.TAG_SUGGEST_EPOCH_PATH),
+)
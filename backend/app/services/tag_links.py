@@ -0,0 +1,87 @@
+"""Set-based changes to the image_tags association: attach, detach, merge or remove
+tags on many images with one statement per tag, without loading either side's
+collection.
+
+Image ids are sent in chunks of TAG_LINK_CHUNK_SIZE to stay under the database's
+bound parameter limit. Tag co-occurrence (app/services/related_tags.py) is updated
+in the same transaction. None of the functions commit; callers apply the returned
+per-tag counts to tag_index after committing.
+"""
+
+from typing import Dict, Iterable, List, Sequence
+
+from sqlalchemy import delete, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import insert_ignore
+from app.models import Image
+from app.models.tag import image_tags
+from app.services.related_tags import attaching, detaching, forget_tags, merging
+
+# Image ids per statement
+TAG_LINK_CHUNK_SIZE = 5000
+
+
+def _chunks(ids: Sequence[int]) -> Iterable[List[int]]:
+    ids = sorted(set(ids))
+    for start in range(0, len(ids), TAG_LINK_CHUNK_SIZE):
+        yield ids[start:start + TAG_LINK_CHUNK_SIZE]
+
+
+async def attach_tags(db: AsyncSession, tag_ids: Sequence[int], image_ids: Sequence[int]) -> Dict[int, int]:
+    """Link every tag in ``tag_ids`` to every existing image in ``image_ids``; links
+    that already exist are skipped. Returns {tag_id: links added}."""
+    added = {tag_id: 0 for tag_id in tag_ids}
+    for chunk in _chunks(image_ids):
+        for tag_id in added:
+            await attaching(db, tag_id, chunk)
+            result = await db.execute(
+                insert_ignore(image_tags).from_select(
+                    ["image_id", "tag_id"],
+                    select(Image.id, literal(tag_id)).where(Image.id.in_(chunk)),
+                )
+            )
+            added[tag_id] += max(result.rowcount, 0)
+    return added
+
+
+async def detach_tags(db: AsyncSession, tag_ids: Sequence[int], image_ids: Sequence[int]) -> Dict[int, int]:
+    """Remove the links between ``tag_ids`` and ``image_ids``. Returns {tag_id: links removed}."""
+    removed = {tag_id: 0 for tag_id in tag_ids}
+    for chunk in _chunks(image_ids):
+        for tag_id in removed:
+            await detaching(db, tag_id, chunk)
+            result = await db.execute(
+                delete(image_tags).where(image_tags.c.tag_id == tag_id, image_tags.c.image_id.in_(chunk))
+            )
+            removed[tag_id] += result.rowcount
+    return removed
+
+
+async def remove_tag_links(db: AsyncSession, tag_ids: Sequence[int]) -> int:
+    """Remove every image link of ``tag_ids``. Returns the number of links removed."""
+    tag_ids = list(tag_ids)
+    await forget_tags(db, tag_ids)
+    result = await db.execute(delete(image_tags).where(image_tags.c.tag_id.in_(tag_ids)))
+    return result.rowcount
+
+
+async def merge_tags(db: AsyncSession, source_ids: Sequence[int], target_id: int) -> int:
+    """Move every image link of ``source_ids`` to ``target_id``: one INSERT ... SELECT
+    that skips images already carrying the target, then one DELETE of the sources'
+    links. The source tags themselves are left for the caller to delete. Returns the
+    number of links the target gained."""
+    source_ids = [tag_id for tag_id in set(source_ids) if tag_id != target_id]
+    if not source_ids:
+        return 0
+    await merging(db, source_ids, target_id)
+    result = await db.execute(
+        insert_ignore(image_tags).from_select(
+            ["image_id", "tag_id"],
+            select(image_tags.c.image_id, literal(target_id))
+            .where(image_tags.c.tag_id.in_(source_ids))
+            .distinct(),
+        )
+    )
+    await remove_tag_links(db, source_ids)
+    return max(result.rowcount, 0)
@@ -1,77 +1,362 @@
-from sqlalchemy.orm import Session
-from app.core.database import SessionLocal
-from app.models import User, Model, Category, Tag
+from contextlib import contextmanager
+from sqlalchemy import Column, DateTime, Integer, String, Table, bindparam, insert, inspect, select, text, update
+from sqlalchemy.engine import Connection, make_url
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.sql import func
+from app.core.config import settings
+from app.core.database import Base, IS_SQLITE, SessionLocal, engine
+from app.core.filelock import file_lock
+from app.models import Category, CustomCategory, CustomModel, Image, KeyValueParameter, Model, User
+from app.models.image import typed_parameter_value
 from app.models.user import UserRole
-from app.core.security import get_password_hash
+from app.services.custom_labels import label_key, normalize_label
+from app.services.parameters import rebuild_parameter_catalog
+from app.services.related_tags import rebuild_tag_cooccurrence
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional, Tuple
+import hashlib
 import logging
+import sqlite3
+import tempfile
 
+logger = logging.getLogger(__name__)
 
-def init_db() -> None:
+# Bump when adding a data migration to MIGRATIONS. New tables, columns and indexes are
+# picked up from the models automatically (see _layout)
+SCHEMA_VERSION = 6
+
+# Rows per UPDATE batch in backfills
+BACKFILL_BATCH_SIZE = 1000
+
+
+def _add_image_lineage(conn: Connection) -> None:
+    """Add images.root_image_id / depth / path and fill them from parent_image_id."""
+    columns = {column["name"] for column in inspect(conn).get_columns("images")}
+    if "root_image_id" not in columns:
+        conn.execute(text("ALTER TABLE images ADD COLUMN root_image_id INTEGER REFERENCES images(id)"))
+    if "depth" not in columns:
+        conn.execute(text("ALTER TABLE images ADD COLUMN depth INTEGER NOT NULL DEFAULT 0"))
+    if "path" not in columns:
+        conn.execute(text("ALTER TABLE images ADD COLUMN path TEXT"))
+
+    parents = dict(conn.execute(select(Image.id, Image.parent_image_id)).all())
+    lineage: Dict[int, dict] = {}
+    for image_id in parents:
+        if image_id in lineage:
+            continue
+        # Walk up until an image that is already resolved or a root; images whose
+        # parent is missing (or part of a cycle) start a lineage of their own
+        chain = [image_id]
+        seen = {image_id}
+        while True:
+            parent_id = parents[chain[-1]]
+            if parent_id is None or parent_id not in parents or parent_id in seen or parent_id in lineage:
+                break
+            chain.append(parent_id)
+            seen.add(parent_id)
+        for node in reversed(chain):
+            parent_id = parents[node]
+            parent = lineage.get(parent_id) if parent_id is not None else None
+            if parent is None:
+                lineage[node] = {"root_image_id": node, "depth": 0, "path": f"/{node}/"}
+            else:
+                lineage[node] = {
+                    "root_image_id": parent["root_image_id"],
+                    "depth": parent["depth"] + 1,
+                    "path": f"{parent['path']}{node}/",
+                }
+
+    statement = (
+        update(Image.__table__)
+        .where(Image.__table__.c.id == bindparam("image_id"))
+        .values(
+            root_image_id=bindparam("root_image_id"),
+            depth=bindparam("depth"),
+            path=bindparam("path"),
+        )
+    )
+    rows = [{"image_id": image_id, **fields} for image_id, fields in lineage.items()]
+    for start in range(0, len(rows), BACKFILL_BATCH_SIZE):
+        conn.execute(statement, rows[start:start + BACKFILL_BATCH_SIZE])
+    logger.info("Backfilled lineage for %d images", len(rows))
+
+
+def _intern_custom_labels(conn: Connection) -> None:
+    """Move images.custom_model / custom_category into the custom_models /
+    custom_categories lookup tables, referenced by custom_model_id / custom_category_id.
+
+    Spellings that differ only in case or whitespace become one label, named after the
+    spelling of the oldest image. The text columns are dropped where the database
+    supports DROP COLUMN (SQLite 3.35+, PostgreSQL, MySQL) and left unused otherwise.
+    """
+    columns = {column["name"] for column in inspect(conn).get_columns("images")}
+    for legacy, label_model in (("custom_model", CustomModel), ("custom_category", CustomCategory)):
+        id_column = f"{legacy}_id"
+        if id_column not in columns:
+            conn.execute(text(
+                f"ALTER TABLE images ADD COLUMN {id_column} INTEGER REFERENCES {label_model.__tablename__}(id)"
+            ))
+        if legacy not in columns:
+            continue
+
+        values = conn.execute(text(
+            f"SELECT id, {legacy} FROM images WHERE {legacy} IS NOT NULL ORDER BY id"
+        )).all()
+        labels: Dict[str, str] = {}
+        for _, value in values:
+            name = normalize_label(value)
+            if name is not None:
+                labels.setdefault(name.casefold(), name)
+        existing = set(conn.scalars(select(label_model.key)))
+        missing = [{"name": name, "key": key} for key, name in labels.items() if key not in existing]
+        if missing:
+            conn.execute(insert(label_model), missing)
+        ids = dict(conn.execute(select(label_model.key, label_model.id)).all())
+
+        statement = (
+            update(Image.__table__)
+            .where(Image.__table__.c.id == bindparam("image_id"))
+            .values({id_column: bindparam("label_id")})
+        )
+        rows = [
+            {"image_id": image_id, "label_id": ids[label_key(value)]}
+            for image_id, value in values
+            if normalize_label(value) is not None
+        ]
+        for start in range(0, len(rows), BACKFILL_BATCH_SIZE):
+            conn.execute(statement, rows[start:start + BACKFILL_BATCH_SIZE])
+        logger.info("Interned %d %s values into %d labels", len(rows), legacy, len(labels))
+
+        if conn.dialect.name != "sqlite" or sqlite3.sqlite_version_info >= (3, 35, 0):
+            conn.execute(text(f"ALTER TABLE images DROP COLUMN {legacy}"))
+
+
+def _add_typed_parameters(conn: Connection) -> None:
+    """Add key_value_parameters.num_value / text_value, fill them from value, and count
+    the parameter catalog (parameter_value_stats)."""
+    columns = {column["name"] for column in inspect(conn).get_columns("key_value_parameters")}
+    if "num_value" not in columns:
+        conn.execute(text("ALTER TABLE key_value_parameters ADD COLUMN num_value FLOAT"))
+    if "text_value" not in columns:
+        conn.execute(text("ALTER TABLE key_value_parameters ADD COLUMN text_value VARCHAR(500)"))
+
+    table = KeyValueParameter.__table__
+    statement = (
+        update(table)
+        .where(table.c.id == bindparam("parameter_id"))
+        .values(num_value=bindparam("num"), text_value=bindparam("text"))
+    )
+    last_id, typed = 0, 0
+    while True:
+        rows = conn.execute(
+            select(table.c.id, table.c.value)
+            .where(table.c.id > last_id, table.c.value.isnot(None))
+            .order_by(table.c.id)
+            .limit(BACKFILL_BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        batch = []
+        for parameter_id, value in rows:
+            number, text_value = typed_parameter_value(value)
+            batch.append({"parameter_id": parameter_id, "num": number, "text": text_value})
+        conn.execute(statement, batch)
+        typed += len(batch)
+        last_id = rows[-1].id
+    logger.info("Typed %d parameter values, %d catalog entries", typed, rebuild_parameter_catalog(conn))
+
+
+def _count_tag_cooccurrence(conn: Connection) -> None:
+    """Fill tag_cooccurrence from the existing image tags."""
+    logger.info("Counted %d tag pairs", rebuild_tag_cooccurrence(conn))
+
+
+def _canonicalize_parameter_catalog(conn: Connection) -> None:
+    """Recount parameter_value_stats with numbers merged by value ("30" and "30.0")."""
+    logger.info("Counted %d parameter catalog entries", rebuild_parameter_catalog(conn))
+
+
+# version -> step run once, in order, when upgrading a database from an older version
+MIGRATIONS: Dict[int, Callable[[Connection], None]] = {
+    2: _add_image_lineage,
+    3: _intern_custom_labels,
+    4: _add_typed_parameters,
+    5: _count_tag_cooccurrence,
+    6: _canonicalize_parameter_catalog,
+}
+
+schema_version = Table(
+    "schema_version",
+    Base.metadata,
+    Column("id", Integer, primary_key=True),
+    Column("version", Integer, nullable=False),
+    Column("layout", String(64), nullable=False),
+    Column("updated_at", DateTime(timezone=True), server_default=func.now(), onupdate=func.now()),
+)
+
+
+def _layout() -> str:
+    """Digest of the tables, columns and indexes the models define."""
+    parts = []
+    for table in sorted(Base.metadata.sorted_tables, key=lambda t: t.name):
+        columns = ",".join(sorted(table.columns.keys()))
+        indexes = ",".join(sorted(index.name for index in table.indexes if index.name))
+        parts.append(f"{table.name}:{columns}:{indexes}")
+    return hashlib.sha1(";".join(parts).encode()).hexdigest()
+
+
+def _stored_version(conn: Connection) -> Optional[Tuple[int, str]]:
+    try:
+        row = conn.execute(select(schema_version.c.version, schema_version.c.layout)).first()
+    except DBAPIError:
+        # Table not created yet
+        conn.rollback()
+        return None
+    return (row.version, row.layout) if row else None
+
+
+@contextmanager
+def _init_lock() -> Iterator[None]:
+    """Serialize initialization between workers: a PostgreSQL advisory lock (which also
+    covers other hosts), or a file lock next to the SQLite file / in the temp dir."""
+    if engine.dialect.name == "postgresql":
+        with engine.connect() as conn:
+            conn.execute(text("SELECT pg_advisory_lock(hashtext('aimagine-init'))"))
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(hashtext('aimagine-init'))"))
+        return
+    database = make_url(settings.DATABASE_URL).database if IS_SQLITE else None
+    if database and database != ":memory:":
+        base = Path(database).resolve()
+        lock_path = base.with_name(base.name + ".init.lock")
+    else:
+        lock_path = Path(tempfile.gettempdir()) / "aimagine-db.init.lock"
+    with file_lock(lock_path):
+        yield
+
+
+def _create_missing_indexes(conn: Connection) -> None:
+    """create_all only builds indexes together with their table; add the ones declared
+    on tables that already existed."""
+    inspector = inspect(conn)
+    existing_tables = set(inspector.get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        present = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in present:
+                index.create(conn, checkfirst=True)
+
+
+def initialize_database() -> bool:
+    """Bring the schema up to date and seed default data if the database needs it.
+
+    The common case, an up-to-date database, costs a single SELECT on schema_version.
+    Otherwise one worker (under _init_lock) creates missing tables and indexes, runs
+    pending MIGRATIONS, seeds, and records the new version; the others wait and then
+    see it. Returns True if this process did the work.
+    """
+    layout = _layout()
+    with engine.connect() as conn:
+        if _stored_version(conn) == (SCHEMA_VERSION, layout):
+            return False
+
+    with _init_lock():
+        with engine.connect() as conn:
+            stored = _stored_version(conn)
+        if stored == (SCHEMA_VERSION, layout):
+            return False
+
+        with engine.begin() as conn:
+            # A database with tables but no schema_version predates it (version 1); a
+            # new one is created at the current version and has nothing to migrate
+            if stored:
+                from_version = stored[0]
+            else:
+                from_version = 1 if inspect(conn).has_table("images") else SCHEMA_VERSION
+            Base.metadata.create_all(bind=conn)
+            for version in sorted(MIGRATIONS):
+                if from_version < version <= SCHEMA_VERSION:
+                    logger.info("Running database migration %d", version)
+                    MIGRATIONS[version](conn)
+            _create_missing_indexes(conn)
+
+        if not init_db():
+            return True
+
+        with engine.begin() as conn:
+            conn.execute(schema_version.delete())
+            conn.execute(insert(schema_version).values(id=1, version=SCHEMA_VERSION, layout=layout))
+        logger.info("Database schema at version %d", SCHEMA_VERSION)
+        return True
+
+
+# bcrypt hash of the documented default password "admin123", so seeding never has to
+# run bcrypt; it is upgraded to BCRYPT_ROUNDS on the first login
+DEFAULT_ADMIN_PASSWORD_HASH = "$2b$12$tzu25mtxo93i1wFWPxCsPOZH1uoKyMju5z2F2ZwTpKwM1IY8UkDR."
+
+DEFAULT_MODELS = [
+    {"name": "Stable Diffusion 5.0", "description": "Advanced text-to-image model"},
+    {"name": "DALL-E 4.0", "description": "OpenAI's image generation model"},
+    {"name": "MidJourney V6.1", "description": "High-quality artistic image generator"},
+    {"name": "Seedream 4.0", "description": "Creative AI image model"},
+    {"name": "混元图像 3.0", "description": "Tencent's Chinese image model"},
+    {"name": "HiDream-I1", "description": "Dream-inspired image generator"},
+    {"name": "Imagen 3", "description": "Google's image generation model"},
+    {"name": "Nano Banana", "description": "Compact and efficient model"},
+    {"name": "即梦 4.0", "description": "Chinese dream-themed model"},
+]
+
+DEFAULT_CATEGORIES = [
+    {"name": "风景", "description": "Natural landscapes and scenery"},
+    {"name": "人物", "description": "Portraits and character art"},
+    {"name": "二次元", "description": "Anime and manga style art"},
+    {"name": "抽象", "description": "Abstract and conceptual art"},
+    {"name": "建筑", "description": "Architecture and buildings"},
+    {"name": "动物", "description": "Animals and wildlife"},
+    {"name": "科幻", "description": "Science fiction themes"},
+]
+
+
+def init_db() -> bool:
+    """Seed the admin user, models and categories that are missing. Idempotent: one
+    SELECT and at most one INSERT per table. Returns False if seeding failed."""
     db = SessionLocal()
     
     try:
-        created_anything = False
-        # Create default admin user
-        admin_user = db.query(User).filter(User.username == "admin").first()
-        if not admin_user:
-            admin_user = User(
+        created = 0
+        if db.scalar(select(User.id).where(User.username == "admin")) is None:
+            db.execute(insert(User).values(
                 username="admin",
                 email="admin@example.com",
-                hashed_password=get_password_hash("admin123"),
-                role=UserRole.admin
-            )
-            db.add(admin_user)
-            db.commit()
-            created_anything = True
-        
-        # Create default models
-        default_models = [
-            {"name": "Stable Diffusion 5.0", "description": "Advanced text-to-image model"},
-            {"name": "DALL-E 4.0", "description": "OpenAI's image generation model"},
-            {"name": "MidJourney V6.1", "description": "High-quality artistic image generator"},
-            {"name": "Seedream 4.0", "description": "Creative AI image model"},
-            {"name": "混元图像 3.0", "description": "Tencent's Chinese image model"},
-            {"name": "HiDream-I1", "description": "Dream-inspired image generator"},
-            {"name": "Imagen 3", "description": "Google's image generation model"},
-            {"name": "Nano Banana", "description": "Compact and efficient model"},
-            {"name": "即梦 4.0", "description": "Chinese dream-themed model"},
-        ]
-        
-        for model_data in default_models:
-            model = db.query(Model).filter(Model.name == model_data["name"]).first()
-            if not model:
-                model = Model(**model_data)
-                db.add(model)
-                created_anything = True
-        
-        # Create default categories
-        default_categories = [
-            {"name": "风景", "description": "Natural landscapes and scenery"},
-            {"name": "人物", "description": "Portraits and character art"},
-            {"name": "二次元", "description": "Anime and manga style art"},
-            {"name": "抽象", "description": "Abstract and conceptual art"},
-            {"name": "建筑", "description": "Architecture and buildings"},
-            {"name": "动物", "description": "Animals and wildlife"},
-            {"name": "科幻", "description": "Science fiction themes"},
-        ]
+                hashed_password=DEFAULT_ADMIN_PASSWORD_HASH,
+                role=UserRole.admin,
+                is_active=True,
+            ))
+            created += 1
         
-        for cat_data in default_categories:
-            category = db.query(Category).filter(Category.name == cat_data["name"]).first()
-            if not category:
-                category = Category(**cat_data)
-                db.add(category)
-                created_anything = True
+        for model, defaults in ((Model, DEFAULT_MODELS), (Category, DEFAULT_CATEGORIES)):
+            existing = set(db.scalars(select(model.name).where(model.name.in_([d["name"] for d in defaults]))))
+            missing = [d for d in defaults if d["name"] not in existing]
+            if missing:
+                db.execute(insert(model), missing)
+                created += len(missing)
         
         db.commit()
-        if created_anything:
-            logging.getLogger(__name__).info("Database initialized with default data.")
+        if created:
+            logger.info("Database initialized with default data.")
+        return True
         
     except Exception as e:
-        logging.getLogger(__name__).exception("Error initializing database: %s", e)
+        logger.exception("Error initializing database: %s", e)
         db.rollback()
+        return False
     finally:
         db.close()
 
 
 if __name__ == "__main__":
-    init_db()
\ No newline at end of file
+    initialize_database()
\ No newline at end of file
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark.
+
+Starts fresh Python processes that import the API and run its startup hooks against a
+throwaway SQLite database, the way a new container or a restarted worker does, and
+reports process wall time, import time and startup-hook time. The first run of each
+database initializes it; the remaining runs measure an ordinary restart.
+
+Usage:
+    python scripts/bench_startup.py --runs 10
+    python scripts/bench_startup.py --runs 10 --fresh     # every run gets a new database
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+BACKEND = Path(__file__).parent.parent / "backend"
+
+# Runs in the child process; timings are relative to interpreter start-up being done
+CHILD = """
+import asyncio, json, sys, time
+started = time.perf_counter()
+from app.main import app
+imported = time.perf_counter()
+asyncio.run(app.router.startup())
+ready = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "startup_ms": (ready - imported) * 1000,
+    "modules": len(sys.modules),
+}))
+"""
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def boot(env: Dict[str, str]) -> Dict[str, float]:
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD], cwd=BACKEND, env=env, capture_output=True, text=True, check=True
+    )
+    sample = json.loads(result.stdout.strip().splitlines()[-1])
+    sample["wall_ms"] = (time.perf_counter() - started) * 1000
+    return sample
+
+
+def report(name: str, samples: List[Dict[str, float]]) -> None:
+    print(f"{name} ({len(samples)} runs):")
+    for key in ("wall_ms", "import_ms", "startup_ms"):
+        values = [s[key] for s in samples]
+        print(
+            f"  {key[:-3]:<8} p50 {percentile(values, 50):7.1f} ms   "
+            f"p95 {percentile(values, 95):7.1f} ms   mean {statistics.mean(values):7.1f} ms"
+        )
+    print(f"  modules  {int(samples[-1]['modules'])}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="API process cold-start benchmark")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--fresh", action="store_true", help="initialize a new database on every run")
+    parser.add_argument("--storage", default="local", choices=["local", "alist"], help="STORAGE_BACKEND for the runs")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="aimagine-startup-")
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{workdir}/startup.db",
+        "CONFIG_TOML_PATH": f"{workdir}/config.toml",
+        "AUTH_CACHE_EPOCH_PATH": f"{workdir}/auth_cache.epoch",
+        "STORAGE_BACKEND": args.storage,
+        "LOCAL_STORAGE_ROOT": f"{workdir}/storage",
+        "LOG_LEVEL": "WARNING",
+    }
+
+    first: List[Dict[str, float]] = []
+    restarts: List[Dict[str, float]] = []
+    for i in range(args.runs):
+        if args.fresh:
+            env["DATABASE_URL"] = f"sqlite:///{workdir}/startup-{i}.db"
+        sample = boot(env)
+        (first if args.fresh or i == 0 else restarts).append(sample)
+
+    report("first boot", first)
+    if restarts:
+        report("restart", restarts)
+
+
+if __name__ == "__main__":
+    main()
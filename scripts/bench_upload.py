@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+End-to-end upload/delete throughput benchmark.
+
+Runs the API in-process against the fake AList server (scripts/fake_alist.py) with a
+throwaway SQLite database, drives POST /api/v1/images/ concurrently and reports
+images/sec, p50/p99 latency and peak RSS. Optionally measures deletes too.
+
+Usage:
+    python scripts/bench_upload.py --images 500 --concurrency 16 --size-kb 512 --latency-ms 5
+"""
+
+import argparse
+import asyncio
+import io
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, List
+
+sys.path.append(str(Path(__file__).parent.parent / "backend"))
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def make_png(size_kb: int) -> bytes:
+    from PIL import Image as PILImage
+
+    # Random pixels barely compress, so the PNG lands close to the requested size
+    side = max(8, int((size_kb * 1024 / 3) ** 0.5))
+    img = PILImage.frombytes("RGB", (side, side), os.urandom(side * side * 3))
+    buf = io.BytesIO()
+    img.save(buf, format="PNG", compress_level=0)
+    return buf.getvalue()
+
+
+async def run_phase(name: str, count: int, concurrency: int, op: Callable[[int], Awaitable[bool]]) -> None:
+    latencies: List[float] = []
+    failures = 0
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index, failures
+        while next_index < count:
+            i = next_index
+            next_index += 1
+            started = time.perf_counter()
+            ok = await op(i)
+            latencies.append(time.perf_counter() - started)
+            if not ok:
+                failures += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    print(f"{name}:")
+    print(f"  requests     {count} ({failures} failed)")
+    print(f"  throughput   {count / elapsed:.1f} images/sec")
+    print(f"  latency p50  {percentile(latencies, 50) * 1000:.1f} ms")
+    print(f"  latency p99  {percentile(latencies, 99) * 1000:.1f} ms")
+    print(f"  mean         {statistics.mean(latencies) * 1000:.1f} ms")
+    print(f"  peak RSS     {peak_rss_mb():.1f} MB")
+
+
+async def main(args: argparse.Namespace) -> None:
+    import httpx
+    import uvicorn
+    from fake_alist import create_app
+
+    fake = create_app(
+        latency=args.latency_ms / 1000,
+        bandwidth=args.bandwidth_mbps * 125_000 if args.bandwidth_mbps else None,
+        error_rate=args.error_rate,
+        seed=0,
+    )
+    server = uvicorn.Server(uvicorn.Config(fake, host="127.0.0.1", port=args.alist_port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    # Import only after the environment points at the throwaway database and fake AList
+    from app.main import app
+
+    await app.router.startup()
+    payload = make_png(args.size_kb)
+    print(f"payload {len(payload) / 1024:.0f} KiB, {args.images} images, concurrency {args.concurrency}")
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        login = await client.post("/api/v1/auth/login", data={"username": "admin", "password": "admin123"})
+        login.raise_for_status()
+        headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+        image_ids: List[int] = []
+
+        async def upload(i: int) -> bool:
+            response = await client.post(
+                "/api/v1/images/",
+                headers=headers,
+                files={"file": (f"bench-{i}.png", payload, "image/png")},
+                data={"prompt": f"benchmark image {i}", "model_id": "1", "category_id": "1"},
+            )
+            if response.status_code == 200:
+                image_ids.append(response.json()["id"])
+                return True
+            return False
+
+        await run_phase("upload", args.images, args.concurrency, upload)
+
+        if args.delete:
+            async def delete(i: int) -> bool:
+                if i >= len(image_ids):
+                    return False
+                response = await client.delete(
+                    f"/api/v1/images/{image_ids[i]}", headers=headers, params={"delete_from_alist": True}
+                )
+                return response.status_code == 200
+
+            await run_phase("delete", len(image_ids), args.concurrency, delete)
+
+    print(f"fake AList: {fake.state.stats}")
+    server.should_exit = True
+    await server_task
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Upload throughput benchmark against a fake AList")
+    parser.add_argument("--images", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--size-kb", type=int, default=256)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="fake AList per-request latency")
+    parser.add_argument("--bandwidth-mbps", type=float, default=0.0, help="fake AList upload cap, 0 = unlimited")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of fake AList requests that fail")
+    parser.add_argument("--alist-port", type=int, default=5299)
+    parser.add_argument("--delete", action="store_true", help="also benchmark deleting the uploaded images")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="aimagine-bench-")
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{workdir}/bench.db",
+        "CONFIG_TOML_PATH": f"{workdir}/config.toml",
+        "STORAGE_BACKEND": "alist",
+        "ALIST_URL": f"http://127.0.0.1:{args.alist_port}",
+        "ALIST_USERNAME": "admin",
+        "ALIST_PASSWORD": "admin",
+        "ALIST_TOKEN": "",
+    })
+    asyncio.run(main(args))
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Version-tree retrieval benchmark.
+
+Builds synthetic iteration trees in a throwaway SQLite database and times
+GET /api/v1/images/{id}/versions, requested from the deepest node. Reports latency and
+the number of SQL statements per request for each shape:
+
+    deep    a single chain of --nodes iterations
+    wide    one root with --nodes - 1 direct iterations
+    bushy   a tree where every node has --fanout iterations
+
+Usage:
+    python scripts/bench_versions.py --nodes 200 --requests 20
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+sys.path.append(str(Path(__file__).parent.parent / "backend"))
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def shape_parents(shape: str, nodes: int, fanout: int) -> List[Optional[int]]:
+    """Parent index (into the same list) of each node; None for the root."""
+    if shape == "deep":
+        return [None] + list(range(nodes - 1))
+    if shape == "wide":
+        return [None] + [0] * (nodes - 1)
+    return [None] + [(i - 1) // fanout for i in range(1, nodes)]
+
+
+def build_tree(engine, owner_id: int, tag_ids: List[int], parents: List[Optional[int]], first_id: int) -> Tuple[int, int]:
+    """Insert one tree with ids starting at ``first_id``; returns (root id, deepest id)."""
+    from sqlalchemy import insert
+    from app.models import Image, KeyValueParameter
+    from app.models.tag import image_tags
+
+    ids = [first_id + i for i in range(len(parents))]
+    depth: Dict[int, int] = {}
+    paths: Dict[int, str] = {}
+    rows = []
+    for i, parent in enumerate(parents):
+        depth[i] = 0 if parent is None else depth[parent] + 1
+        paths[i] = f"/{ids[i]}/" if parent is None else f"{paths[parent]}{ids[i]}/"
+        rows.append({
+            "id": ids[i],
+            "prompt": f"benchmark iteration {i}",
+            "alist_url": f"/bench/{ids[i]}.png",
+            "file_path": f"/bench/{ids[i]}.png",
+            "file_name": f"{ids[i]}.png",
+            "is_public": True,
+            "owner_id": owner_id,
+            "model_id": 1,
+            "category_id": 1,
+            "parent_image_id": None if parent is None else ids[parent],
+            "root_image_id": ids[0],
+            "depth": depth[i],
+            "path": paths[i],
+        })
+    with engine.begin() as conn:
+        conn.execute(insert(Image), rows)
+        conn.execute(insert(image_tags), [{"image_id": i, "tag_id": t} for i in ids for t in tag_ids])
+        conn.execute(insert(KeyValueParameter), [
+            {"image_id": i, "key": key, "value": value}
+            for i in ids for key, value in (("steps", "30"), ("cfg", "7"), ("seed", str(i)))
+        ])
+    deepest = max(depth, key=depth.get)
+    return ids[0], ids[deepest]
+
+
+async def main(args: argparse.Namespace) -> None:
+    import httpx
+    from sqlalchemy import event, insert
+    from app.core.database import async_engine, engine
+    from app.main import app
+    from app.models import Tag
+
+    await app.router.startup()
+    with engine.begin() as conn:
+        conn.execute(insert(Tag), [{"name": f"bench-{i}"} for i in range(3)])
+    tag_ids = [1, 2, 3]
+
+    statements = 0
+
+    def count(*_):
+        nonlocal statements
+        statements += 1
+
+    request_engine = async_engine.sync_engine if async_engine is not None else engine
+    event.listen(request_engine, "before_cursor_execute", count)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        login = await client.post("/api/v1/auth/login", data={"username": "admin", "password": "admin123"})
+        login.raise_for_status()
+        headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+        next_id = 1
+        for shape in ("deep", "wide", "bushy"):
+            parents = shape_parents(shape, args.nodes, args.fanout)
+            _, deepest_id = build_tree(engine, 1, tag_ids, parents, next_id)
+            next_id += len(parents)
+
+            latencies: List[float] = []
+            per_request = 0
+            for _ in range(args.requests):
+                statements = 0
+                started = time.perf_counter()
+                response = await client.get(f"/api/v1/images/{deepest_id}/versions", headers=headers)
+                latencies.append(time.perf_counter() - started)
+                response.raise_for_status()
+                assert len(response.json()) == len(parents), (shape, len(response.json()))
+                per_request = statements
+
+            print(f"{shape} ({len(parents)} nodes, requested from id {deepest_id}):")
+            print(f"  statements   {per_request} per request")
+            print(f"  latency p50  {percentile(latencies, 50) * 1000:.1f} ms")
+            print(f"  latency p95  {percentile(latencies, 95) * 1000:.1f} ms")
+            print(f"  mean         {statistics.mean(latencies) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Version-tree retrieval benchmark")
+    parser.add_argument("--nodes", type=int, default=200, help="images per tree")
+    parser.add_argument("--fanout", type=int, default=3, help="iterations per node in the bushy tree")
+    parser.add_argument("--requests", type=int, default=20, help="timed requests per shape")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="aimagine-bench-")
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{workdir}/bench.db",
+        "CONFIG_TOML_PATH": f"{workdir}/config.toml",
+        "AUTH_CACHE_EPOCH_PATH": f"{workdir}/auth_cache.epoch",
+        "STORAGE_BACKEND": "local",
+        "LOCAL_STORAGE_ROOT": f"{workdir}/storage",
+        "RATE_LIMIT_ENABLED": "false",
+        "LOG_LEVEL": "WARNING",
+    })
+    asyncio.run(main(args))
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+In-process stand-in for an Openlist/AList server, for benchmarks and local runs
+without a real AList container.
+
+Implements the subset of the API the backend uses:
+/api/auth/login, /api/me, /api/fs/put, /api/fs/mkdir, /api/fs/remove,
+/api/fs/list and /api/fs/get. Only file sizes are kept, in memory.
+
+Usage:
+    python scripts/fake_alist.py --port 5245 --latency-ms 20 --bandwidth-mbps 200 --error-rate 0.01
+"""
+
+import argparse
+import asyncio
+import posixpath
+import random
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+FAKE_TOKEN = "fake-alist-token"
+
+
+def _ok(data=None) -> JSONResponse:
+    return JSONResponse({"code": 200, "message": "success", "data": data})
+
+
+def _fail(code: int, message: str) -> JSONResponse:
+    # AList reports most errors with HTTP 200 and the real status in the body
+    return JSONResponse({"code": code, "message": message, "data": None})
+
+
+def create_app(
+    latency: float = 0.0,
+    bandwidth: Optional[float] = None,
+    error_rate: float = 0.0,
+    seed: Optional[int] = None,
+) -> FastAPI:
+    """Build the fake server.
+
+    latency: seconds added to every request.
+    bandwidth: upload throughput cap in bytes/second (None = unlimited).
+    error_rate: fraction of requests answered with HTTP 500 before doing any work.
+    """
+    app = FastAPI(title="fake-alist")
+    rng = random.Random(seed)
+    # path -> (size, modified); directories have size None
+    entries: Dict[str, tuple] = {"/": (None, datetime.now(timezone.utc))}
+    app.state.entries = entries
+    app.state.stats = {"requests": 0, "injected_errors": 0, "bytes_received": 0}
+
+    def _mkdirs(path: str) -> None:
+        while path and path not in entries:
+            entries[path] = (None, datetime.now(timezone.utc))
+            path = posixpath.dirname(path)
+
+    @app.middleware("http")
+    async def inject_faults(request: Request, call_next):
+        app.state.stats["requests"] += 1
+        if latency:
+            await asyncio.sleep(latency)
+        if error_rate and rng.random() < error_rate:
+            app.state.stats["injected_errors"] += 1
+            return JSONResponse({"code": 500, "message": "injected failure"}, status_code=500)
+        if request.url.path != "/api/auth/login" and request.headers.get("Authorization") != FAKE_TOKEN:
+            return _fail(401, "token is invalidated")
+        return await call_next(request)
+
+    @app.post("/api/auth/login")
+    async def login():
+        return _ok({"token": FAKE_TOKEN})
+
+    @app.get("/api/me")
+    async def me():
+        return _ok({"id": 1, "username": "admin", "base_path": "/"})
+
+    @app.put("/api/fs/put")
+    async def put(request: Request):
+        file_path = request.headers.get("File-Path")
+        if not file_path:
+            return _fail(400, "File-Path header is required")
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+            if bandwidth:
+                await asyncio.sleep(len(chunk) / bandwidth)
+        app.state.stats["bytes_received"] += size
+        _mkdirs(posixpath.dirname(file_path))
+        entries[file_path] = (size, datetime.now(timezone.utc))
+        return _ok()
+
+    @app.post("/api/fs/mkdir")
+    async def mkdir(request: Request):
+        body = await request.json()
+        _mkdirs(body.get("path") or "/")
+        return _ok()
+
+    @app.post("/api/fs/remove")
+    async def remove(request: Request):
+        body = await request.json()
+        dir_path = body.get("dir") or "/"
+        for name in body.get("names") or []:
+            target = posixpath.join(dir_path, name)
+            for path in [p for p in entries if p == target or p.startswith(target + "/")]:
+                del entries[path]
+        return _ok()
+
+    @app.post("/api/fs/get")
+    async def get(request: Request):
+        body = await request.json()
+        path = body.get("path")
+        if path not in entries:
+            return _fail(500, "object not found")
+        size, modified = entries[path]
+        return _ok({"name": posixpath.basename(path), "size": size or 0, "is_dir": size is None,
+                    "modified": modified.isoformat()})
+
+    @app.post("/api/fs/list")
+    async def list_dir(request: Request):
+        body = await request.json()
+        path = (body.get("path") or "/").rstrip("/") or "/"
+        if path not in entries or entries[path][0] is not None:
+            return _fail(500, "object not found")
+        page = max(int(body.get("page") or 1), 1)
+        per_page = int(body.get("per_page") or 0)
+        children = [p for p in entries if p != "/" and posixpath.dirname(p) == path]
+        window = children[(page - 1) * per_page: page * per_page] if per_page else children
+        content = [
+            {"name": posixpath.basename(p), "size": entries[p][0] or 0, "is_dir": entries[p][0] is None,
+             "modified": entries[p][1].isoformat()}
+            for p in window
+        ]
+        return _ok({"content": content, "total": len(children)})
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake AList server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5245)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--bandwidth-mbps", type=float, default=0.0, help="0 = unlimited")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    app = create_app(
+        latency=args.latency_ms / 1000,
+        bandwidth=args.bandwidth_mbps * 125_000 if args.bandwidth_mbps else None,
+        error_rate=args.error_rate,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Reconcile storage with the images table.
+
+Reports files in storage that no image references (orphans) and images whose file
+is gone (missing), optionally cleaning both. Runs resume from the checkpoint in
+RECONCILE_CHECKPOINT_PATH; use --limit to work through a large gallery in slices.
+
+Usage:
+    python scripts/reconcile.py                      # report only
+    python scripts/reconcile.py --limit 50000        # one incremental slice
+    python scripts/reconcile.py --delete-orphans --delete-missing
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+from dataclasses import asdict
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent / "backend"))
+
+
+async def run(args: argparse.Namespace) -> dict:
+    from app.core.database import AsyncSessionLocal
+    from app.services.reconcile import reconcile
+    from app.services.storage import get_storage
+
+    async with AsyncSessionLocal() as db:
+        report = await reconcile(
+            db,
+            get_storage(),
+            limit=args.limit,
+            delete_orphans=args.delete_orphans,
+            delete_missing=args.delete_missing,
+            grace_seconds=args.grace_seconds,
+            prefetch=args.prefetch,
+            reset=args.reset,
+            force=args.force,
+        )
+    return asdict(report)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconcile storage with the images table")
+    parser.add_argument("--limit", type=int, default=None, help="files + rows to examine in this run")
+    parser.add_argument("--delete-orphans", action="store_true", help="delete files no image references")
+    parser.add_argument("--delete-missing", action="store_true", help="delete leaf images whose file is gone")
+    parser.add_argument("--grace-seconds", type=int, default=3600, help="never delete orphans newer than this")
+    parser.add_argument("--prefetch", type=int, default=4, help="directory listings fetched concurrently")
+    parser.add_argument("--reset", action="store_true", help="ignore the checkpoint and start from the top")
+    parser.add_argument("--force", action="store_true", help="delete missing rows even if most rows are missing")
+    args = parser.parse_args()
+
+    # Run from backend/ so relative paths (database, checkpoint, config.toml) resolve as for the API
+    os.chdir(Path(__file__).parent.parent / "backend")
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()